@@ -0,0 +1,87 @@
+"""Compare two benchmarks.run result files and flag regressions.
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+A benchmark regresses when wall time, CPU time or peak RSS grows by more
+than --threshold percent (and by more than the --min-ms / --min-mb noise
+floor), or when the output ratio grows by more than --ratio-threshold
+percent. Exits with status 1 when anything regressed, so CI can gate on it.
+"""
+import argparse
+import json
+import sys
+
+# metric -> (noise-floor argument, unit)
+TIMED_METRICS = {"wall_ms": ("min_ms", "ms"), "cpu_ms": ("min_ms", "ms"), "peak_rss_mb": ("min_mb", "MB")}
+
+
+def load(path):
+    with open(path) as f:
+        document = json.load(f)
+    if document.get("version") != 1:
+        raise SystemExit(f"{path}: unsupported results version {document.get('version')}")
+    return document
+
+
+def percent_change(before, after):
+    if not before:
+        return 0.0 if not after else float("inf")
+    return (after - before) / before * 100
+
+
+def compare(before, after, threshold, ratio_threshold, min_ms, min_mb):
+    """Rows of (benchmark id, metric, before, after, % change, regressed) for benchmarks in both runs"""
+    floors = {"min_ms": min_ms, "min_mb": min_mb}
+    rows = []
+    for name, old in before["results"].items():
+        new = after["results"].get(name)
+        if new is None or "error" in old or "error" in new:
+            continue
+        for metric, (floor, _) in TIMED_METRICS.items():
+            change = percent_change(old[metric], new[metric])
+            regressed = change > threshold and new[metric] - old[metric] > floors[floor]
+            rows.append((name, metric, old[metric], new[metric], change, regressed))
+        change = percent_change(old["ratio"], new["ratio"])
+        rows.append((name, "ratio", old["ratio"], new["ratio"], change, change > ratio_threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10, help="percent growth in time or memory that counts as a regression")
+    parser.add_argument("--ratio-threshold", type=float, default=1, help="percent growth in output/input ratio that counts as a regression")
+    parser.add_argument("--min-ms", type=float, default=5, help="ignore time changes smaller than this")
+    parser.add_argument("--min-mb", type=float, default=5, help="ignore memory changes smaller than this")
+    parser.add_argument("--all", action="store_true", help="print every metric, not just changes beyond the threshold")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    for label, document in (("before", before), ("after", after)):
+        env = document["environment"]
+        print(f"{label}: {document['created']} git {env.get('git')} python {env['python']} "
+              f"pillow {env['pillow']} pymupdf {env['pymupdf']} cpus {env['cpus']}")
+    if before["environment"] != dict(after["environment"], git=before["environment"].get("git")):
+        print("note: environments differ; timings may not be comparable")
+
+    rows = compare(before, after, args.threshold, args.ratio_threshold, args.min_ms, args.min_mb)
+    regressions = [row for row in rows if row[5]]
+    for name, metric, old, new, change, regressed in rows:
+        if args.all or regressed or change < -args.threshold:
+            flag = "REGRESSION" if regressed else ("improved" if change < 0 else "")
+            print(f"{name:60} {metric:12} {old:>12} -> {new:<12} {change:+7.1f}%  {flag}")
+
+    only_before = sorted(set(before["results"]) - set(after["results"]))
+    only_after = sorted(set(after["results"]) - set(before["results"]))
+    failed = sorted(name for name, row in after["results"].items() if "error" in row)
+    for label, names in (("only in before", only_before), ("only in after", only_after), ("failed in after", failed)):
+        if names:
+            print(f"{label}: {', '.join(names)}")
+
+    print(f"{len(regressions)} regression(s) across {len({row[0] for row in rows})} benchmarks")
+    sys.exit(1 if regressions or failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Deterministic benchmark corpus: the same bytes on every run and machine.
+
+Run from backend/ to write the files out for inspection:
+
+    python -m benchmarks.corpus --out /tmp/corpus
+
+Benchmarks call ensure_corpus(), which builds the corpus once into a cache
+directory and rebuilds it when CORPUS_VERSION changes.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import tempfile
+from io import BytesIO
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont
+
+# Bump whenever a generator changes, so cached corpora are rebuilt
+CORPUS_VERSION = 1
+DEFAULT_DIR = os.path.join(tempfile.gettempdir(), "chhotipdf-benchmark-corpus")
+
+WORDS = (
+    "invoice total amount paid balance due account statement period customer reference tax net gross "
+    "quarter revenue growth margin report summary annual budget forecast variance approved pending "
+    "shipment order delivery address contact phone email signature date page section appendix table"
+).split()
+
+
+def noise(width, height, seed, scale=40):
+    """Reproducible grey noise (Image.effect_noise isn't seeded)"""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(128, scale, (height, width)).clip(0, 255).astype(np.uint8)
+    return Image.fromarray(values, "L")
+
+
+def make_photo(width, height, seed=1):
+    """Smooth gradients with texture and edges; compresses like a photo, not like noise"""
+    base = Image.radial_gradient("L").resize((width, height))
+    texture = noise(max(1, width // 4), max(1, height // 4), seed).resize((width, height), Image.Resampling.BICUBIC)
+    image = Image.merge("RGB", (base, texture, ImageChops.invert(base)))
+    draw = ImageDraw.Draw(image)
+    step = max(width, height) // 24
+    for i in range(0, width, step):
+        draw.line([(i, 0), (width - i, height)], fill=(255, (i * seed) % 255, 40), width=max(2, step // 20))
+    return image.filter(ImageFilter.GaussianBlur(1))
+
+
+def make_screenshot(width=1920, height=1080):
+    image = Image.new("RGB", (width, height), (245, 246, 248))
+    draw = ImageDraw.Draw(image)
+    bar = Image.linear_gradient("L").rotate(90).resize((width, 80))
+    image.paste(Image.merge("RGB", (bar, bar, Image.new("L", bar.size, 200))), (0, 0))
+    font = ImageFont.load_default(16)
+    for y in range(100, height - 40, 28):
+        draw.text((40, y), f"Lorem ipsum dolor sit amet, consectetur adipiscing elit {y}", fill=(30, 30, 30), font=font)
+        draw.text((width // 2, y), "Settings  |  Profile  |  Logout", fill=(20, 90, 200), font=font)
+    for x in range(0, width, 300):
+        draw.rounded_rectangle((x + 10, height - 200, x + 280, height - 120), 12, fill=(220, 230, 250), outline=(120, 140, 200))
+    return image
+
+
+def make_logo(size=400):
+    image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((size // 8, size // 8, size * 7 // 8, size * 7 // 8), fill=(230, 60, 40, 255))
+    draw.text((size * 3 // 10, size * 4 // 10), "ACME", fill="white", font=ImageFont.load_default(size // 8))
+    return image
+
+
+def encode(image, image_format, **params):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **params)
+    return buffer.getvalue()
+
+
+def paragraph(rng, words=120):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def pdf_bytes(doc):
+    # Fixed metadata and no fresh /ID, so the same pages give the same bytes
+    doc.set_metadata({"producer": "chhotipdf-benchmarks", "creationDate": "", "modDate": ""})
+    data = doc.tobytes(garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+    return data
+
+
+def text_pdf(pages, seed, words=450):
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 60), f"Section {number + 1}", fontsize=16)
+        page.insert_textbox(fitz.Rect(72, 80, page.rect.width - 72, page.rect.height - 72), paragraph(rng, words), fontsize=10)
+    return pdf_bytes(doc)
+
+
+def image_heavy_pdf(pages=12, seed=2):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=encode(make_photo(2400, 1800, seed + number), "JPEG", quality=92))
+    return pdf_bytes(doc)
+
+
+def scanned_pdf(pages=8, seed=3):
+    """Text pages rendered at 200 dpi with scanner noise and skew, stored as one JPEG per page"""
+    source = fitz.open(stream=text_pdf(pages, seed), filetype="pdf")
+    doc = fitz.open()
+    for number, source_page in enumerate(source):
+        pix = source_page.get_pixmap(dpi=200, colorspace=fitz.csGRAY)
+        scan = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        grain = noise(pix.width, pix.height, seed + number, scale=12)
+        scan = ImageChops.add(scan, grain, offset=-128)  # +-noise around the rendered page
+        scan = scan.rotate(0.4 * (1 if number % 2 else -1), resample=Image.Resampling.BICUBIC, fillcolor=255)
+        page = doc.new_page(width=source_page.rect.width, height=source_page.rect.height)
+        page.insert_image(page.rect, stream=encode(scan.convert("RGB"), "JPEG", quality=85))
+    source.close()
+    return pdf_bytes(doc)
+
+
+def shared_logo_pdf(pages=20, seed=4):
+    """Letterhead pages that all carry the same logo, as separately exported files do"""
+    rng = random.Random(seed)
+    logo = encode(make_logo(), "PNG")
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(page.rect.width - 132, 24, page.rect.width - 36, 120), stream=logo)
+        page.insert_textbox(fitz.Rect(72, 140, page.rect.width - 72, page.rect.height - 72), paragraph(rng, 300), fontsize=10)
+    return pdf_bytes(doc)
+
+
+# name -> builder. Sizes are chosen so the whole corpus builds in under a minute
+CORPUS = {
+    "text_only.pdf": lambda: text_pdf(40, seed=1),
+    "image_heavy.pdf": image_heavy_pdf,
+    "scanned.pdf": scanned_pdf,
+    "shared_logo_a.pdf": lambda: shared_logo_pdf(seed=4),
+    "shared_logo_b.pdf": lambda: shared_logo_pdf(seed=5),
+    "shared_logo_c.pdf": lambda: shared_logo_pdf(seed=6),
+    "pages_1000.pdf": lambda: text_pdf(1000, seed=7, words=60),
+    "huge_photo.jpg": lambda: encode(make_photo(8000, 6000), "JPEG", quality=90),
+    "screenshot.png": lambda: encode(make_screenshot(), "PNG"),
+}
+
+
+def build_corpus(directory, names=None):
+    """Write the corpus files into directory; returns {name: sha256}"""
+    os.makedirs(directory, exist_ok=True)
+    digests = {}
+    for name in names or CORPUS:
+        data = CORPUS[name]()
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+        digests[name] = hashlib.sha256(data).hexdigest()
+        print(f"  {name}: {len(data) // 1024}KB")
+    return digests
+
+
+def ensure_corpus(directory=DEFAULT_DIR):
+    """Build the corpus into directory unless an up-to-date copy is already there"""
+    manifest_path = os.path.join(directory, "manifest.json")
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["version"] == CORPUS_VERSION and all(os.path.isfile(os.path.join(directory, n)) for n in CORPUS):
+            return directory
+    except (OSError, ValueError, KeyError):
+        pass
+    print(f"Building benchmark corpus in {directory}")
+    digests = build_corpus(directory)
+    with open(manifest_path, "w") as f:
+        json.dump({"version": CORPUS_VERSION, "files": digests}, f, indent=2)
+    return directory
+
+
+def read(directory, name):
+    with open(os.path.join(directory, name), "rb") as f:
+        return f.read()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default=DEFAULT_DIR)
+    args = parser.parse_args()
+    ensure_corpus(args.out)
+    with open(os.path.join(args.out, "manifest.json")) as f:
+        print(json.dumps(json.load(f)["files"], indent=2))
@@ -0,0 +1,96 @@
+"""compress_image throughput and peak memory: fast decode vs full-resolution decode.
+
+Run from backend/:
+
+    python -m benchmarks.image_decode --iterations 5
+
+Each (image, mode) pair runs in a fresh process so peak RSS isn't shared
+between runs. Output quality is compared against the full-decode output
+(RMS difference per channel, 0-255).
+"""
+import argparse
+import json
+from io import BytesIO
+
+from PIL import Image, ImageChops, ImageStat
+
+from .corpus import make_photo
+from .measure import run_isolated, time_calls
+
+
+def corpus():
+    photo = make_photo(8000, 6000)  # 48 MP phone photo
+    jpeg = BytesIO()
+    photo.save(jpeg, format="JPEG", quality=90)
+    cutout = make_photo(4000, 3000).convert("RGBA")
+    cutout.putalpha(Image.radial_gradient("L").resize(cutout.size))
+    png = BytesIO()
+    cutout.save(png, format="PNG", compress_level=1)
+    return {"photo_48mp.jpg": jpeg.getvalue(), "cutout_12mp.png": png.getvalue()}
+
+
+def _run(name, data, level, fast_decode, iterations):
+    from compress.image_compressor import compress_image
+    from compress.lanes import BufferedUpload
+
+    measurement = time_calls(
+        lambda: compress_image(BufferedUpload(name, data), compression_level=level, inline=True, fast_decode=fast_decode),
+        iterations,
+    )
+    measurement["output"] = measurement.pop("result")["data"]
+    return measurement
+
+
+def measure(name, data, level, fast_decode, iterations):
+    return run_isolated(_run, name, data, level, fast_decode, iterations)
+
+
+def rms_difference(a, b):
+    image_a, image_b = Image.open(BytesIO(a)).convert("RGB"), Image.open(BytesIO(b)).convert("RGB")
+    if image_a.size != image_b.size:
+        image_b = image_b.resize(image_a.size)
+    return round(sum(ImageStat.Stat(ImageChops.difference(image_a, image_b)).rms) / 3, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--levels", default="light,medium,heavy")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for name, data in corpus().items():
+        megapixels = Image.open(BytesIO(data)).size
+        megapixels = megapixels[0] * megapixels[1] / 1e6
+        for level in args.levels.split(","):
+            full = measure(name, data, level, False, args.iterations)
+            fast = measure(name, data, level, True, args.iterations)
+            row = {
+                "image": name,
+                "level": level,
+                "full_ms": round(full["wall_s"] * 1000, 1),
+                "fast_ms": round(fast["wall_s"] * 1000, 1),
+                "speedup": round(full["wall_s"] / fast["wall_s"], 2),
+                "full_mp_per_s": round(megapixels / full["wall_s"], 1),
+                "fast_mp_per_s": round(megapixels / fast["wall_s"], 1),
+                "full_cpu_ms": round(full["cpu_s"] * 1000, 1),
+                "fast_cpu_ms": round(fast["cpu_s"] * 1000, 1),
+                "full_peak_rss_mb": full["peak_rss_mb"],
+                "fast_peak_rss_mb": fast["peak_rss_mb"],
+                "full_bytes": len(full["output"]),
+                "fast_bytes": len(fast["output"]),
+                "rms_diff": rms_difference(full["output"], fast["output"]),
+            }
+            results.append(row)
+            print(f"{name:16} {level:6} full {row['full_ms']:8.1f}ms {row['full_peak_rss_mb']:7.1f}MB | "
+                  f"fast {row['fast_ms']:8.1f}ms {row['fast_peak_rss_mb']:7.1f}MB | "
+                  f"x{row['speedup']:<5} rms diff {row['rms_diff']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
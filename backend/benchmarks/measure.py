@@ -0,0 +1,69 @@
+"""Timing and peak-memory measurement in a fresh process per benchmark"""
+import asyncio
+import inspect
+import multiprocessing
+import queue as queue_module
+import time
+
+from compress.metrics import peak_rss_bytes, reset_peak_rss
+
+
+def peak_rss_mb():
+    return peak_rss_bytes() / 1024 / 1024
+
+
+def time_calls(call, iterations):
+    """Run call() iterations times (awaiting it if it returns a coroutine).
+
+    Returns min/median wall and CPU seconds, the peak RSS growth over the
+    process's footprint before the first call, and the last return value.
+    """
+    reset_peak_rss()
+    baseline_rss = peak_rss_mb()
+    walls, cpus = [], []
+    result = None
+    for _ in range(iterations):
+        started, cpu_started = time.perf_counter(), time.process_time()
+        result = call()
+        if inspect.isawaitable(result):
+            result = asyncio.run(result)
+        walls.append(time.perf_counter() - started)
+        cpus.append(time.process_time() - cpu_started)
+    walls.sort()
+    cpus.sort()
+    return {
+        "wall_s": walls[0],
+        "wall_median_s": walls[len(walls) // 2],
+        "cpu_s": cpus[0],
+        "peak_rss_mb": round(peak_rss_mb() - baseline_rss, 1),
+        "result": result,
+    }
+
+
+def _child(target, args, queue):
+    try:
+        queue.put(("ok", target(*args)))
+    except BaseException as e:
+        queue.put(("error", f"{type(e).__name__}: {e}"))
+
+
+def run_isolated(target, *args):
+    """target(*args) in a fresh spawned process, so peak RSS isn't shared between benchmarks.
+
+    target must be importable (module level) and return something picklable.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(target, args, queue))
+    process.start()
+    while True:
+        try:
+            status, value = queue.get(timeout=1)
+            break
+        except queue_module.Empty:
+            if not process.is_alive() and queue.empty():
+                raise Exception(f"Benchmark process died (exit code {process.exitcode})")
+    process.join()
+    if status == "error":
+        raise Exception(value)
+    return value
@@ -0,0 +1,176 @@
+"""Per-function benchmarks over the synthetic corpus, written as JSON.
+
+Run from backend/:
+
+    python -m benchmarks.run --out before.json
+    # ... change something ...
+    python -m benchmarks.run --out after.json
+    python -m benchmarks.compare before.json after.json
+
+Each benchmark runs in a fresh process: wall and CPU time (min and median
+over --iterations), peak RSS growth, and the output/input size ratio.
+Operations run with inline=True, so nothing is written to artifact storage.
+For previews, the output is the JSON payload sent to the browser.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import subprocess
+import time
+
+from .corpus import CORPUS_VERSION, DEFAULT_DIR, ensure_corpus, read
+from .measure import run_isolated, time_calls
+
+RESULTS_VERSION = 1
+
+# (function, corpus inputs, keyword arguments)
+BENCHMARKS = [
+    ("compress_pdf", ["text_only.pdf"], {"compression_level": "medium"}),
+    ("compress_pdf", ["image_heavy.pdf"], {"compression_level": "medium"}),
+    ("compress_pdf", ["image_heavy.pdf"], {"compression_level": "heavy"}),
+    ("compress_pdf", ["scanned.pdf"], {"compression_level": "medium"}),
+    ("compress_pdf", ["scanned.pdf"], {"compression_level": "heavy"}),
+    ("compress_pdf", ["shared_logo_a.pdf"], {"compression_level": "medium"}),
+    ("compress_pdf", ["pages_1000.pdf"], {"compression_level": "medium"}),
+    ("compress_image", ["huge_photo.jpg"], {"compression_level": "medium"}),
+    ("compress_image", ["huge_photo.jpg"], {"compression_level": "medium", "output_format": "webp"}),
+    ("compress_image", ["screenshot.png"], {"compression_level": "medium"}),
+    ("compress_image_variants", ["huge_photo.jpg"], {"variants": "2048,1600,1200,640"}),
+    ("compress_image_variants", ["huge_photo.jpg"], {"variants": "2048,1600,1200,640", "output_format": "webp"}),
+    ("merge_pdfs", ["shared_logo_a.pdf", "shared_logo_b.pdf", "shared_logo_c.pdf"], {}),
+    ("merge_pdfs", ["text_only.pdf", "image_heavy.pdf", "scanned.pdf"], {}),
+    ("get_pdf_pages", ["text_only.pdf"], {}),
+    ("get_pdf_pages", ["pages_1000.pdf"], {}),
+    ("get_pdf_organization_preview", ["text_only.pdf"], {}),
+    ("get_pdf_organization_preview", ["pages_1000.pdf"], {}),
+]
+
+
+def benchmark_id(function, inputs, kwargs):
+    """Stable name used to match results across runs, e.g. compress_pdf/scanned.pdf/heavy"""
+    parts = [function, "+".join(inputs)] + [str(value) for value in kwargs.values()]
+    return "/".join(parts)
+
+
+def _operation(function):
+    from compress.admission import parallel_workers
+    from compress.image_compressor import compress_image, compress_image_variants, parse_variants
+    from compress.pdf_compressor import compress_pdf
+    from compress.pdf_merger import merge_pdfs
+    from compress.pdf_organizer import get_pdf_organization_preview
+    from compress.pdf_splitter import get_pdf_pages
+
+    operations = {
+        "compress_pdf": lambda uploads, **kw: compress_pdf(uploads[0], inline=True, **kw),
+        "compress_image": lambda uploads, **kw: compress_image(uploads[0], inline=True, **kw),
+        "compress_image_variants": lambda uploads, variants, **kw: compress_image_variants(
+            uploads[0], parse_variants(variants, **kw), inline=True,
+            max_workers=parallel_workers("compress_image_variants")
+        ),
+        "merge_pdfs": lambda uploads, **kw: merge_pdfs(uploads, inline=True, **kw),
+        "get_pdf_pages": lambda uploads, **kw: get_pdf_pages(uploads[0], **kw),
+        "get_pdf_organization_preview": lambda uploads, **kw: get_pdf_organization_preview(uploads[0], **kw),
+    }
+    return operations[function]
+
+
+def _run_benchmark(function, inputs, kwargs, corpus_dir, iterations):
+    from compress.lanes import BufferedUpload
+
+    operation = _operation(function)
+    sources = [(name, read(corpus_dir, name)) for name in inputs]
+    input_bytes = sum(len(data) for _, data in sources)
+    # Uploads are consumed by reading, so each call gets fresh ones
+    measurement = time_calls(lambda: operation([BufferedUpload(name, data) for name, data in sources], **kwargs), iterations)
+    result = measurement.pop("result")
+    if isinstance(result, dict) and "data" in result:
+        output_bytes = len(result["data"])
+    else:
+        output_bytes = len(json.dumps(result))
+    return dict(measurement, input_bytes=input_bytes, output_bytes=output_bytes)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import fitz
+    import PIL
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pillow": PIL.__version__,
+        "pymupdf": fitz.VersionBind,
+        "git": git_revision(),
+        "corpus_version": CORPUS_VERSION,
+    }
+
+
+def run(patterns, iterations, corpus_dir):
+    results = {}
+    for function, inputs, kwargs in BENCHMARKS:
+        name = benchmark_id(function, inputs, kwargs)
+        if patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            continue
+        try:
+            measured = run_isolated(_run_benchmark, function, inputs, kwargs, corpus_dir, iterations)
+        except Exception as e:
+            print(f"{name:60} FAILED: {e}")
+            results[name] = {"error": str(e)}
+            continue
+        row = {
+            "wall_ms": round(measured["wall_s"] * 1000, 1),
+            "wall_median_ms": round(measured["wall_median_s"] * 1000, 1),
+            "cpu_ms": round(measured["cpu_s"] * 1000, 1),
+            "peak_rss_mb": measured["peak_rss_mb"],
+            "input_bytes": measured["input_bytes"],
+            "output_bytes": measured["output_bytes"],
+            "ratio": round(measured["output_bytes"] / measured["input_bytes"], 4),
+        }
+        results[name] = row
+        print(f"{name:60} {row['wall_ms']:9.1f}ms wall {row['cpu_ms']:9.1f}ms cpu "
+              f"{row['peak_rss_mb']:7.1f}MB rss  ratio {row['ratio']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--filter", action="append", default=[],
+                        help="only benchmarks whose id matches this glob (e.g. 'compress_pdf/*'); repeatable")
+    parser.add_argument("--corpus-dir", default=DEFAULT_DIR)
+    parser.add_argument("--list", action="store_true", help="print benchmark ids and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for function, inputs, kwargs in BENCHMARKS:
+            print(benchmark_id(function, inputs, kwargs))
+        return
+
+    corpus_dir = ensure_corpus(args.corpus_dir)
+    started = time.time()
+    results = run(args.filter, args.iterations, corpus_dir)
+    document = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(started)),
+        "iterations": args.iterations,
+        "environment": environment(),
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Cold-start benchmark: import time and time to the first successful request.
+
+Run from backend/:
+
+    python -m benchmarks.startup --out startup.json
+    python -m benchmarks.startup --repeats 5 --request compress_pdf
+
+Import time is `import main` in a fresh interpreter (median of --repeats),
+along with which heavy libraries that import pulled in. Then, for each
+request type a fresh uvicorn server is started and the request is retried
+until it succeeds, in three modes:
+- cold: warm-up off (CHHOTIPDF_WARMUP=0), modules load on first use
+- warmup: warm-up on, request sent as soon as the server accepts connections
+- ready: warm-up on, request sent once GET /ready returns 200 (what a
+  deployment that gates traffic on the readiness probe sees)
+"first_ok_ms" is from launching the server process to the first 2xx,
+"request_ms" the latency of that successful request alone and "ready_ms"
+the time until /ready returned 200.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from .corpus import ensure_corpus, read
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("fitz", "PIL.Image", "numpy")
+IMPORT_SNIPPET = (
+    "import sys, time, json; started = time.perf_counter(); import main; "
+    "print(json.dumps([time.perf_counter() - started, [m for m in %r if m in sys.modules]]))" % (HEAVY_MODULES,)
+)
+
+# name: (path, corpus file field and name, form data)
+REQUESTS = {
+    "root": ("/", None, None),
+    "split_preview": ("/split/pdf/preview", ("file", "text_only.pdf"), None),
+    "compress_pdf": ("/compress/pdf", ("file", "text_only.pdf"), {"compression_level": "medium", "inline": "true"}),
+    "compress_image": ("/compress/image", ("file", "screenshot.png"), {"compression_level": "medium", "inline": "true"}),
+}
+CONTENT_TYPES = {".pdf": "application/pdf", ".png": "image/png"}
+MODES = ("cold", "warmup", "ready")
+TIMEOUT_SECONDS = 120
+
+
+def measure_import(repeats):
+    seconds, loaded = [], []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+        elapsed, loaded = json.loads(output.stdout.strip().splitlines()[-1])
+        seconds.append(elapsed)
+    return {"median_ms": round(statistics.median(seconds) * 1000, 1), "min_ms": round(min(seconds) * 1000, 1),
+            "heavy_modules_loaded": loaded}
+
+
+def _request(client, name, uploads):
+    path, upload, data = REQUESTS[name]
+    if upload is None:
+        return client.get(path)
+    field, filename = upload
+    content_type = CONTENT_TYPES[os.path.splitext(filename)[1]]
+    return client.post(path, files={field: (filename, uploads[filename], content_type)}, data=data)
+
+
+def measure_first_request(name, mode, port, uploads):
+    """Launch a server, retry the request until it returns 2xx; returns timings in ms"""
+    env = dict(os.environ, CHHOTIPDF_WARMUP="0" if mode == "cold" else "1")
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    launched = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    deadline = launched + TIMEOUT_SECONDS
+    result = {}
+
+    def until_ok(send):
+        while True:
+            if time.perf_counter() > deadline or process.poll() is not None:
+                raise SystemExit(f"{name}/{mode}: no successful response (server exit code {process.poll()})")
+            sent = time.perf_counter()
+            try:
+                response = send()
+            except httpx.TransportError:
+                response = None
+            if response is not None and 200 <= response.status_code < 300:
+                return sent
+            time.sleep(0.02)
+
+    def wait_ready(client):
+        until_ok(lambda: client.get("/ready"))
+        result["ready_ms"] = round((time.perf_counter() - launched) * 1000, 1)
+
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=TIMEOUT_SECONDS) as client:
+            if mode == "ready":
+                wait_ready(client)
+            sent = until_ok(lambda: _request(client, name, uploads))
+            result["first_ok_ms"] = round((time.perf_counter() - launched) * 1000, 1)
+            result["request_ms"] = round((time.perf_counter() - sent) * 1000, 1)
+            if mode == "warmup":
+                wait_ready(client)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+
+def median_of(runs):
+    return {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+
+
+def main():
+    from loadtest.run import free_port
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=3, help="runs per measurement (median is reported)")
+    parser.add_argument("--request", action="append", choices=list(REQUESTS), help="request types to measure; repeatable (default: all)")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    corpus_dir = ensure_corpus()
+    uploads = {upload[1]: read(corpus_dir, upload[1]) for _, upload, _ in REQUESTS.values() if upload}
+
+    results = {"import_main": measure_import(args.repeats), "first_request": {}}
+    print(f"import main: median {results['import_main']['median_ms']} ms, "
+          f"heavy modules loaded: {results['import_main']['heavy_modules_loaded'] or 'none'}")
+    print(f"{'request':16} {'mode':8} {'first 2xx':>11} {'request':>10} {'ready':>10}")
+    for name in args.request or list(REQUESTS):
+        for mode in MODES:
+            timings = median_of([measure_first_request(name, mode, free_port(), uploads) for _ in range(args.repeats)])
+            results["first_request"][f"{name}/{mode}"] = timings
+            ready = f"{timings['ready_ms']:8.1f}ms" if "ready_ms" in timings else f"{'-':>10}"
+            print(f"{name:16} {mode:8} {timings['first_ok_ms']:9.1f}ms {timings['request_ms']:8.1f}ms {ready}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from .lanes import OPERATION_LANES
+from .metrics import ADMISSION_IN_USE, ADMISSION_QUEUED, ADMISSION_REJECTED
+
+# Global budget, configurable per deployment (e.g. Cloud Run memory / CPU limits)
+MEMORY_BUDGET_MB = float(os.environ.get("CHHOTIPDF_MEMORY_BUDGET_MB", "1024"))
+CPU_SLOTS = int(os.environ.get("CHHOTIPDF_CPU_SLOTS", str(os.cpu_count() or 1)))
+QUEUE_TIMEOUT_SECONDS = float(os.environ.get("CHHOTIPDF_ADMISSION_QUEUE_SECONDS", "5"))
+
+# Fixed per-request overhead plus a multiple of the upload size. Multipliers are
+# rough peak-memory ratios: decoded images and rasterized pages are far larger
+# than the compressed bytes that were uploaded.
+BASE_COST_BYTES = 16 * 1024 * 1024
+MEMORY_MULTIPLIERS = {
+    "compress_pdf": {"light": 4, "medium": 6, "heavy": 8},
+    "compress_image": 20,
+    "compress_image_variants": 24,
+    "merge_pdf": 4,  # includes the copy dedup serializes to measure its saving
+    "split_preview": 4,
+    "split_pdf": 3,
+    "split_pdf_multi": 4,
+    "organize_preview": 4,
+    "organize_pdf": 3,
+    "pipeline_pdf": 8,
+    "search_pdf": 3,
+}
+# Operations that fan their work out over several worker processes hold one
+# CPU slot per worker (capped at CPU_SLOTS), and each extra worker keeps its
+# own copy of the upload plus the output it is building
+PARALLEL_WORKERS = {
+    "split_pdf_multi": int(os.environ.get("CHHOTIPDF_SPLIT_WORKERS", "4")),
+    "compress_image_variants": int(os.environ.get("CHHOTIPDF_VARIANT_WORKERS", "4")),
+}
+PARALLEL_WORKER_MULTIPLIER = 2
+# Image decodes are held to IMAGE_MEMORY_MB however large the upload (see
+# image_budget), so these never cost more than that plus a few upload copies
+IMAGE_OPERATIONS = ("compress_image", "compress_image_variants")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted within the queue timeout"""
+
+    def __init__(self, operation, retry_after):
+        super().__init__(f"Server is busy, please retry in {retry_after} seconds")
+        self.operation = operation
+        self.retry_after = retry_after
+
+
+def parallel_workers(operation):
+    """Worker processes an operation may fan out to; admission charges it a CPU slot for each"""
+    return max(1, min(PARALLEL_WORKERS.get(operation, 1), CPU_SLOTS))
+
+
+def estimate_cost(operation, content_length, level=None):
+    """Estimated peak memory (bytes) and CPU slots for one request.
+
+    Interactive operations take no CPU slot: they are short, and the
+    interactive lane's worker count already bounds them.
+    """
+    multiplier = MEMORY_MULTIPLIERS.get(operation, 4)
+    if isinstance(multiplier, dict):
+        multiplier = multiplier.get(level or "medium", max(multiplier.values()))
+    workers = parallel_workers(operation)
+    multiplier += PARALLEL_WORKER_MULTIPLIER * (workers - 1)
+    cpu = 0 if OPERATION_LANES.get(operation) == "interactive" else workers
+    memory = int(content_length or 0) * multiplier
+    if operation in IMAGE_OPERATIONS:
+        from .image_budget import IMAGE_MEMORY_MB  # imports Pillow, so only once an image request arrives
+        memory = min(memory, int(content_length or 0) * 3 + int(IMAGE_MEMORY_MB * 1024 * 1024))
+    return BASE_COST_BYTES + memory, cpu
+
+
+class AdmissionController:
+    """Admits work against a global memory and CPU budget.
+
+    Requests that don't fit wait for up to queue_timeout seconds, then are
+    rejected with a Retry-After estimate. Waiters are admitted in arrival
+    order within their lane, so a queued bulk job never holds up interactive
+    work. A request larger than the whole budget is admitted only when
+    nothing else is running. Memory that caches hold between requests (see
+    hold_for) counts against the budget too, and is reclaimed before a
+    request has to wait for it.
+    """
+
+    def __init__(self, memory_budget_bytes, cpu_slots, queue_timeout):
+        self.memory_budget = memory_budget_bytes
+        self.cpu_slots = cpu_slots
+        self.queue_timeout = queue_timeout
+        self.memory_in_use = 0
+        self.cpu_in_use = 0
+        self.active = 0
+        self.rejected = 0
+        self._waiters = []  # (future, memory, cpu, lane) in arrival order
+        self._avg_hold_seconds = 1.0
+        self._holders = []
+
+    def hold_for(self, holder):
+        """Count a cache's memory (holder.total_bytes) against the budget.
+
+        holder.reclaim(nbytes) is asked to free memory whenever that would let
+        a request in; cached bytes never make a request wait.
+        """
+        self._holders.append(holder)
+
+    def held_bytes(self):
+        return sum(holder.total_bytes for holder in self._holders)
+
+    def _fits(self, memory, cpu):
+        if self.active == 0:
+            return True
+        if self.cpu_in_use + cpu > self.cpu_slots:
+            return False
+        over = self.memory_in_use + self.held_bytes() + memory - self.memory_budget
+        for holder in self._holders:
+            if over <= 0 or self.memory_in_use + memory > self.memory_budget:
+                break
+            over -= holder.reclaim(over)
+        return over <= 0
+
+    def _take(self, memory, cpu):
+        self.memory_in_use += memory
+        self.cpu_in_use += cpu
+        self.active += 1
+        ADMISSION_IN_USE.labels("memory_bytes").set(self.memory_in_use)
+        ADMISSION_IN_USE.labels("cpu_slots").set(self.cpu_in_use)
+
+    def _wake(self):
+        # Admit in arrival order per lane so large requests aren't starved by
+        # smaller ones of the same lane arriving later
+        blocked_lanes = set()
+        waiting = []
+        for future, memory, cpu, lane in self._waiters:
+            if future.done():
+                continue
+            if lane in blocked_lanes or not self._fits(memory, cpu):
+                blocked_lanes.add(lane)
+                waiting.append((future, memory, cpu, lane))
+                continue
+            self._take(memory, cpu)
+            future.set_result(True)
+        self._waiters = waiting
+        ADMISSION_QUEUED.set(len(self._waiters))
+
+    def retry_after(self):
+        """Seconds a rejected client should wait, from queue depth and recent hold times"""
+        ahead = len(self._waiters) + 1
+        return max(1, math.ceil(self._avg_hold_seconds * ahead / max(self.cpu_slots, 1)))
+
+    async def acquire(self, operation, memory, cpu):
+        lane = OPERATION_LANES.get(operation, "bulk")
+        if not any(w[3] == lane for w in self._waiters) and self._fits(memory, cpu):
+            self._take(memory, cpu)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((future, memory, cpu, lane))
+        ADMISSION_QUEUED.set(len(self._waiters))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                return  # admitted just as the timeout fired
+            future.cancel()
+            self._wake()
+            self.rejected += 1
+            ADMISSION_REJECTED.labels(operation).inc()
+            raise AdmissionRejected(operation, self.retry_after())
+        except asyncio.CancelledError:
+            # Client went away while queued; give back a slot granted in the meantime
+            if future.done() and not future.cancelled():
+                self.release(memory, cpu, 0)
+            else:
+                future.cancel()
+                self._wake()
+            raise
+
+    def release(self, memory, cpu, held_seconds):
+        self.memory_in_use -= memory
+        self.cpu_in_use -= cpu
+        self.active -= 1
+        self._avg_hold_seconds = 0.8 * self._avg_hold_seconds + 0.2 * held_seconds
+        ADMISSION_IN_USE.labels("memory_bytes").set(self.memory_in_use)
+        ADMISSION_IN_USE.labels("cpu_slots").set(self.cpu_in_use)
+        self._wake()
+
+    def state(self):
+        """Budget usage, for autoscaling decisions"""
+        return {
+            "memoryBudgetBytes": self.memory_budget,
+            "memoryInUseBytes": self.memory_in_use,
+            "memoryHeldBytes": self.held_bytes(),
+            "memoryUtilization": round(self.memory_in_use / self.memory_budget, 3) if self.memory_budget else 0,
+            "cpuSlots": self.cpu_slots,
+            "cpuInUse": self.cpu_in_use,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "rejectedTotal": self.rejected,
+            "queueTimeoutSeconds": self.queue_timeout,
+            "retryAfterSeconds": self.retry_after(),
+        }
+
+
+admission_controller = AdmissionController(int(MEMORY_BUDGET_MB * 1024 * 1024), CPU_SLOTS, QUEUE_TIMEOUT_SECONDS)
+
+
+@asynccontextmanager
+async def admit(operation, content_length, level=None, controller=None):
+    """Hold an admission slot for one operation; raises AdmissionRejected when overloaded"""
+    controller = controller or admission_controller
+    memory, cpu = estimate_cost(operation, content_length, level)
+    await controller.acquire(operation, memory, cpu)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        controller.release(memory, cpu, time.perf_counter() - started)
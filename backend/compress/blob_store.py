@@ -0,0 +1,211 @@
+"""Recent uploads kept by content hash, so a re-submitted file needn't be sent again.
+
+Opt-in and per client: POST /blobs/check issues a blob session, and only
+uploads sent with that blob_session are kept, in the server process, until
+they are evicted by age, by the size bound or to make room for admitted
+work. Clients check the SHA-256 and size of their files first; for files
+their session still holds, the operation is sent with blob_id (or
+blob_ids) instead of the file. A session only sees its own uploads, so the
+check doesn't reveal what other clients have sent.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from .admission import admission_controller
+from .lanes import BufferedUpload, buffer_upload
+from .metrics import record_cache
+
+BLOB_STORE_MB = float(os.environ.get("CHHOTIPDF_BLOB_STORE_MB", "256"))
+BLOB_TTL_SECONDS = float(os.environ.get("CHHOTIPDF_BLOB_TTL_SECONDS", "900"))
+BLOB_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+BLOB_SESSION_PATTERN = re.compile(r"^[A-Za-z0-9_-]{22,64}$")
+# Placeholder in blob_ids for the next uploaded file
+UPLOADED_FILE = "file"
+MAX_CHECK_BLOBS = 50
+
+
+class BlobNotFound(LookupError):
+    """The referenced upload isn't held (never sent here, evicted, or sent to another instance)"""
+
+
+class InvalidBlobReference(ValueError):
+    """A malformed blob_id/blob_ids/blob_session, or neither a file nor a blob reference"""
+
+
+class BlobStore:
+    """Bounded LRU of upload bytes keyed by blob session and SHA-256, with TTL eviction"""
+
+    def __init__(self, max_bytes, ttl_seconds):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # (session, sha256) -> (last_used, filename, data)
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        expired = [k for k, (used, _, _) in self._entries.items() if now - used > self.ttl_seconds]
+        for key in expired:
+            self.total_bytes -= len(self._entries.pop(key)[2])
+        while self.total_bytes > self.max_bytes:
+            self.total_bytes -= len(self._entries.popitem(last=False)[1][2])
+
+    def _touch(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries[key] = (now, entry[1], entry[2])
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, session, blob_id, filename, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            now = time.time()
+            if self._touch((session, blob_id), now) is None:
+                self._entries[(session, blob_id)] = (now, filename, data)
+                self.total_bytes += len(data)
+            self._evict(now)
+
+    def get(self, session, blob_id):
+        """(filename, data) of an upload the session holds, or None"""
+        with self._lock:
+            now = time.time()
+            self._evict(now)
+            entry = self._touch((session, blob_id), now)
+            return None if entry is None else entry[1:]
+
+    def contains(self, session, blob_id, size):
+        """Whether the session holds the upload, refreshing it so it survives until the operation arrives"""
+        with self._lock:
+            now = time.time()
+            self._evict(now)
+            entry = self._entries.get((session, blob_id))
+            if entry is None or len(entry[2]) != size:
+                return False
+            self._touch((session, blob_id), now)
+            return True
+
+    def size(self, session, blob_id):
+        with self._lock:
+            entry = self._entries.get((session, blob_id))
+            return None if entry is None else len(entry[2])
+
+    def reclaim(self, nbytes):
+        """Evict least-recently-used uploads until nbytes are freed (or none are left); returns bytes freed"""
+        freed = 0
+        with self._lock:
+            while freed < nbytes and self._entries:
+                freed += len(self._entries.popitem(last=False)[1][2])
+            self.total_bytes -= freed
+        return freed
+
+    def state(self):
+        with self._lock:
+            return {"blobs": len(self._entries), "bytes": self.total_bytes, "maxBytes": self.max_bytes, "ttlSeconds": self.ttl_seconds}
+
+
+blob_store = BlobStore(int(BLOB_STORE_MB * 1024 * 1024), BLOB_TTL_SECONDS)
+# Held uploads count against the admission memory budget, and give way to admitted work
+admission_controller.hold_for(blob_store)
+
+
+def valid_blob_id(blob_id):
+    return BLOB_ID_PATTERN.match(blob_id or "") is not None
+
+
+def new_blob_session():
+    return secrets.token_urlsafe(24)
+
+
+def valid_blob_session(session):
+    return BLOB_SESSION_PATTERN.match(session or "") is not None
+
+
+def _session(session):
+    """The request's blob session, or None when it didn't opt in"""
+    if not session:
+        return None
+    if not valid_blob_session(session):
+        raise InvalidBlobReference("blob_session must be the session returned by /blobs/check")
+    return session
+
+
+def parse_blob_ids(blob_ids):
+    """Entries of a comma-separated blob_ids field: SHA-256s, or "file" for the next uploaded file"""
+    entries = [entry.strip().lower() for entry in (blob_ids or "").split(",") if entry.strip()]
+    for entry in entries:
+        if entry != UPLOADED_FILE and not valid_blob_id(entry):
+            raise InvalidBlobReference(f"blob_ids entry '{entry}' is not a SHA-256 (64 hex characters) or '{UPLOADED_FILE}'")
+    return entries
+
+
+def referenced_bytes(session, blob_id=None, blob_ids=None):
+    """Size of the held uploads a request refers to, for admission (the request body doesn't include them)"""
+    if not valid_blob_session(session):
+        return 0
+    entries = [blob_id or ""] + (blob_ids or "").split(",")
+    return sum(blob_store.size(session, entry.strip().lower()) or 0 for entry in entries if entry.strip())
+
+
+async def _buffer(upload, session):
+    """Read an upload; kept for later requests only when it came with a blob session"""
+    upload = await buffer_upload(upload)
+    if session is not None:
+        # hashlib releases the GIL on large buffers; hashing a big upload shouldn't stall the event loop
+        digest = await asyncio.to_thread(lambda: hashlib.sha256(upload.data).hexdigest())
+        blob_store.put(session, digest, upload.filename, upload.data)
+    return upload
+
+
+def _held(session, blob_id):
+    if session is None:
+        raise InvalidBlobReference("blob_id needs the blob_session it was uploaded with")
+    entry = blob_store.get(session, blob_id)
+    record_cache("blob_store", entry is not None)
+    if entry is None:
+        raise BlobNotFound(f"Upload {blob_id} is no longer held by the server; send the file instead")
+    return BufferedUpload(*entry)
+
+
+async def resolve_upload(upload, blob_id=None, session=None, required=True):
+    """The operation's input: the uploaded file (kept for next time with a blob session), or the held upload blob_id names.
+
+    Raises InvalidBlobReference for a malformed blob_id or blob_session (or
+    neither input, when required) and BlobNotFound when the session doesn't
+    hold the upload.
+    """
+    session = _session(session)
+    if upload is not None:
+        return await _buffer(upload, session)
+    if not blob_id:
+        if required:
+            raise InvalidBlobReference("Send the file, or the blob_id of a file the server holds")
+        return None
+    blob_id = blob_id.strip().lower()
+    if not valid_blob_id(blob_id):
+        raise InvalidBlobReference("blob_id must be a SHA-256 (64 hex characters)")
+    return _held(session, blob_id)
+
+
+async def resolve_uploads(uploads, blob_ids=None, session=None):
+    """Inputs of a multi-file operation, in order.
+
+    Without blob_ids these are the uploaded files. Otherwise each blob_ids
+    entry is a held upload's SHA-256, or "file" for the next uploaded file
+    (so only the files the server lacks are sent).
+    """
+    session = _session(session)
+    uploads = list(uploads or [])
+    entries = parse_blob_ids(blob_ids)
+    if not entries:
+        return [await _buffer(upload, session) for upload in uploads]
+    if entries.count(UPLOADED_FILE) != len(uploads):
+        raise InvalidBlobReference(f"blob_ids has {entries.count(UPLOADED_FILE)} '{UPLOADED_FILE}' entries for {len(uploads)} uploaded files")
+    pending = iter(uploads)
+    return [await _buffer(next(pending), session) if entry == UPLOADED_FILE else _held(session, entry) for entry in entries]
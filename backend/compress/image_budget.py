@@ -0,0 +1,167 @@
+"""Pixel and memory limits for decoding uploaded images.
+
+A decoded image costs up to 4 bytes per pixel however small the upload is:
+a 20000x20000 TIFF takes 1.6 GB before any resizing. Dimensions are checked
+from the header before anything is decoded, and images whose full decode
+wouldn't fit the memory budget are decoded at reduced resolution instead.
+"""
+import math
+import os
+import warnings
+from io import BytesIO
+from PIL import Image
+
+# Largest image accepted at all, checked from the header. Pillow's own
+# DecompressionBombError (at twice Image.MAX_IMAGE_PIXELS, which is left at
+# its default) still applies, so raising this past that has no effect
+MAX_IMAGE_PIXELS = int(os.environ.get("CHHOTIPDF_MAX_IMAGE_PIXELS", str(2 * Image.MAX_IMAGE_PIXELS)))
+# Memory one image decode may use (decoded pixels plus working copies)
+IMAGE_MEMORY_MB = float(os.environ.get("CHHOTIPDF_IMAGE_MEMORY_MB", "512"))
+# Pixels are read this much at a time on the strip path
+STRIP_BYTES = 16 * 1024 * 1024
+# Converting to RGB/RGBA (and flattening alpha onto white) after decoding adds
+# roughly one 4-byte copy plus an alpha mask per pixel
+CONVERT_BYTES_PER_PIXEL = 5
+# Modes Image.reduce() handles; others are converted first
+REDUCIBLE_MODES = ("L", "LA", "PA", "RGB", "RGBA", "CMYK", "YCbCr", "I", "F")
+
+
+class ImageTooLarge(ValueError):
+    """The image's dimensions or decode size are over the configured limits"""
+
+
+def bytes_per_pixel(mode):
+    # Pillow stores 1/L/P in one byte per pixel, I;16 in two, everything else (RGB too) in four
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+
+def open_image(data):
+    """Image.open on uploaded bytes, rejecting oversized images from the header alone.
+
+    Image.open only parses the header; the size check runs before any pixels
+    are decoded.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            image = Image.open(BytesIO(data))
+    except Image.DecompressionBombError:
+        raise ImageTooLarge(f"Image is larger than the {MAX_IMAGE_PIXELS / 1e6:.0f} MP limit")
+    width, height = image.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(
+            f"Image is {width}x{height} ({width * height / 1e6:.0f} MP), larger than the {MAX_IMAGE_PIXELS / 1e6:.0f} MP limit"
+        )
+    return image
+
+
+def check_image_upload(data):
+    """Header-only size check for endpoints, before the upload is queued.
+
+    Raises ImageTooLarge; anything Pillow can't identify is left for the
+    operation itself to report.
+    """
+    try:
+        open_image(data)
+    except ImageTooLarge:
+        raise
+    except Exception:
+        pass
+
+
+def load_within_budget(image, target, fast_decode=True, reducing_gap=2.0):
+    """Decode image for an output of at most target (width, height) pixels.
+
+    Returns (image, decode path):
+    - "full": decoded as is
+    - "draft": JPEG decoded at 1/2, 1/4 or 1/8 scale (fast_decode)
+    - "strips": uncompressed pixels (TIFF, BMP, PPM...) read a band of rows at a
+      time, each band reduced as it's read, so the full image never exists
+    - "reduced": decoded in its own mode and immediately reduced by an integer
+      factor, before any mode conversion multiplies it
+    Reduced images stay at least reducing_gap x target. Raises ImageTooLarge
+    when even the reduced path would need more than IMAGE_MEMORY_MB.
+    """
+    budget = IMAGE_MEMORY_MB * 1024 * 1024
+    source_size = image.size
+    if fast_decode and target != image.size:
+        image.draft(image.mode, target)
+    width, height = image.size
+    pixels = width * height
+    if pixels * (bytes_per_pixel(image.mode) + CONVERT_BYTES_PER_PIXEL) <= budget:
+        image.load()
+        return image, "full" if image.size == source_size else "draft"
+
+    factor = max(1, int(min(width / target[0], height / target[1]) / reducing_gap))
+    reduced_pixels = math.ceil(width / factor) * math.ceil(height / factor)
+    # The caller converts the reduced image; each band also gets converted
+    # (or alpha-premultiplied) and reduced on its own
+    after = reduced_pixels * (4 + CONVERT_BYTES_PER_PIXEL)
+    bands = 3 * STRIP_BYTES
+    strips = _raw_strips(image)
+    if strips is not None and after + bands <= budget:
+        offset, rawmode, stride, orientation = strips
+
+        def read_band(top, rows):
+            # Bottom-up files (BMP) store the last row first
+            image.fp.seek(offset + (top if orientation > 0 else height - top - rows) * stride)
+            return Image.frombuffer(image.mode, (width, rows), image.fp.read(rows * stride), "raw", rawmode, stride, orientation)
+
+        return _reduce_in_bands(image, factor, read_band), "strips"
+
+    if factor == 1:
+        # Nothing to reduce: the output needs the full decode
+        needed = pixels * (bytes_per_pixel(image.mode) + CONVERT_BYTES_PER_PIXEL)
+    else:
+        needed = max(pixels * bytes_per_pixel(image.mode) + reduced_pixels * 4 + bands, after)
+    if needed > budget:
+        raise ImageTooLarge(
+            f"A {width}x{height} {image.format or 'image'} needs about {needed / 1024 / 1024:.0f} MB to decode, "
+            f"over the {IMAGE_MEMORY_MB:.0f} MB limit"
+        )
+    image.load()
+    return _reduce_in_bands(image, factor, lambda top, rows: image.crop((0, top, width, top + rows))), "reduced"
+
+
+def _raw_strips(image):
+    """(offset, rawmode, stride, orientation) when the pixels are stored uncompressed in one block, else None"""
+    if len(image.tile) != 1 or image.mode not in REDUCIBLE_MODES or image.fp is None:
+        return None
+    codec, extents, offset, args = image.tile[0]
+    if codec != "raw" or tuple(extents) != (0, 0) + image.size:
+        return None
+    rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+    if not stride:
+        try:
+            stride = len(Image.new(image.mode, (image.width, 1)).tobytes("raw", rawmode))
+        except Exception:
+            return None
+    return offset, rawmode, stride, orientation
+
+
+def _reduce_in_bands(image, factor, read_band):
+    """image reduced by factor, built from full-resolution bands of rows read_band(top, rows) returns"""
+    width, height = image.size
+    # Bands are a multiple of factor rows, so the reduced bands tile exactly
+    band_rows = factor * max(1, STRIP_BYTES // (width * 4 * factor))
+    reduced = None
+    for top in range(0, height, band_rows):
+        band = read_band(top, min(band_rows, height - top))
+        if band.mode == "P":
+            band = band.convert("RGBA" if "transparency" in band.info else "RGB")
+        elif band.mode == "1":
+            band = band.convert("L")
+        elif band.mode.startswith("I;16"):
+            band = band.convert("I")
+        elif band.mode not in REDUCIBLE_MODES:
+            band = band.convert("RGB")
+        band = band.reduce(factor)
+        if reduced is None:
+            reduced = Image.new(band.mode, (math.ceil(width / factor), math.ceil(height / factor)))
+        reduced.paste(band, (0, top // factor))
+    reduced.info = {key: value for key, value in image.info.items() if key != "transparency"}
+    return reduced
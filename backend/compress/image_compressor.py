@@ -2,29 +2,136 @@ from PIL import Image
 import os
 from io import BytesIO
 import uuid
+import json
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from .image_budget import load_within_budget, open_image
+from .image_content import classify_image, quantize_palette
+from .metrics import peak_rss_bytes, record_bytes, record_fallback, record_image_format, stage
+from .storage import COMPRESSED_IMAGES, get_storage
 
+# Resize in two steps: a cheap integer reduction (JPEG DCT scaling at decode
+# time, then Image.reduce) to within this factor of the target, then LANCZOS
+REDUCING_GAP = 2.0
 
-def compress_image(image_file, output_folder="app/compressed_images", compression_level="medium"):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+# Output formats: name -> (Pillow format, file extension, keeps transparency)
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", "jpg", False),
+    "progressive_jpeg": ("JPEG", "jpg", False),
+    "webp": ("WEBP", "webp", True),
+    "webp_lossless": ("WEBP", "webp", True),
+    "avif": ("AVIF", "avif", True),
+    "png": ("PNG", "png", True),
+}
+LOSSLESS_FORMATS = ("webp_lossless", "png")
+# Downscaling blurs text and thin lines and adds in-between colors that defeat
+# the palette (a 1920px screenshot went from 413 to 2704 colors, doubling the
+# PNG), so graphics are only resized beyond this
+GRAPHIC_MAX_SIDE = 4096
+# Where graphics (screenshots, UI, charts) go instead: palette-quantized and
+# losslessly compressed. AVIF requests are left as asked.
+GRAPHIC_FORMATS = {
+    "jpeg": "png", "progressive_jpeg": "png", "png": "png",
+    "webp": "webp_lossless", "webp_lossless": "webp_lossless",
+}
+# Used instead when this Pillow build can't write a format (AVIF needs
+# Pillow 11.2+ with libavif, or the pillow-avif-plugin package)
+FORMAT_FALLBACKS = {"avif": "webp", "webp": "progressive_jpeg", "webp_lossless": "png"}
+# libavif encoder speed (0-10). The default (6) took 1.7s for a 2 MP photo; 9 takes
+# 0.3s, about as long as WebP, for a file ~55% larger than speed 6 (still smaller than WebP)
+AVIF_SPEED = 9
+# Picked by Accept negotiation, best first; progressive JPEG when neither is accepted
+NEGOTIATED_FORMATS = (("image/avif", "avif"), ("image/webp", "webp"))
 
-    # Read the uploaded file content (raw bytes)
-    image_file.file.seek(0)
-    image_content = image_file.file.read()
-    image_file.file.seek(0)  # Reset for potential reuse
+# Responsive ladders (/compress/image/variants): rung count and longest-side limits
+MAX_VARIANTS = 8
+VARIANT_SIDE_RANGE = (16, 8192)
+VARIANT_PACKAGES = ("urls", "zip")
 
-    # Open image from bytes
-    image = Image.open(BytesIO(image_content))
-    original_format = image.format
+# Compression settings per level
+COMPRESSION_SETTINGS = {
+    "light": {"quality": 75, "avif_quality": 60, "palette_colors": 256, "optimize": True, "description": "Light compression - High quality, moderate size reduction"},
+    "medium": {"quality": 60, "avif_quality": 45, "palette_colors": 192, "optimize": True, "description": "Medium compression - Balanced quality and size"},
+    "heavy": {"quality": 40, "avif_quality": 30, "palette_colors": 128, "optimize": True, "description": "Heavy compression - Maximum size reduction"},
+}
+
+MEDIA_TYPES = {
+    "jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif",
+    "webp": "image/webp", "avif": "image/avif", "bmp": "image/bmp", "tiff": "image/tiff",
+    "zip": "application/zip",
+}
+
+
+def can_write(output_format):
+    Image.init()
+    return OUTPUT_FORMATS[output_format][0] in Image.SAVE
+
+
+def resolve_output_format(output_format):
+    """output_format, or its nearest fallback this Pillow build can write"""
+    while not can_write(output_format):
+        output_format = FORMAT_FALLBACKS[output_format]
+    return output_format
+
+
+def negotiate_output_format(accept):
+    """Best output format for an Accept header.
+
+    Only explicitly listed types count: browsers send */* and image/* for
+    formats they can't decode too.
+    """
+    accepted = set()
+    for part in (accept or "").lower().split(","):
+        media_type, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            accepted.add(media_type.strip())
+    for media_type, output_format in NEGOTIATED_FORMATS:
+        if media_type in accepted and can_write(output_format):
+            return output_format
+    return "progressive_jpeg"
+
+
+def media_type_for(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    return MEDIA_TYPES.get(extension, "application/octet-stream")
 
-    # Convert to RGB for better compression
-    if image.mode in ("RGBA", "LA"):
-        background = Image.new("RGB", image.size, (255, 255, 255))
-        alpha = image.split()[-1]
-        background.paste(image, mask=alpha)
-        image = background
-    elif image.mode != "RGB":
-        image = image.convert("RGB")
+
+def fitted_size(size, max_width, max_height):
+    """Size of an image scaled down (never up) to fit max_width x max_height, as thumbnail() computes it"""
+    width, height = size
+    scale = min(max_width / width, max_height / height)
+    if scale >= 1:
+        return size
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def compress_image(image_file, compression_level="medium", inline=False, fast_decode=True, output_format="jpeg",
+                   detect_graphics=True):
+    # The result is written to artifact storage; with inline=True nothing is stored and the result carries the bytes under "data"
+    # fast_decode=False keeps the old full-resolution decode, detect_graphics=False the photo path for everything (for benchmarks)
+    # output_format is a key of OUTPUT_FORMATS; formats this build can't write fall back (FORMAT_FALLBACKS)
+    storage = get_storage()
+    requested_format = output_format
+    output_format = resolve_output_format(output_format)
+    if output_format != requested_format:
+        record_fallback("compress_image", f"format_{requested_format}")
+    pil_format, extension, keeps_alpha = OUTPUT_FORMATS[output_format]
+
+    # Read the uploaded file content (raw bytes)
+    with stage("upload_read"):
+        image_file.file.seek(0)
+        image_content = image_file.file.read()
+        image_file.file.seek(0)  # Reset for potential reuse
 
     # Resize image for better compression if it's too large
     max_dimensions = {
@@ -34,42 +141,69 @@ def compress_image(image_file, output_folder="app/compressed_images", compressio
     }
 
     max_width, max_height = max_dimensions.get(compression_level, max_dimensions["medium"])
-    if image.width > max_width or image.height > max_height:
-        image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-
-    # Define compression settings based on level
-    compression_settings = {
-        "light": {"quality": 75, "optimize": True, "description": "Light compression - High quality, moderate size reduction"},
-        "medium": {"quality": 60, "optimize": True, "description": "Medium compression - Balanced quality and size"},
-        "heavy": {"quality": 40, "optimize": True, "description": "Heavy compression - Maximum size reduction"},
-    }
 
-    settings = compression_settings.get(compression_level, compression_settings["medium"])
+    # Open image from bytes
+    with stage("image_decode"):
+        image = open_image(image_content)
+        original_format = image.format
 
-    # Create initial JPEG buffer
-    buffer = BytesIO()
-    image.save(buffer, format="JPEG", optimize=settings["optimize"], quality=settings["quality"])
-    buffer.seek(0)
+        # With fast_decode, JPEGs decode straight to the smallest fraction (1/2,
+        # 1/4, 1/8) of full size that still covers the target; LANCZOS does the
+        # rest. Asking for REDUCING_GAP x the target doubled decode time for an
+        # RMS gain under 1 level at these JPEG qualities. Other images too big
+        # for the memory budget are read in strips or reduced in their own mode.
+        image, decode_path = load_within_budget(image, fitted_size(image.size, max_width, max_height), fast_decode, REDUCING_GAP)
+    if decode_path in ("strips", "reduced"):
+        record_fallback("compress_image", f"decode_{decode_path}")
+
+    # Screenshots, UI and charts come out smaller (and sharper) as a palette
+    # PNG/lossless WebP than as JPEG. JPEG sources are left alone: their DCT
+    # noise is baked in, so a lossless copy only grows.
+    content_kind = "photo"
+    if detect_graphics and original_format != "JPEG" and output_format in GRAPHIC_FORMATS:
+        with stage("image_classify"):
+            content_kind = classify_image(image)
+        if content_kind == "graphic":
+            output_format = resolve_output_format(GRAPHIC_FORMATS[output_format])
+            pil_format, extension, keeps_alpha = OUTPUT_FORMATS[output_format]
+            max_width = max_height = max(max_width, max_height, GRAPHIC_MAX_SIDE)
+
+    with stage("image_resize"):
+        # Done before resizing: resampling RGBA premultiplies alpha and cost
+        # more than compositing at full size
+        image = _convert_mode(image, keeps_alpha)
+
+        if image.width > max_width or image.height > max_height:
+            image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+
+    settings = COMPRESSION_SETTINGS.get(compression_level, COMPRESSION_SETTINGS["medium"])
+    quality = settings["avif_quality"] if output_format == "avif" else settings["quality"]
+
+    if content_kind == "graphic":
+        with stage("image_quantize"):
+            image = quantize_palette(image, settings["palette_colors"])
+
+    # Create initial buffer
+    with stage("image_encode"):
+        buffer = _encode(image, output_format, quality)
 
     # Build user-friendly name
     original_name = os.path.splitext(image_file.filename or f"image-{uuid.uuid4()}")[0]
     safe_original = os.path.basename(original_name).replace(" ", "_")
-    display_filename = f"chhotipdf-{safe_original}.jpg"
+    display_filename = f"chhotipdf-{safe_original}.{extension}"
 
     # Keep stored filename unique on disk
-    compressed_filename = f"{uuid.uuid4()}.jpg"
-    compressed_path = os.path.join(output_folder, compressed_filename)
+    compressed_filename = f"{uuid.uuid4()}.{extension}"
 
     original_size_bytes = len(image_content)
     compressed_size_bytes = len(buffer.getvalue())
 
-    # If compressed size is not smaller, try one fallback with lower quality
-    if compressed_size_bytes >= original_size_bytes:
+    # If compressed size is not smaller, try one fallback with lower quality (lossless has none)
+    if compressed_size_bytes >= original_size_bytes and output_format not in LOSSLESS_FORMATS:
         try:
-            fallback_buf = BytesIO()
-            fallback_quality = max(settings["quality"] - 20, 20)
-            image.save(fallback_buf, format="JPEG", optimize=True, quality=fallback_quality)
-            fallback_buf.seek(0)
+            fallback_quality = max(quality - 20, 20)
+            with stage("image_encode"):
+                fallback_buf = _encode(image, output_format, fallback_quality)
             fallback_size = len(fallback_buf.getvalue())
             if fallback_size < compressed_size_bytes:
                 buffer = fallback_buf
@@ -77,11 +211,38 @@ def compress_image(image_file, output_folder="app/compressed_images", compressio
         except Exception:
             pass
 
+    if inline:
+        used_original = compressed_size_bytes >= original_size_bytes
+        if used_original:
+            record_fallback("compress_image", "used_original")
+            compressed_size_bytes = original_size_bytes
+        record_bytes("compress_image", original_size_bytes, compressed_size_bytes)
+        record_image_format("original" if used_original else output_format, original_size_bytes, compressed_size_bytes)
+        media_format = (original_format or "JPEG").lower() if used_original else pil_format.lower()
+        if used_original:
+            display_filename = f"chhotipdf-{safe_original}.{'jpg' if media_format == 'jpeg' else media_format}"
+        return {
+            "originalSize": original_size_bytes,
+            "compressedSize": compressed_size_bytes,
+            "data": image_content if used_original else buffer.getvalue(),
+            "format": media_format,
+            "outputFormat": "original" if used_original else output_format,
+            "bytesSaved": original_size_bytes - compressed_size_bytes,
+            "contentKind": content_kind,
+            "decodePath": decode_path,
+            "peakMemoryMb": round(peak_rss_bytes() / 1024 / 1024, 1),
+            "display_filename": display_filename,
+            "compressionLevel": compression_level,
+            "compressionDescription": settings["description"],
+            "usedOriginal": used_original,
+        }
+
     # Final check: if compression didn't reduce size, store original bytes instead
     used_original = False
     print(f"[DEBUG] image original_size={original_size_bytes} bytes; initial_compressed_size={compressed_size_bytes} bytes")
     if compressed_size_bytes >= original_size_bytes:
         used_original = True
+        record_fallback("compress_image", "used_original")
         print("[DEBUG] compressed buffer not smaller than original — writing original bytes instead")
         # Preserve original extension if possible
         try:
@@ -89,42 +250,290 @@ def compress_image(image_file, output_folder="app/compressed_images", compressio
             if orig_ext == "jpeg":
                 orig_ext = "jpg"
             orig_filename = f"{uuid.uuid4()}.{orig_ext}"
-            compressed_path = os.path.join(output_folder, orig_filename)
-            with open(compressed_path, "wb") as f:
-                f.write(image_content)
+            storage.write_bytes(COMPRESSED_IMAGES, orig_filename, image_content)
             compressed_filename = orig_filename
+            display_filename = f"chhotipdf-{safe_original}.{orig_ext}"
             compressed_size_bytes = len(image_content)
         except Exception as e:
             print(f"[DEBUG] writing original bytes failed: {e}; falling back to compressed buffer")
             # Last resort: write the compressed buffer
-            with open(compressed_path, "wb") as f:
-                f.write(buffer.getvalue())
+            storage.write_bytes(COMPRESSED_IMAGES, compressed_filename, buffer.getvalue())
             compressed_size_bytes = len(buffer.getvalue())
     else:
-        with open(compressed_path, "wb") as f:
-            f.write(buffer.getvalue())
+        with stage("disk_write"):
+            storage.write_bytes(COMPRESSED_IMAGES, compressed_filename, buffer.getvalue())
 
     # Post-write safety: ensure the written file isn't larger than original
     try:
-        written_size = os.path.getsize(compressed_path)
+        written_size = storage.size(COMPRESSED_IMAGES, compressed_filename)
         print(f"[DEBUG] written_size_after_first_write={written_size} bytes")
-        if written_size > original_size_bytes:
+        if written_size is not None and written_size > original_size_bytes:
             print("[DEBUG] written file larger than original — overwriting with original bytes")
-            with open(compressed_path, "wb") as f:
-                f.write(image_content)
+            storage.write_bytes(COMPRESSED_IMAGES, compressed_filename, image_content)
             compressed_size_bytes = len(image_content)
             used_original = True
             print(f"[DEBUG] overwritten_with_original; final_size={compressed_size_bytes} bytes")
     except Exception as e:
         print(f"[DEBUG] post-write safety check failed: {e}")
 
+    record_bytes("compress_image", original_size_bytes, compressed_size_bytes)
+    record_image_format("original" if used_original else output_format, original_size_bytes, compressed_size_bytes)
+
     return {
         "originalSize": original_size_bytes,
         "compressedSize": compressed_size_bytes,
-        "path": compressed_path,
+        "path": storage.location(COMPRESSED_IMAGES, compressed_filename),
         "filename": compressed_filename,
+        "outputFormat": "original" if used_original else output_format,
+        "bytesSaved": original_size_bytes - compressed_size_bytes,
+        "contentKind": content_kind,
+        "decodePath": decode_path,
+        "peakMemoryMb": round(peak_rss_bytes() / 1024 / 1024, 1),
         "display_filename": display_filename,
         "compressionLevel": compression_level,
         "compressionDescription": settings["description"],
         "usedOriginal": used_original,
     }
+
+
+def parse_variants(spec, output_format="jpeg", compression_level="medium", auto_format="progressive_jpeg"):
+    """Validate a variant ladder before any image is read.
+
+    spec is a JSON list such as [{"max_side": 2048, "format": "webp", "quality": 80}, {"max_side": 640}]
+    or a comma-separated list of sides ("2048,1600,1200,640"). Missing formats and levels
+    default to output_format and compression_level; "auto" becomes auto_format.
+    Returns the normalized list; raises ValueError.
+    """
+    if isinstance(spec, str):
+        text = spec.strip()
+        if text.startswith("["):
+            try:
+                spec = json.loads(text)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"variants is not valid JSON: {e}")
+        else:
+            try:
+                spec = [{"max_side": int(side)} for side in text.split(",") if side.strip()]
+            except ValueError:
+                raise ValueError("variants must be a JSON list or comma-separated sides, e.g. 2048,1600,1200,640")
+    if not isinstance(spec, list) or not spec:
+        raise ValueError("variants must be a non-empty list")
+    if len(spec) > MAX_VARIANTS:
+        raise ValueError(f"At most {MAX_VARIANTS} variants are allowed")
+    low, high = VARIANT_SIDE_RANGE
+    variants = []
+    for number, variant in enumerate(spec, start=1):
+        if not isinstance(variant, dict):
+            raise ValueError(f"Variant {number}: must be an object with max_side")
+        side = variant.get("max_side")
+        if not isinstance(side, int) or not low <= side <= high:
+            raise ValueError(f"Variant {number}: max_side must be an integer from {low} to {high}")
+        variant_format = variant.get("format", output_format)
+        if variant_format == "auto":
+            variant_format = auto_format
+        if variant_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Variant {number}: format must be one of: {', '.join(list(OUTPUT_FORMATS) + ['auto'])}")
+        level = variant.get("level", compression_level)
+        if level not in COMPRESSION_SETTINGS:
+            raise ValueError(f"Variant {number}: level must be light, medium or heavy")
+        quality = variant.get("quality")
+        if quality is not None and (not isinstance(quality, int) or not 1 <= quality <= 100):
+            raise ValueError(f"Variant {number}: quality must be an integer from 1 to 100")
+        variants.append({"maxSide": side, "format": variant_format, "level": level, "quality": quality})
+    return variants
+
+
+def compress_image_variants(image_file, variants, package="urls", inline=False, detect_graphics=True, max_workers=1):
+    """Several sizes of one image (a responsive ladder) from a single upload and decode.
+
+    variants is the list returned by parse_variants. The image is decoded once
+    at the size the largest rung needs, then each rung is resized from the
+    previous (larger) one and encoded in up to max_workers threads while the
+    next rung is resized (Pillow's resize and WebP/AVIF encoders release the
+    GIL, so each thread can use a core; callers pass the CPU slots admission
+    charged for the request). With package="urls" every variant
+    is written to artifact storage; with package="zip" (or inline=True, which
+    returns the bytes under "data") they go into one ZIP with a manifest.
+    """
+    storage = get_storage()
+
+    with stage("upload_read"):
+        image_file.file.seek(0)
+        image_content = image_file.file.read()
+        image_file.file.seek(0)
+    original_size_bytes = len(image_content)
+
+    # Rungs are built largest first, each from the one before
+    order = sorted(range(len(variants)), key=lambda i: -variants[i]["maxSide"])
+    largest = variants[order[0]]["maxSide"]
+
+    with stage("image_decode"):
+        image = open_image(image_content)
+        original_format = image.format
+        source_size = image.size
+        image, decode_path = load_within_budget(image, fitted_size(source_size, largest, largest), True, REDUCING_GAP)
+    if decode_path in ("strips", "reduced"):
+        record_fallback("compress_image_variants", f"decode_{decode_path}")
+
+    formats = []
+    for variant in variants:
+        output_format = resolve_output_format(variant["format"])
+        if output_format != variant["format"]:
+            record_fallback("compress_image_variants", f"format_{variant['format']}")
+        formats.append(output_format)
+
+    # Same rule as compress_image; the requested sides are kept for graphics
+    # too, since a ladder is asked for exact breakpoints
+    content_kind = "photo"
+    if detect_graphics and original_format != "JPEG" and any(f in GRAPHIC_FORMATS for f in formats):
+        with stage("image_classify"):
+            content_kind = classify_image(image)
+        if content_kind == "graphic":
+            formats = [resolve_output_format(GRAPHIC_FORMATS[f]) if f in GRAPHIC_FORMATS else f for f in formats]
+
+    with stage("image_resize"):
+        # Keep transparency through the chain if any rung can use it; the others
+        # are flattened at their own (smaller) size
+        image = _convert_mode(image, any(OUTPUT_FORMATS[f][2] for f in formats))
+
+    def encode_rung(rung, index):
+        variant, output_format = variants[index], formats[index]
+        settings = COMPRESSION_SETTINGS[variant["level"]]
+        rung = _convert_mode(rung, OUTPUT_FORMATS[output_format][2])
+        if content_kind == "graphic" and output_format in LOSSLESS_FORMATS:
+            with stage("image_quantize"):
+                rung = quantize_palette(rung, settings["palette_colors"])
+        quality = variant["quality"] or settings["avif_quality" if output_format == "avif" else "quality"]
+        with stage("image_encode"):
+            data = _encode(rung, output_format, quality).getvalue()
+            # Same single lower-quality retry as compress_image
+            if len(data) >= original_size_bytes and output_format not in LOSSLESS_FORMATS:
+                fallback = _encode(rung, output_format, max(quality - 20, 20)).getvalue()
+                if len(fallback) < len(data):
+                    data = fallback
+        return data, rung.size, None if output_format in LOSSLESS_FORMATS else quality
+
+    workers = max(1, min(max_workers, len(variants), os.cpu_count() or 1))
+    encoded = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rung = image
+        for index in order:
+            side = variants[index]["maxSide"]
+            size = fitted_size(source_size, side, side)
+            size = (min(size[0], rung.width), min(size[1], rung.height))
+            if size != rung.size:
+                with stage("image_resize"):
+                    rung = rung.resize(size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+            encoded[index] = pool.submit(encode_rung, rung, index)
+        encoded = {index: future.result() for index, future in encoded.items()}
+
+    original_name = os.path.splitext(image_file.filename or f"image-{uuid.uuid4()}")[0]
+    safe_original = os.path.basename(original_name).replace(" ", "_")
+    as_zip = inline or package == "zip"
+
+    manifest = []
+    for index, variant in enumerate(variants):
+        data, (width, height), quality = encoded[index]
+        output_format = formats[index]
+        extension = OUTPUT_FORMATS[output_format][1]
+        entry = {
+            "maxSide": variant["maxSide"],
+            "width": width,
+            "height": height,
+            "outputFormat": output_format,
+            "quality": quality,
+            "size": len(data),
+            "bytesSaved": original_size_bytes - len(data),
+            "fileName": f"chhotipdf-{safe_original}-{width}w.{extension}",
+        }
+        if not as_zip:
+            stored_filename = f"{uuid.uuid4()}.{extension}"
+            with stage("disk_write"):
+                storage.write_bytes(COMPRESSED_IMAGES, stored_filename, data)
+            entry["url"] = f"/download/image/{stored_filename}"
+        manifest.append(entry)
+        record_image_format(output_format, original_size_bytes, len(data))
+
+    total_size = sum(entry["size"] for entry in manifest)
+    record_bytes("compress_image_variants", original_size_bytes, total_size)
+    print(f"Image variants: {round(original_size_bytes/1024,2)}KB {source_size[0]}x{source_size[1]} -> "
+          f"{len(manifest)} variants, {round(total_size/1024,2)}KB total")
+    result = {
+        "originalSize": original_size_bytes,
+        "originalWidth": source_size[0],
+        "originalHeight": source_size[1],
+        "contentKind": content_kind,
+        "decodePath": decode_path,
+        "variantCount": len(manifest),
+        "totalSize": total_size,
+        "package": "zip" if as_zip else "urls",
+        "variants": manifest,
+    }
+    if not as_zip:
+        result["peakMemoryMb"] = round(peak_rss_bytes() / 1024 / 1024, 1)
+        return result
+
+    zip_filename = f"variants_{uuid.uuid4()}.zip"
+    writer = nullcontext(BytesIO()) if inline else storage.open_write(COMPRESSED_IMAGES, zip_filename)
+    with writer as zip_target:
+        # Encoded images don't deflate further
+        with zipfile.ZipFile(zip_target, "w", compression=zipfile.ZIP_STORED) as zf:
+            names = set()
+            for index, entry in enumerate(manifest):
+                name = re.sub(r"[^A-Za-z0-9._-]+", "_", entry["fileName"])
+                if name in names:
+                    stem, extension = os.path.splitext(name)
+                    name = f"{stem}-{index + 1}{extension}"
+                names.add(name)
+                entry["file"] = name
+                zf.writestr(name, encoded[index][0])
+            zf.writestr("manifest.json", json.dumps({"source": image_file.filename, "variants": manifest}, indent=2))
+        zip_size = zip_target.tell()
+    result["zipSize"] = zip_size
+    result["peakMemoryMb"] = round(peak_rss_bytes() / 1024 / 1024, 1)
+    result["displayFilename"] = f"chhotipdf-{safe_original}-variants.zip"
+    if inline:
+        result["data"] = zip_target.getvalue()
+        return result
+    result["filename"] = zip_filename
+    result["url"] = f"/download/image/{zip_filename}"
+    return result
+
+
+def _convert_mode(image, keeps_alpha):
+    """image as RGB, or RGBA when the output format keeps transparency and the image has any"""
+    if keeps_alpha:
+        # WebP/AVIF/PNG keep transparency; other modes are converted so they resample well
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        if image.mode == "RGBA" and image.getextrema()[3] == (255, 255):
+            image = image.convert("RGB")  # fully opaque: don't encode an alpha plane
+    # Convert to RGB for better compression
+    elif image.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        alpha = image.split()[-1]
+        background.paste(image, mask=alpha)
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def _encode(image, output_format, quality):
+    """Encode image as output_format; returns the BytesIO"""
+    buffer = BytesIO()
+    if output_format == "jpeg":
+        image.save(buffer, format="JPEG", optimize=True, quality=quality)
+    elif output_format == "progressive_jpeg":
+        image.save(buffer, format="JPEG", optimize=True, progressive=True, quality=quality)
+    elif output_format == "webp":
+        image.save(buffer, format="WEBP", quality=quality)
+    elif output_format == "webp_lossless":
+        image.save(buffer, format="WEBP", lossless=True)
+    elif output_format == "png":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format="AVIF", quality=quality, speed=AVIF_SPEED)
+    buffer.seek(0)
+    return buffer
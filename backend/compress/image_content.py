@@ -0,0 +1,79 @@
+import numpy as np
+from PIL import Image, features
+
+# Statistics are taken on a nearest-neighbour sample of at most this many
+# pixels per side, so classifying costs the same for any upload size
+SAMPLE_SIDE = 512
+# Up to this many distinct colors an image is a graphic whatever its edges;
+# a palette holds it exactly
+PALETTE_COLORS = 256
+# Colors are counted up to this; more is reported as this number
+COUNTED_COLORS = 4096
+# Share of neighbouring sample pixels that are identical. Screenshots, UI and
+# charts are mostly flat fills (0.6-0.95); photos, even smooth ones, stay
+# well under 0.2 because of sensor noise and JPEG/resampling history
+FLAT_FRACTION_GRAPHIC = 0.5
+# Among neighbours that differ, the share whose brightness jumps by more than
+# STRONG_EDGE_LEVEL. Text and UI edges are hard steps; photo gradients change
+# a few levels at a time
+STRONG_EDGE_LEVEL = 32
+STRONG_EDGE_FRACTION_GRAPHIC = 0.25
+
+
+def content_stats(image):
+    """Distinct colors and edge statistics of a sample of image"""
+    scale = max(image.width, image.height) / SAMPLE_SIDE
+    sample = image
+    if scale > 1:
+        # NEAREST keeps the original colors; filtering would invent new ones
+        sample = image.resize((max(1, round(image.width / scale)), max(1, round(image.height / scale))), Image.Resampling.NEAREST)
+    sample = sample.convert("RGBA")
+    found = sample.getcolors(COUNTED_COLORS)
+    colors = len(found) if found is not None else COUNTED_COLORS
+
+    # One uint32 per RGBA pixel, so "identical neighbour" is a single compare
+    rgba = np.asarray(sample, dtype=np.uint8)
+    packed = rgba.view(np.uint32).reshape(rgba.shape[:2])
+    pairs = packed[:, 1:].size + packed[1:].size
+    if pairs == 0:
+        return {"colors": colors, "flatFraction": 1.0, "strongEdgeFraction": 0.0}
+    flat = np.count_nonzero(packed[:, 1:] == packed[:, :-1]) + np.count_nonzero(packed[1:] == packed[:-1])
+
+    luma = np.asarray(sample.convert("L"), dtype=np.int16)
+    strong = (np.count_nonzero(np.abs(np.diff(luma, axis=1)) > STRONG_EDGE_LEVEL)
+              + np.count_nonzero(np.abs(np.diff(luma, axis=0)) > STRONG_EDGE_LEVEL))
+    changed = pairs - flat
+    return {
+        "colors": colors,
+        "flatFraction": round(float(flat / pairs), 3),
+        "strongEdgeFraction": round(float(strong / changed), 3) if changed else 0.0,
+    }
+
+
+def classify_image(image):
+    """Either "graphic" (screenshots, UI, charts, logos) or "photo"."""
+    stats = content_stats(image)
+    if stats["colors"] <= PALETTE_COLORS:
+        return "graphic"
+    if stats["flatFraction"] >= FLAT_FRACTION_GRAPHIC and stats["strongEdgeFraction"] >= STRONG_EDGE_FRACTION_GRAPHIC:
+        return "graphic"
+    return "photo"
+
+
+def quantize_palette(image, colors=PALETTE_COLORS):
+    """Reduce image to an adaptive palette of at most colors entries (mode "P").
+
+    Images that already have that few colors keep them exactly. No
+    dithering: it would break up the flat areas that make graphics compress.
+    """
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    if image.getcolors(colors) is not None:
+        method = Image.Quantize.FASTOCTREE if image.mode == "RGBA" else Image.Quantize.MEDIANCUT
+        return image.quantize(colors, method=method, dither=Image.Dither.NONE)
+    if features.check("libimagequant"):
+        method = Image.Quantize.LIBIMAGEQUANT
+    else:
+        # MEDIANCUT only takes RGB
+        method = Image.Quantize.FASTOCTREE if image.mode == "RGBA" else Image.Quantize.MEDIANCUT
+    return image.quantize(colors, method=method, dither=Image.Dither.NONE)
@@ -0,0 +1,221 @@
+import asyncio
+import inspect
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from .metrics import (
+    LANE_ACTIVE, LANE_QUEUED, LANE_WAIT_SECONDS, forward_metrics, peak_rss_bytes, record_peak_memory, replay_metrics,
+    reset_peak_rss
+)
+from .profiling import active_profiler, profiling_operation
+from .progress import hub, init_worker, reporting, worker_queue
+
+# Bulk worker count, configurable per deployment. The interactive lane has a
+# single thread: PyMuPDF isn't thread-safe, and its runs share the server
+# process's text index cache, so they can't move to worker processes
+BULK_WORKERS = int(os.environ.get("CHHOTIPDF_BULK_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+
+# Held by every run in the server process (the interactive lane, and a process
+# lane that fell back to threads), so PyMuPDF only ever runs on one thread here
+_in_process_lock = threading.Lock()
+
+
+class WorkerLost(Exception):
+    """The worker process running an operation died before it finished"""
+
+
+class BufferedUpload:
+    """Picklable stand-in for an UploadFile whose bytes were already read.
+
+    Offers the parts of the UploadFile interface the operations use
+    (filename, async read(), file), so they run unchanged in a lane worker.
+    """
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.data = data
+        self.file = BytesIO(data)
+
+    async def read(self, size=-1):
+        return self.file.read(size)
+
+    def __getstate__(self):
+        return {"filename": self.filename, "data": self.data}
+
+    def __setstate__(self, state):
+        self.__init__(state["filename"], state["data"])
+
+
+async def buffer_upload(upload):
+    if upload is None:
+        return None
+    return BufferedUpload(upload.filename, await upload.read())
+
+
+def _run_operation(fn, args, kwargs, forward, progress_id=None, profile_mode=None):
+    """Run fn (sync or async) to completion on a lane worker.
+
+    Returns (result, forwarded metric observations or None, the worker's
+    profile of the run for the request's profiler, empty when not profiled).
+    """
+    if not forward:
+        with _in_process_lock, reporting(progress_id, fn.__name__), profiling_operation(profile_mode) as profiled:
+            result = fn(*args, **kwargs)
+            result = asyncio.run(result) if inspect.iscoroutine(result) else result
+        return result, None, profiled
+    with forward_metrics() as observations, reporting(progress_id, fn.__name__), profiling_operation(profile_mode) as profiled:
+        # A worker process runs one operation at a time, so its peak is this request's
+        reset_peak_rss()
+        result = fn(*args, **kwargs)
+        if inspect.iscoroutine(result):
+            result = asyncio.run(result)
+        record_peak_memory(fn.__name__, peak_rss_bytes())
+    return result, observations, profiled
+
+
+class Lane:
+    """A class of work with its own workers and concurrency limit.
+
+    Thread lanes share the server process. Process lanes isolate heavy work:
+    PyMuPDF holds the GIL during long calls (a single page render can take
+    seconds), so heavy jobs on threads would still stall everything else.
+    """
+
+    def __init__(self, name, workers, processes=False):
+        self.name = name
+        self.workers = max(1, workers)
+        self.processes = processes
+        self.active = 0
+        self.queued = 0
+        self.completed = 0
+        self._slots = None
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.processes:
+                # spawn, not fork: the server process has threads (anyio, lanes)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=init_worker, initargs=(worker_queue(),))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"lane-{self.name}")
+        return self._executor
+
+    async def _submit(self, fn, args, kwargs, progress_id, profiler):
+        profile_mode = profiler.mode if profiler is not None else None
+        if not self.processes:
+            result, _, profiled = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), _run_operation, fn, args, kwargs, False, progress_id, profile_mode)
+        else:
+            try:
+                future = self._get_executor().submit(_run_operation, fn, args, kwargs, True, progress_id, profile_mode)
+            except (OSError, NotImplementedError) as e:
+                # Some sandboxes can't spawn processes; thread workers are slower but correct
+                print(f"Lane '{self.name}' can't use worker processes ({e}), falling back to threads")
+                self._executor = None
+                self.processes = False
+                return await self._submit(fn, args, kwargs, progress_id, profiler)
+            try:
+                result, observations, profiled = await asyncio.wrap_future(future)
+            except BrokenProcessPool as e:
+                # A worker died mid-job (e.g. a crash inside MuPDF); only this request fails
+                self._executor = None
+                raise WorkerLost(f"Processing worker crashed: {e}")
+            replay_metrics(observations)
+        if profiled:
+            # The work ran on a worker thread or process the request's own profiler can't see
+            profiler.merge(profiled)
+        return result
+
+    async def run(self, fn, *args, progress_id=None, **kwargs):
+        """Run fn(*args, **kwargs) on this lane once a worker is free. Arguments must be picklable for process lanes.
+
+        With a progress_id, queued/running/done events for the run go to GET /progress/{progress_id}.
+        When the request is being profiled, the worker profiles the run too.
+        """
+        profiler = active_profiler()
+        if progress_id:
+            hub.queued(progress_id, fn.__name__)
+        try:
+            return await self._run(fn, args, kwargs, progress_id, profiler)
+        except (WorkerLost, asyncio.CancelledError) as e:
+            # A worker reports how its run ended itself, after the run's last
+            # progress event; these runs have no worker left to do that
+            if progress_id:
+                hub.finish(progress_id, fn.__name__, error=str(e) or type(e).__name__)
+            raise
+
+    async def _run(self, fn, args, kwargs, progress_id, profiler):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        queued_at = time.perf_counter()
+        self.queued += 1
+        LANE_QUEUED.labels(self.name).set(self.queued)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+            LANE_QUEUED.labels(self.name).set(self.queued)
+        LANE_WAIT_SECONDS.labels(self.name).observe(time.perf_counter() - queued_at)
+        self.active += 1
+        LANE_ACTIVE.labels(self.name).set(self.active)
+        try:
+            return await self._submit(fn, args, kwargs, progress_id, profiler)
+        finally:
+            self.active -= 1
+            self.completed += 1
+            LANE_ACTIVE.labels(self.name).set(self.active)
+            self._slots.release()
+
+    def state(self):
+        return {
+            "workers": self.workers,
+            "processes": self.processes,
+            "active": self.active,
+            "queued": self.queued,
+            "completed": self.completed,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Which lane each operation runs on
+OPERATION_LANES = {
+    "split_preview": "interactive",
+    "split_pdf": "interactive",
+    "organize_preview": "interactive",
+    "organize_pdf": "interactive",
+    "search_pdf": "interactive",
+    "compress_pdf": "bulk",
+    "compress_image": "bulk",
+    "compress_image_variants": "bulk",
+    "merge_pdf": "bulk",
+    "split_pdf_multi": "bulk",
+    "pipeline_pdf": "bulk",
+}
+
+LANES = {
+    "interactive": Lane("interactive", 1),
+    "bulk": Lane("bulk", BULK_WORKERS, processes=True),
+}
+
+
+async def run_in_lane(lane, fn, *args, progress_id=None, **kwargs):
+    return await LANES[lane].run(fn, *args, progress_id=progress_id, **kwargs)
+
+
+def lane_state():
+    return {name: lane.state() for name, lane in LANES.items()}
+
+
+def shutdown_lanes():
+    for lane in LANES.values():
+        lane.shutdown()
@@ -0,0 +1,144 @@
+import resource
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Request latency buckets go up to multi-minute heavy compressions
+_REQUEST_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+_MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096))
+_STAGE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_SECONDS = Histogram(
+    "chhotipdf_request_seconds", "End-to-end request latency per endpoint",
+    ["endpoint", "method", "status"], buckets=_REQUEST_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "chhotipdf_stage_seconds", "Time spent in internal processing stages",
+    ["stage"], buckets=_STAGE_BUCKETS,
+)
+IN_FLIGHT = Gauge("chhotipdf_in_flight_requests", "Requests currently being processed", ["endpoint"])
+BYTES_IN = Counter("chhotipdf_bytes_in_total", "Uploaded bytes processed per operation", ["operation"])
+BYTES_OUT = Counter("chhotipdf_bytes_out_total", "Output bytes produced per operation", ["operation"])
+FALLBACKS = Counter(
+    "chhotipdf_fallback_total", "Fallback paths taken (used_original, rasterize, rebuild)",
+    ["operation", "kind"],
+)
+IMAGE_OUTPUTS = Counter("chhotipdf_image_outputs_total", "Compressed images per output format", ["format"])
+IMAGE_BYTES_SAVED = Counter(
+    "chhotipdf_image_bytes_saved_total", "Bytes saved by image compression per output format", ["format"],
+)
+PEAK_MEMORY = Histogram(
+    "chhotipdf_peak_memory_bytes", "Peak resident memory of the bulk-lane worker process during one operation",
+    ["operation"], buckets=_MEMORY_BUCKETS,
+)
+CACHE_LOOKUPS = Counter("chhotipdf_cache_lookups_total", "Cache lookups by result", ["cache", "result"])
+ADMISSION_IN_USE = Gauge("chhotipdf_admission_in_use", "Admitted budget in use", ["resource"])
+ADMISSION_QUEUED = Gauge("chhotipdf_admission_queued", "Requests waiting for admission")
+ADMISSION_REJECTED = Counter("chhotipdf_admission_rejected_total", "Requests rejected with 503", ["operation"])
+
+
+LANE_ACTIVE = Gauge("chhotipdf_lane_active", "Operations running per execution lane", ["lane"])
+LANE_QUEUED = Gauge("chhotipdf_lane_queued", "Operations waiting for a lane worker", ["lane"])
+LANE_WAIT_SECONDS = Histogram(
+    "chhotipdf_lane_wait_seconds", "Time spent waiting for a lane worker",
+    ["lane"], buckets=_STAGE_BUCKETS,
+)
+
+# Set inside bulk-lane worker processes: observations are shipped back with the
+# result and replayed into the server's registry (see replay_metrics)
+_forwarded = None
+
+
+def _observe(kind, labels, value):
+    if _forwarded is not None:
+        _forwarded.append((kind, labels, value))
+    elif kind == "stage":
+        STAGE_SECONDS.labels(*labels).observe(value)
+    elif kind == "bytes_in":
+        BYTES_IN.labels(*labels).inc(value)
+    elif kind == "bytes_out":
+        BYTES_OUT.labels(*labels).inc(value)
+    elif kind == "fallback":
+        FALLBACKS.labels(*labels).inc(value)
+    elif kind == "image_output":
+        IMAGE_OUTPUTS.labels(*labels).inc(value)
+    elif kind == "image_saved":
+        IMAGE_BYTES_SAVED.labels(*labels).inc(value)
+    elif kind == "cache":
+        CACHE_LOOKUPS.labels(*labels).inc(value)
+    elif kind == "peak_memory":
+        PEAK_MEMORY.labels(*labels).observe(value)
+
+
+@contextmanager
+def stage(name):
+    """Time a block into the chhotipdf_stage_seconds histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observe("stage", (name,), time.perf_counter() - start)
+
+
+def record_bytes(operation, bytes_in, bytes_out):
+    _observe("bytes_in", (operation,), bytes_in)
+    _observe("bytes_out", (operation,), bytes_out)
+
+
+def record_fallback(operation, kind):
+    _observe("fallback", (operation, kind), 1)
+
+
+def record_image_format(output_format, bytes_in, bytes_out):
+    _observe("image_output", (output_format,), 1)
+    _observe("image_saved", (output_format,), max(bytes_in - bytes_out, 0))
+
+
+def record_cache(cache, hit):
+    _observe("cache", (cache, "hit" if hit else "miss"), 1)
+
+
+def record_peak_memory(operation, peak_bytes):
+    _observe("peak_memory", (operation,), peak_bytes)
+
+
+def reset_peak_rss():
+    """Restart this process's peak-RSS high-water mark (Linux only; elsewhere the peak since start is kept)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_bytes():
+    """Peak resident memory of this process since the last reset_peak_rss()"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+
+
+@contextmanager
+def forward_metrics():
+    """Collect observations instead of recording them; yields the list they go to"""
+    global _forwarded
+    _forwarded = []
+    try:
+        yield _forwarded
+    finally:
+        _forwarded = None
+
+
+def replay_metrics(observations):
+    for kind, labels, value in observations:
+        _observe(kind, labels, value)
+
+
+def render_metrics():
+    """Current metrics in the Prometheus text format, with its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,119 @@
+import fitz  # PyMuPDF
+import re
+from .metrics import stage
+
+# One comma-separated part of a page spec: "7", "1-50", "90-" or "-5"
+_RANGE_PART = re.compile(r"^(\d*)\s*(-)?\s*(\d*)$")
+
+
+def validate_page_spec(spec):
+    """Check compact page range syntax without knowing the page count"""
+    parts = [p.strip() for p in str(spec).split(',') if p.strip()]
+    if not parts:
+        raise ValueError("Page selection is empty")
+    for part in parts:
+        m = _RANGE_PART.match(part)
+        if not m:
+            raise ValueError(f"Invalid page range: '{part}'")
+        start_s, dash, end_s = m.groups()
+        if not (start_s or end_s) or (not dash and (not start_s or end_s)):
+            raise ValueError(f"Invalid page range: '{part}'")
+
+
+def parse_page_spec(spec, page_count=None):
+    """Expand compact page range syntax like "1-50,70,90-" into 1-indexed page numbers.
+
+    Open-ended ranges run to the start ("-5") or end ("90-") of the document and
+    need page_count. A descending range ("10-1") yields pages in reverse order.
+    Order and duplicates are preserved so a spec can also describe a reordering.
+    With page_count, pages outside 1..page_count are dropped.
+    """
+    validate_page_spec(spec)
+    pages = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start_s, dash, end_s = _RANGE_PART.match(part).groups()
+        if not dash:
+            page = int(start_s)
+            if page_count is None or 1 <= page <= page_count:
+                pages.append(page)
+            continue
+        if not end_s and page_count is None:
+            raise ValueError(f"Open-ended range '{part}' needs the document page count")
+        start = int(start_s) if start_s else 1
+        end = int(end_s) if end_s else page_count
+        # Clamp to the document so "1-999999" doesn't expand into a huge list
+        first, last = min(start, end), max(start, end)
+        if page_count is not None:
+            first, last = max(first, 1), min(last, page_count)
+        run = range(first, last + 1)
+        pages.extend(run if start <= end else reversed(run))
+    return pages
+
+
+def count_pages(pdf_bytes):
+    """Return the page count of a PDF without rendering anything"""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+
+def page_runs(page_indices):
+    """Group 0-indexed pages into (first, last) runs of consecutive ascending pages"""
+    runs = []
+    for index in page_indices:
+        if runs and index == runs[-1][1] + 1:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index])
+    return [(first, last) for first, last in runs]
+
+
+def insert_page_runs(dst_doc, src_doc, page_indices):
+    """Copy pages into dst_doc with one insert_pdf call per contiguous run"""
+    for first, last in page_runs(page_indices):
+        dst_doc.insert_pdf(src_doc, from_page=first, to_page=last)
+
+
+def select_document_pages(doc, page_indices):
+    """Restrict an open document to page_indices (0-indexed, in order) in place.
+
+    Uses a single Document.select() call; if the PyMuPDF build rejects the
+    selection, the pages are copied as contiguous runs into a new document
+    which is returned instead. Invalid indices are ignored.
+    """
+    indices = [i for i in page_indices if isinstance(i, int) and 0 <= i < doc.page_count]
+    if not indices:
+        raise ValueError("No valid pages selected")
+    if indices == list(range(doc.page_count)):
+        return doc
+    try:
+        doc.select(indices)
+        return doc
+    except Exception:
+        new_doc = fitz.open()
+        insert_page_runs(new_doc, doc, indices)
+        return new_doc
+
+
+def select_pages(pdf_bytes, page_indices):
+    """Build a new PDF containing page_indices (0-indexed, in order) in one bulk operation.
+
+    Unlike inserting pages one at a time, shared resources (fonts, images) stay
+    shared, and garbage collection drops objects only used by removed pages.
+    """
+    with stage("fitz_open"):
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    selected = None
+    try:
+        selected = select_document_pages(doc, page_indices)
+        with stage("tobytes"):
+            return selected.tobytes(garbage=3, deflate=True)
+    finally:
+        if selected is not None and selected is not doc:
+            selected.close()
+        doc.close()
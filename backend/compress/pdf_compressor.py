@@ -2,140 +2,104 @@ import fitz  # PyMuPDF
 import os
 import uuid
 import io
-import time
 from PIL import Image
+from .metrics import record_bytes, record_fallback, stage
+from .progress import report
+from .storage import COMPRESSED_IMAGES, COMPRESSED_PDFS, MERGED_PDFS, get_storage
 
 # Resolve backend base directory (this file is in backend/compress)
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 BACKEND_DIR = os.path.dirname(THIS_DIR)
 
-def cleanup_old_files(folder_path, max_age_minutes=5):
-    """Remove files older than max_age_minutes from the specified folder"""
-    try:
-        if not os.path.exists(folder_path):
-            return
-
-        current_time = time.time()
-        max_age_seconds = max_age_minutes * 60  # Convert minutes to seconds
-
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            if os.path.isfile(file_path):
-                file_age = current_time - os.path.getctime(file_path)
-                if file_age > max_age_seconds:
-                    try:
-                        os.remove(file_path)
-                        print(f"Deleted old file: {filename}")
-                    except Exception as e:
-                        print(f"Could not delete {filename}: {e}")
-    except Exception as e:
-        print(f"Cleanup error: {e}")
-
 def cleanup_all_temp_files():
     """Clean up all temporary files from PDF, image, and merged PDF folders"""
     try:
-        # Use absolute paths under backend/app
-        cleanup_old_files(os.path.join(BACKEND_DIR, "app", "compressed_pdfs"), max_age_minutes=5)
-        cleanup_old_files(os.path.join(BACKEND_DIR, "app", "compressed_images"), max_age_minutes=5)
-        cleanup_old_files(os.path.join(BACKEND_DIR, "app", "merged_pdfs"), max_age_minutes=5)
+        storage = get_storage()
+        storage.cleanup(COMPRESSED_PDFS, max_age_minutes=5)
+        storage.cleanup(COMPRESSED_IMAGES, max_age_minutes=5)
+        storage.cleanup(MERGED_PDFS, max_age_minutes=5)
 
         print("Temporary file cleanup completed")
     except Exception as e:
         print(f"Cleanup error: {e}")
 
-async def compress_pdf(uploaded_file, output_folder=None, compression_level="medium"):
-    """Compress PDF files. Simple, safe defaults with robust fallbacks for image-heavy PDFs."""
-    # Compute absolute output folder under backend/app/compressed_pdfs
-    if output_folder is None:
-        output_folder = os.path.join(BACKEND_DIR, "app", "compressed_pdfs")
-    os.makedirs(output_folder, exist_ok=True)
-
-    # Cleanup temp files opportunistically
-    cleanup_all_temp_files()
-
-    file_id = str(uuid.uuid4())
-    output_filename = f"compressed_{file_id}.pdf"
-    output_path = os.path.join(output_folder, output_filename)
-
-    doc = None
+# Helpers
+def is_valid_pdf(data: bytes) -> bool:
     try:
-        pdf_bytes = await uploaded_file.read()
-        if not pdf_bytes:
-            raise Exception("Uploaded file is empty or unreadable")
-        original_size = len(pdf_bytes)
-
-        # Settings description for UI
-        level_desc = {
-            "light": "Light compression - Basic optimization",
-            "medium": "Medium compression - Balanced size/quality",
-            "heavy": "Heavy compression - Smallest size",
-        }
+        if not data:
+            return False
+        return (data[:4] == b"%PDF") or (data.lstrip()[:4] == b"%PDF")
+    except Exception:
+        return False
 
-        # Open source PDF
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        has_update_image = hasattr(doc, "update_image")
+def render_ok(data: bytes) -> bool:
+    try:
+        tdoc = fitz.open(stream=data, filetype="pdf")
+        if tdoc.page_count == 0:
+            return False
+        for i in range(tdoc.page_count):
+            _ = tdoc[i].get_pixmap(matrix=fitz.Matrix(0.5, 0.5))
+            report("validate", i + 1, tdoc.page_count)
+        tdoc.close()
+        return True
+    except Exception:
+        return False
 
-        # Helpers
-        def is_valid_pdf(data: bytes) -> bool:
-            try:
-                if not data:
-                    return False
-                return (data[:4] == b"%PDF") or (data.lstrip()[:4] == b"%PDF")
-            except Exception:
-                return False
+def rasterize_pdf(src_doc: fitz.Document, dpi: int, jpeg_q: int) -> bytes:
+    try:
+        scale = dpi / 72.0
+        mat = fitz.Matrix(scale, scale)
+        out = fitz.open()
+        for page_number, p in enumerate(src_doc, 1):
+            r = p.rect
+            with stage("rasterize_render"):
+                pix = p.get_pixmap(matrix=mat, alpha=False)
+            mode = "RGB" if pix.n >= 3 else "L"
+            with stage("image_recompress"):
+                img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
+                b = io.BytesIO()
+                img.save(b, format="JPEG", quality=jpeg_q, subsampling=2, optimize=False)
+                jpeg_bytes = b.getvalue()
+            np = out.new_page(width=r.width, height=r.height)
+            np.insert_image(np.rect, stream=jpeg_bytes)
+            report("rasterize", page_number, src_doc.page_count)
+        with stage("tobytes"):
+            data = out.tobytes(garbage=4, deflate=True, clean=True, deflate_images=False, deflate_fonts=True)
+        out.close()
+        return data
+    except Exception:
+        return b""
 
-        def render_ok(data: bytes) -> bool:
-            try:
-                tdoc = fitz.open(stream=data, filetype="pdf")
-                if tdoc.page_count == 0:
-                    return False
-                for i in range(tdoc.page_count):
-                    _ = tdoc[i].get_pixmap(matrix=fitz.Matrix(0.5, 0.5))
-                tdoc.close()
-                return True
-            except Exception:
-                return False
+def compress_pdf_document(doc, pdf_bytes, compression_level="medium"):
+    """Compress an already-open PDF in memory and return (output_bytes, used_original).
 
-        def rasterize_pdf(src_doc: fitz.Document, dpi: int, jpeg_q: int) -> bytes:
-            try:
-                scale = dpi / 72.0
-                mat = fitz.Matrix(scale, scale)
-                out = fitz.open()
-                for p in src_doc:
-                    r = p.rect
-                    pix = p.get_pixmap(matrix=mat, alpha=False)
-                    mode = "RGB" if pix.n >= 3 else "L"
-                    img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-                    b = io.BytesIO()
-                    img.save(b, format="JPEG", quality=jpeg_q, subsampling=2, optimize=False)
-                    jpeg_bytes = b.getvalue()
-                    np = out.new_page(width=r.width, height=r.height)
-                    np.insert_image(np.rect, stream=jpeg_bytes)
-                data = out.tobytes(garbage=4, deflate=True, clean=True, deflate_images=False, deflate_fonts=True)
-                out.close()
-                return data
-            except Exception:
-                return b""
+    doc is modified in place (images are recompressed). pdf_bytes are the
+    document's current bytes, used for the size comparison and as the
+    last-resort fallback. Nothing is written to disk.
+    """
+    has_update_image = hasattr(doc, "update_image")
 
-        # Strategy
-        output_bytes = b""
-        if has_update_image:
-            # Safe in-place JPEG recompression; skip risky conversions; light content clean
-            for page in doc:
-                imgs = page.get_images(full=True)
-                for img in imgs:
-                    xref = img[0]
-                    smask = img[1] if len(img) > 1 else 0
-                    if smask:
+    # Strategy
+    output_bytes = b""
+    if has_update_image:
+        # Safe in-place JPEG recompression; skip risky conversions; light content clean
+        images_done = bytes_saved = 0
+        for page_number, page in enumerate(doc, 1):
+            imgs = page.get_images(full=True)
+            for img in imgs:
+                xref = img[0]
+                smask = img[1] if len(img) > 1 else 0
+                if smask:
+                    continue
+                try:
+                    info = doc.extract_image(xref)
+                    data = info.get("image")
+                    if not data:
+                        continue
+                    ext = (info.get("ext") or "").lower()
+                    if ext not in ("jpg", "jpeg", "jpe", "jfif"):
                         continue
-                    try:
-                        info = doc.extract_image(xref)
-                        data = info.get("image")
-                        if not data:
-                            continue
-                        ext = (info.get("ext") or "").lower()
-                        if ext not in ("jpg", "jpeg", "jpe", "jfif"):
-                            continue
+                    with stage("image_recompress"):
                         im = Image.open(io.BytesIO(data))
                         if im.mode not in ("RGB", "L"):
                             try:
@@ -151,19 +115,26 @@ async def compress_pdf(uploaded_file, output_folder=None, compression_level="med
                         buf = io.BytesIO()
                         im.save(buf, format="JPEG", quality=q, subsampling=sub, optimize=False)
                         new_data = buf.getvalue()
-                        if len(new_data) < len(data) * 0.98:
-                            try:
-                                doc.update_image(xref, stream=new_data, ext="jpeg")
-                            except TypeError:
-                                doc.update_image(xref, new_data)
-                    except Exception:
-                        continue
-                if compression_level in ("medium", "heavy"):
-                    try:
-                        page.clean_contents()
-                    except Exception:
-                        pass
+                    if len(new_data) < len(data) * 0.98:
+                        try:
+                            doc.update_image(xref, stream=new_data, ext="jpeg")
+                        except TypeError:
+                            doc.update_image(xref, new_data)
+                        bytes_saved += len(data) - len(new_data)
+                    images_done += 1
+                    report("images", page_number - 1, doc.page_count, images_done, bytes_saved)
+                except Exception:
+                    continue
+            if compression_level in ("medium", "heavy"):
+                try:
+                    page.clean_contents()
+                except Exception:
+                    pass
+            report("images", page_number, doc.page_count, images_done, bytes_saved)
 
+        report("write")
+
+        with stage("tobytes"):
             output_bytes = doc.tobytes(
                 garbage=4 if compression_level == "heavy" else 3,
                 deflate=True,
@@ -171,51 +142,112 @@ async def compress_pdf(uploaded_file, output_folder=None, compression_level="med
                 deflate_images=False,
                 deflate_fonts=True if compression_level in ("medium", "heavy") else False,
             )
-        else:
-            # Conventional, robust path when image object updates aren't supported
-            if compression_level == "light":
+    else:
+        # Conventional, robust path when image object updates aren't supported
+        if compression_level == "light":
+            with stage("tobytes"):
                 output_bytes = doc.tobytes(garbage=3, deflate=True, clean=True, deflate_images=False, deflate_fonts=False)
-            else:
-                dpi = 120 if compression_level == "medium" else 96
-                q = 60 if compression_level == "medium" else 45
-                output_bytes = rasterize_pdf(doc, dpi=dpi, jpeg_q=q)
-                if not output_bytes:
+        else:
+            dpi = 120 if compression_level == "medium" else 96
+            q = 60 if compression_level == "medium" else 45
+            record_fallback("compress_pdf", "rasterize")
+            output_bytes = rasterize_pdf(doc, dpi=dpi, jpeg_q=q)
+            if not output_bytes:
+                with stage("tobytes"):
                     output_bytes = doc.tobytes(garbage=3, deflate=True, clean=True, deflate_images=False, deflate_fonts=True)
 
-        # Validate and possibly fallback
-        if not is_valid_pdf(output_bytes) or not render_ok(output_bytes):
-            # Last-resort rebuild from original
-            try:
-                src = fitz.open(stream=pdf_bytes, filetype="pdf")
-                rebuilt = fitz.open()
-                rebuilt.insert_pdf(src)
-                output_bytes = rebuilt.tobytes()
-                rebuilt.close()
-                src.close()
-            except Exception:
-                output_bytes = pdf_bytes
+    # Validate and possibly fallback
+    with stage("validation"):
+        output_ok = is_valid_pdf(output_bytes) and render_ok(output_bytes)
+    if not output_ok:
+        # Last-resort rebuild from original
+        record_fallback("compress_pdf", "rebuild")
+        try:
+            src = fitz.open(stream=pdf_bytes, filetype="pdf")
+            rebuilt = fitz.open()
+            rebuilt.insert_pdf(src)
+            output_bytes = rebuilt.tobytes()
+            rebuilt.close()
+            src.close()
+        except Exception:
+            output_bytes = pdf_bytes
+
+    # If compression resulted in a larger file, keep the original instead
+    used_original = False
+    if len(output_bytes) >= len(pdf_bytes):
+        print("Compressed PDF is not smaller than original — keeping original file bytes")
+        output_bytes = pdf_bytes
+        used_original = True
+        record_fallback("compress_pdf", "used_original")
+
+    return output_bytes, used_original
+
+async def compress_pdf(uploaded_file, compression_level="medium", inline=False):
+    """Compress PDF files. Simple, safe defaults with robust fallbacks for image-heavy PDFs.
+
+    The result is written to artifact storage; with inline=True nothing is
+    stored and the result carries the bytes under "data".
+    """
+    storage = get_storage()
+    if not inline:
+        # Cleanup temp files opportunistically
+        cleanup_all_temp_files()
+
+    file_id = str(uuid.uuid4())
+    output_filename = f"compressed_{file_id}.pdf"
+
+    doc = None
+    try:
+        with stage("upload_read"):
+            pdf_bytes = await uploaded_file.read()
+        if not pdf_bytes:
+            raise Exception("Uploaded file is empty or unreadable")
+        original_size = len(pdf_bytes)
 
-        # If compression resulted in a larger file, keep the original instead
-        used_original = False
-        if len(output_bytes) >= original_size:
-            print("Compressed PDF is not smaller than original — keeping original file bytes")
+        # Settings description for UI
+        level_desc = {
+            "light": "Light compression - Basic optimization",
+            "medium": "Medium compression - Balanced size/quality",
+            "heavy": "Heavy compression - Smallest size",
+        }
+
+        # Open source PDF
+        with stage("fitz_open"):
+            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+
+        output_bytes, used_original = compress_pdf_document(doc, pdf_bytes, compression_level)
+
+        record_bytes("compress_pdf", original_size, len(output_bytes))
+
+        if inline:
+            print(f"PDF Compression (inline): {round(original_size/1024,2)}KB -> {round(len(output_bytes)/1024,2)}KB ({compression_level} level)")
+            return {
+                "originalSize": original_size,
+                "compressedSize": len(output_bytes),
+                "data": output_bytes,
+                "compressionLevel": compression_level,
+                "compressionDescription": level_desc.get(compression_level, "Compression"),
+                "usedOriginal": used_original,
+            }
+
+        # Verify the header before storing; never store something that isn't a PDF
+        head = output_bytes[:8]
+        if not (head.startswith(b"%PDF") or head.lstrip()[:4] == b"%PDF"):
             output_bytes = pdf_bytes
             used_original = True
 
-        # Persist to disk (log sizes for debugging)
+        # Persist to storage (log sizes for debugging)
         print(f"[DEBUG] original_size={original_size} bytes; intended_output_size={len(output_bytes)} bytes")
-        with open(output_path, "wb") as f:
-            f.write(output_bytes)
+        with stage("disk_write"):
+            storage.write_bytes(COMPRESSED_PDFS, output_filename, output_bytes)
 
-        # Post-write safety: ensure on-disk file is not larger than original
+        # Post-write safety: ensure the stored file is not larger than original
         try:
-            written_size = os.path.getsize(output_path)
+            written_size = storage.size(COMPRESSED_PDFS, output_filename)
             print(f"[DEBUG] written_size_after_first_write={written_size} bytes")
-            if written_size > original_size:
+            if written_size is not None and written_size > original_size:
                 print("[DEBUG] written file larger than original — overwriting with original bytes")
-                # overwrite with original bytes
-                with open(output_path, "wb") as f:
-                    f.write(pdf_bytes)
+                storage.write_bytes(COMPRESSED_PDFS, output_filename, pdf_bytes)
                 output_bytes = pdf_bytes
                 used_original = True
                 print(f"[DEBUG] overwritten_with_original; final_size={len(output_bytes)} bytes")
@@ -223,17 +255,6 @@ async def compress_pdf(uploaded_file, output_folder=None, compression_level="med
             # If we can't stat or overwrite, keep the current output_bytes as-is
             print(f"[DEBUG] post-write safety check failed: {e}")
 
-        # Verify written file
-        try:
-            with open(output_path, "rb") as f:
-                head = f.read(8)
-                if not (head.startswith(b"%PDF") or head.lstrip()[:4] == b"%PDF"):
-                    raise Exception("Invalid PDF header after write")
-        except Exception:
-            with open(output_path, "wb") as f:
-                f.write(pdf_bytes)
-            output_bytes = pdf_bytes
-
         print(f"PDF pages: {doc.page_count}")
         print(f"PDF Compression: {round(original_size/1024,2)}KB -> {round(len(output_bytes)/1024,2)}KB ({compression_level} level)")
 
@@ -242,7 +263,7 @@ async def compress_pdf(uploaded_file, output_folder=None, compression_level="med
         return {
             "originalSize": original_size,
             "compressedSize": final_compressed_size,
-            "path": output_path,
+            "path": storage.location(COMPRESSED_PDFS, output_filename),
             "filename": output_filename,
             "compressionLevel": compression_level,
             "compressionDescription": level_desc.get(compression_level, "Compression"),
@@ -1,24 +1,36 @@
 import fitz  # PyMuPDF
-import os
 import uuid
-import time
 from .pdf_compressor import cleanup_all_temp_files
+from .resource_dedup import dedupe_resources
+from .metrics import record_bytes, stage
+from .progress import report
+from .storage import MERGED_PDFS, get_storage
 
-async def merge_pdfs(uploaded_files, output_folder="app/merged_pdfs"):
-    """Merge multiple PDF files into one"""
-    
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-    
-    # Auto-cleanup old files (older than 5 minutes) every time function is called
-    cleanup_all_temp_files()
-    
-    # Also cleanup merged PDFs folder
-    cleanup_old_files(output_folder, max_age_minutes=5)
+def merge_documents(merged_doc, source_docs):
+    """Append all pages of source_docs to merged_doc in memory and share duplicate resources.
+
+    Returns the resource dedup stats ({"duplicates", "bytesSaved"}).
+    """
+    pages_total = sum(source_doc.page_count for source_doc in source_docs)
+    for source_doc in source_docs:
+        merged_doc.insert_pdf(source_doc)
+        report("merge", merged_doc.page_count, pages_total)
+    report("dedupe")
+    return dedupe_resources(merged_doc)
+
+async def merge_pdfs(uploaded_files, inline=False):
+    """Merge multiple PDF files into one.
+
+    The result is written to artifact storage; with inline=True nothing is
+    stored and the result carries the bytes under "data".
+    """
+    storage = get_storage()
+    if not inline:
+        # Auto-cleanup old files (older than 5 minutes, merged PDFs included) every time function is called
+        cleanup_all_temp_files()
 
     file_id = str(uuid.uuid4())
     output_filename = f"merged_{file_id}.pdf"
-    output_path = os.path.join(output_folder, output_filename)
     
     merged_doc = None
     temp_docs = []
@@ -30,31 +42,55 @@ async def merge_pdfs(uploaded_files, output_folder="app/merged_pdfs"):
         
         # Process each uploaded file in order
         for uploaded_file in uploaded_files:
-            pdf_bytes = await uploaded_file.read()
+            with stage("upload_read"):
+                pdf_bytes = await uploaded_file.read()
             total_original_size += len(pdf_bytes)
             
             # Open the PDF from memory
-            temp_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            with stage("fitz_open"):
+                temp_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
             temp_docs.append(temp_doc)
-            
-            # Insert all pages from this PDF into the merged document
-            merged_doc.insert_pdf(temp_doc)
-        
-        # Save the merged PDF
-        merged_doc.save(output_path)
         
+        # Insert all pages, share identical images/fonts across inputs, then write compacted
+        dedup = merge_documents(merged_doc, temp_docs)
+        if inline:
+            with stage("tobytes"):
+                merged_bytes = merged_doc.tobytes(garbage=3, deflate=True)
+            record_bytes("merge_pdf", total_original_size, len(merged_bytes))
+            print(f"PDF Merge (inline): {len(uploaded_files)} files ({round(total_original_size/1024,2)}KB) -> {round(len(merged_bytes)/1024,2)}KB")
+            return {
+                "originalSize": round(total_original_size / 1024, 2),
+                "mergedSize": round(len(merged_bytes) / 1024, 2),
+                "originalBytes": total_original_size,
+                "data": merged_bytes,
+                "fileCount": len(uploaded_files),
+                "duplicateResources": dedup["duplicates"],
+                "dedupSavedBytes": dedup["bytesSaved"]
+            }
+        # Saved straight into storage, without building the whole output in memory first
+        with stage("disk_write"):
+            with storage.open_write(MERGED_PDFS, output_filename) as f:
+                merged_doc.save(f, garbage=3, deflate=True)
+        # PyMuPDF may write through the file's descriptor without moving the
+        # Python stream, so f.tell() isn't the size; ask storage instead
+        merged_bytes_size = storage.size(MERGED_PDFS, output_filename)
+
         # Calculate file sizes
-        merged_size = round(os.path.getsize(output_path) / 1024, 2)
+        record_bytes("merge_pdf", total_original_size, merged_bytes_size)
+        merged_size = round(merged_bytes_size / 1024, 2)
         original_size = round(total_original_size / 1024, 2)
         
-        print(f"PDF Merge: {len(uploaded_files)} files ({original_size}KB) -> {merged_size}KB")
+        print(f"PDF Merge: {len(uploaded_files)} files ({original_size}KB) -> {merged_size}KB, "
+              f"{dedup['duplicates']} duplicate resources shared ({round(dedup['bytesSaved']/1024,2)}KB)")
 
         return {
             "originalSize": original_size,
             "mergedSize": merged_size,
-            "path": output_path,
+            "path": storage.location(MERGED_PDFS, output_filename),
             "filename": output_filename,
-            "fileCount": len(uploaded_files)
+            "fileCount": len(uploaded_files),
+            "duplicateResources": dedup["duplicates"],
+            "dedupSavedBytes": dedup["bytesSaved"]
         }
 
     except Exception as e:
@@ -71,25 +107,3 @@ async def merge_pdfs(uploaded_files, output_folder="app/merged_pdfs"):
         # Close the merged document
         if merged_doc:
             merged_doc.close()
-
-def cleanup_old_files(folder_path, max_age_minutes=5):
-    """Remove files older than max_age_minutes from the specified folder"""
-    try:
-        if not os.path.exists(folder_path):
-            return
-        
-        current_time = time.time()
-        max_age_seconds = max_age_minutes * 60
-        
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            if os.path.isfile(file_path):
-                file_age = current_time - os.path.getctime(file_path)
-                if file_age > max_age_seconds:
-                    try:
-                        os.remove(file_path)
-                        print(f"Deleted old merged file: {filename}")
-                    except Exception as e:
-                        print(f"Could not delete {filename}: {e}")
-    except Exception as e:
-        print(f"Cleanup error: {e}")
@@ -1,48 +1,62 @@
 import fitz  # PyMuPDF
-import os
 import uuid
-import time
 import base64
 from io import BytesIO
 from .pdf_compressor import cleanup_all_temp_files
+from .page_selection import count_pages, parse_page_spec, select_document_pages, select_pages
+from .text_index import document_id, text_index_cache, text_preview
+from .metrics import record_bytes, stage
+from .progress import report
+from .storage import ORGANIZED_PDFS, get_storage
 
 class PDFOrganizer:
     def __init__(self):
         pass
     
-    def get_pdf_pages_for_organization(self, pdf_bytes):
-        """Extract page previews with metadata for organization"""
+    def get_pdf_pages_for_organization(self, pdf_bytes, include_text=False, doc_id=None):
+        """Extract page previews with metadata for organization.
+
+        Page text is only extracted when include_text is set; it is then stored in
+        the shared text index so later searches on the same document reuse it.
+        """
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            with stage("fitz_open"):
+                doc = fitz.open(stream=pdf_bytes, filetype="pdf")
             pages_data = []
+            text_index = None
+            if include_text:
+                text_index = text_index_cache.get_or_create(doc_id or document_id(pdf_bytes), len(doc))
             
             for page_num in range(len(doc)):
                 page = doc[page_num]
                 
                 # Create a matrix for scaling the page to thumbnail size
                 mat = fitz.Matrix(0.6, 0.6)  # Scale to 60% for better preview quality
-                pix = page.get_pixmap(matrix=mat)
+                with stage("preview_render"):
+                    pix = page.get_pixmap(matrix=mat)
                 
-                # Convert to PNG bytes
-                img_data = pix.tobytes("png")
+                    # Convert to PNG bytes
+                    img_data = pix.tobytes("png")
+                report("render", page_num + 1, len(doc))
                 
                 # Convert to base64 for frontend display
                 img_base64 = base64.b64encode(img_data).decode('utf-8')
                 
-                # Get page dimensions and text preview
+                # Get page dimensions
                 page_rect = page.rect
-                text_preview = page.get_text()[:100] + "..." if len(page.get_text()) > 100 else page.get_text()
                 
-                pages_data.append({
+                page_data = {
                     'id': f"page_{page_num}_{uuid.uuid4().hex[:8]}",  # Unique ID for drag-drop
                     'page_number': page_num + 1,  # 1-indexed for user display
                     'original_index': page_num,   # 0-indexed original position
                     'preview_image': f"data:image/png;base64,{img_base64}",
                     'width': int(page_rect.width),
                     'height': int(page_rect.height),
-                    'text_preview': text_preview.strip(),
                     'is_deleted': False
-                })
+                }
+                if text_index is not None:
+                    page_data['text_preview'] = text_preview(text_index.page_text(doc, page_num))
+                pages_data.append(page_data)
             
             doc.close()
             return pages_data
@@ -50,78 +64,91 @@ class PDFOrganizer:
         except Exception as e:
             raise Exception(f"Failed to generate page previews: {str(e)}")
     
-    def organize_pdf_pages(self, pdf_bytes, page_order, deleted_pages=None):
-        """Create a new PDF with pages in the specified order, excluding deleted pages.
+    def resolve_page_order(self, page_order, deleted_pages=None):
+        """Turn a page order plus deletions into the 0-indexed pages to keep, in order.
 
         Accepts flexible inputs:
         - page_order: list of dicts with 'original_index' and optional 'id', or list of ints (1-indexed page numbers)
         - deleted_pages: list of ids OR list of ints (1-indexed page numbers)
         """
-        try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            new_doc = fitz.open()  # Create new empty PDF
-
-            deleted_pages = deleted_pages or []
+        deleted_pages = deleted_pages or []
 
-            # Normalize deleted pages to a set of comparable tokens
-            deleted_id_set = set()
-            deleted_num_set = set()
-            for d in deleted_pages:
-                if isinstance(d, int):
-                    deleted_num_set.add(d)
-                elif isinstance(d, str) and d.isdigit():
-                    deleted_num_set.add(int(d))
-                else:
-                    deleted_id_set.add(d)
-
-            # Process pages in the specified order
-            for item in page_order:
-                # Derive original index (0-indexed) and a stable id
-                if isinstance(item, dict):
-                    original_index = item.get('original_index')
-                    page_number = item.get('page_number')
-                    page_id = item.get('id') or (f"page_{page_number}" if page_number else None)
-                    is_deleted_flag = bool(item.get('is_deleted', False))
-                    if original_index is None and page_number is not None:
-                        original_index = max(0, int(page_number) - 1)
-                else:
-                    # Treat as 1-indexed page number
-                    page_number = int(item)
-                    original_index = max(0, page_number - 1)
-                    page_id = f"page_{page_number}"
-                    is_deleted_flag = False
+        # Normalize deleted pages to a set of comparable tokens
+        deleted_id_set = set()
+        deleted_num_set = set()
+        for d in deleted_pages:
+            if isinstance(d, int):
+                deleted_num_set.add(d)
+            elif isinstance(d, str) and d.isdigit():
+                deleted_num_set.add(int(d))
+            else:
+                deleted_id_set.add(d)
 
-                # Skip deleted pages
-                if is_deleted_flag:
-                    continue
-                if page_id and page_id in deleted_id_set:
-                    continue
-                if (page_number is not None) and (page_number in deleted_num_set):
-                    continue
+        # Resolve the final page sequence
+        kept_indices = []
+        for item in page_order:
+            # Derive original index (0-indexed) and a stable id
+            if isinstance(item, dict):
+                original_index = item.get('original_index')
+                page_number = item.get('page_number')
+                page_id = item.get('id') or (f"page_{page_number}" if page_number else None)
+                is_deleted_flag = bool(item.get('is_deleted', False))
+                if original_index is None and page_number is not None:
+                    original_index = max(0, int(page_number) - 1)
+            else:
+                # Treat as 1-indexed page number
+                page_number = int(item)
+                original_index = max(0, page_number - 1)
+                page_id = f"page_{page_number}"
+                is_deleted_flag = False
 
-                # Validate page index
-                if isinstance(original_index, int) and 0 <= original_index < len(doc):
-                    new_doc.insert_pdf(doc, from_page=original_index, to_page=original_index)
+            # Skip deleted pages
+            if is_deleted_flag:
+                continue
+            if page_id and page_id in deleted_id_set:
+                continue
+            if (page_number is not None) and (page_number in deleted_num_set):
+                continue
 
-            # Get the PDF bytes
-            output_bytes = new_doc.write()
+            # Out-of-range indices are dropped by the selection engine
+            if isinstance(original_index, int):
+                kept_indices.append(original_index)
 
-            doc.close()
-            new_doc.close()
+        return kept_indices
 
-            return output_bytes
+    def organize_pdf_pages(self, pdf_bytes, page_order, deleted_pages=None):
+        """Create a new PDF with pages in the specified order, excluding deleted pages"""
+        try:
+            kept_indices = self.resolve_page_order(page_order, deleted_pages)
+            return select_pages(pdf_bytes, kept_indices)
 
         except Exception as e:
             raise Exception(f"Failed to organize PDF: {str(e)}")
 
-async def get_pdf_organization_preview(uploaded_file):
+    def organize_document(self, doc, page_order, deleted_pages=None):
+        """Reorder/delete pages of an open document in memory.
+
+        page_order and deleted_pages may also be compact range specs ("3,1-2").
+        Returns the resulting document, which may be a new object.
+        """
+        if isinstance(page_order, str):
+            page_order = parse_page_spec(page_order, doc.page_count)
+        if isinstance(deleted_pages, str):
+            deleted_pages = parse_page_spec(deleted_pages, doc.page_count) if deleted_pages.strip() else []
+        kept_indices = self.resolve_page_order(page_order, deleted_pages)
+        return select_document_pages(doc, kept_indices)
+
+async def get_pdf_organization_preview(uploaded_file, include_text=False):
     """Get PDF page previews for organization"""
     try:
-        pdf_bytes = await uploaded_file.read()
+        with stage("upload_read"):
+            pdf_bytes = await uploaded_file.read()
+        doc_id = document_id(pdf_bytes)
         organizer = PDFOrganizer()
-        pages_data = organizer.get_pdf_pages_for_organization(pdf_bytes)
+        pages_data = organizer.get_pdf_pages_for_organization(pdf_bytes, include_text=include_text, doc_id=doc_id)
         
         return {
+            'document_id': doc_id,
             'total_pages': len(pages_data),
             'pages': pages_data,
             'file_size': round(len(pdf_bytes) / 1024, 2),
@@ -131,22 +158,24 @@ async def get_pdf_organization_preview(uploaded_file):
     except Exception as e:
         raise Exception(f"Failed to process PDF for organization: {str(e)}")
 
-async def organize_pdf_pages(uploaded_file, page_order_data, deleted_pages_data=None, output_folder="app/organized_pdfs"):
-    """Organize PDF pages according to new order and deletions"""
-    
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-    
-    # Auto-cleanup old files
-    cleanup_all_temp_files()
-    cleanup_old_files(output_folder, max_age_minutes=5)
+async def organize_pdf_pages(uploaded_file, page_order_data, deleted_pages_data=None, inline=False):
+    """Organize PDF pages according to new order and deletions.
+
+    The result is written to artifact storage; with inline=True nothing is
+    stored and the result carries the bytes under "data".
+    """
+    storage = get_storage()
+    if not inline:
+        # Auto-cleanup old files
+        cleanup_all_temp_files()
+        storage.cleanup(ORGANIZED_PDFS, max_age_minutes=5)
 
     file_id = str(uuid.uuid4())
     output_filename = f"organized_{file_id}.pdf"
-    output_path = os.path.join(output_folder, output_filename)
     
     try:
-        pdf_bytes = await uploaded_file.read()
+        with stage("upload_read"):
+            pdf_bytes = await uploaded_file.read()
         original_size = len(pdf_bytes)  # bytes
 
         print(f"PDF size: {round(original_size/1024,2)}KB")  # Debug log
@@ -159,7 +188,8 @@ async def organize_pdf_pages(uploaded_file, page_order_data, deleted_pages_data=
         print(f"Raw page_order_data: {page_order_data}")  # Debug log
         print(f"Raw deleted_pages_data: {deleted_pages_data}")  # Debug log
 
-        # Parse inputs with robust fallbacks (JSON or CSV)
+        # Parse inputs with robust fallbacks (JSON or page ranges like "1-50,70,90-")
+        page_count = None
         try:
             # Parse page_order
             if isinstance(page_order_data, str):
@@ -167,8 +197,13 @@ async def organize_pdf_pages(uploaded_file, page_order_data, deleted_pages_data=
                     print(f"Parsing page_order_data as JSON string: {page_order_data[:200]}...")
                     parsed_page_order = json.loads(page_order_data)
                 except json.JSONDecodeError:
-                    print("page_order_data is not valid JSON. Trying CSV fallback...")
-                    parsed_page_order = [int(p.strip()) for p in page_order_data.split(',') if p.strip()]
+                    print("page_order_data is not valid JSON. Trying page range fallback...")
+                    page_count = count_pages(pdf_bytes)
+                    parsed_page_order = parse_page_spec(page_order_data, page_count)
+                if isinstance(parsed_page_order, int):
+                    # Bare "7" or "-5" decode as JSON numbers but are page ranges here
+                    page_count = count_pages(pdf_bytes)
+                    parsed_page_order = parse_page_spec(page_order_data, page_count)
             else:
                 parsed_page_order = page_order_data
 
@@ -178,8 +213,10 @@ async def organize_pdf_pages(uploaded_file, page_order_data, deleted_pages_data=
                     print(f"Parsing deleted_pages_data as JSON string: {deleted_pages_data}")
                     parsed_deleted_pages = json.loads(deleted_pages_data)
                 except json.JSONDecodeError:
-                    print("deleted_pages_data is not valid JSON. Trying CSV fallback...")
-                    parsed_deleted_pages = [int(p.strip()) for p in deleted_pages_data.split(',') if p.strip()]
+                    print("deleted_pages_data is not valid JSON. Trying page range fallback...")
+                    if page_count is None:
+                        page_count = count_pages(pdf_bytes)
+                    parsed_deleted_pages = parse_page_spec(deleted_pages_data, page_count)
             else:
                 parsed_deleted_pages = deleted_pages_data if deleted_pages_data else []
 
@@ -228,6 +265,7 @@ async def organize_pdf_pages(uploaded_file, page_order_data, deleted_pages_data=
         # Organize PDF
         organized_bytes = organizer.organize_pdf_pages(pdf_bytes, normalized_page_order, normalized_deleted)
         organized_size = len(organized_bytes)  # bytes
+        record_bytes("organize_pdf", original_size, organized_size)
         
         # Count remaining pages
         # Build deletion sets (ids and numbers)
@@ -255,16 +293,26 @@ async def organize_pdf_pages(uploaded_file, page_order_data, deleted_pages_data=
             remaining_pages += 1
         deleted_count = len(normalized_page_order) - remaining_pages
         
-        # Write the organized PDF to disk
-        with open(output_path, "wb") as f:
-            f.write(organized_bytes)
+        if inline:
+            return {
+                "originalSize": original_size,
+                "organizedSize": organized_size,
+                "data": organized_bytes,
+                "totalOriginalPages": len(normalized_page_order),
+                "remainingPages": remaining_pages,
+                "deletedPages": deleted_count
+            }
+
+        # Write the organized PDF to storage
+        with stage("disk_write"):
+            storage.write_bytes(ORGANIZED_PDFS, output_filename, organized_bytes)
         
         print(f"PDF Organization: {round(original_size/1024,2)}KB -> {round(organized_size/1024,2)}KB, {remaining_pages} pages kept, {deleted_count} pages deleted")
 
         return {
             "originalSize": original_size,
             "organizedSize": organized_size,
-            "path": output_path,
+            "path": storage.location(ORGANIZED_PDFS, output_filename),
             "filename": output_filename,
             "totalOriginalPages": len(normalized_page_order),
             "remainingPages": remaining_pages,
@@ -277,25 +325,3 @@ async def organize_pdf_pages(uploaded_file, page_order_data, deleted_pages_data=
         error_msg = str(e)
         print(f"PDF Organization Error: {error_msg}")
         raise Exception(f"PDF organization failed: {error_msg}")
-
-def cleanup_old_files(folder_path, max_age_minutes=5):
-    """Remove files older than max_age_minutes from the specified folder"""
-    try:
-        if not os.path.exists(folder_path):
-            return
-        
-        current_time = time.time()
-        max_age_seconds = max_age_minutes * 60
-        
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            if os.path.isfile(file_path):
-                file_age = current_time - os.path.getctime(file_path)
-                if file_age > max_age_seconds:
-                    try:
-                        os.remove(file_path)
-                        print(f"Deleted old organized file: {filename}")
-                    except Exception as e:
-                        print(f"Could not delete {filename}: {e}")
-    except Exception as e:
-        print(f"Cleanup error: {e}")
@@ -0,0 +1,195 @@
+import fitz  # PyMuPDF
+import uuid
+import time
+from .pdf_compressor import cleanup_all_temp_files, compress_pdf_document
+from .pdf_merger import merge_documents
+from .pdf_organizer import PDFOrganizer
+from .pdf_splitter import PDFSplitter
+from .page_selection import parse_page_spec, validate_page_spec
+from .metrics import record_bytes, stage
+from .storage import PIPELINE_PDFS, get_storage
+
+PIPELINE_OPERATIONS = ("organize", "split", "merge", "compress")
+MAX_PIPELINE_STEPS = 10
+
+
+class PipelineStepError(ValueError):
+    """A step's pages don't fit the document, e.g. none of them are in it"""
+
+
+def _is_page_number(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_page_entry(value):
+    """An organize page_order item: a page number or a dict from the organize preview"""
+    if _is_page_number(value):
+        return True
+    if not isinstance(value, dict):
+        return False
+    numbers = [value.get(key) for key in ("original_index", "page_number") if value.get(key) is not None]
+    return bool(numbers) and all(_is_page_number(n) for n in numbers)
+
+
+def _check_pages(number, name, value, is_item=_is_page_number):
+    """value must be a page range string ("1-3,5") or a non-empty list of accepted items"""
+    if isinstance(value, str):
+        try:
+            validate_page_spec(value)
+        except ValueError as e:
+            raise ValueError(f"Step {number}: {name}: {e}")
+    elif not isinstance(value, list) or not value or not all(is_item(item) for item in value):
+        raise ValueError(f"Step {number}: {name} must be a page range string like \"1-3,5\" or a list of page numbers")
+
+
+def validate_pipeline_steps(steps, file_count):
+    """Check a declarative step list before any file is read"""
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("steps must be a non-empty list")
+    if len(steps) > MAX_PIPELINE_STEPS:
+        raise ValueError(f"At most {MAX_PIPELINE_STEPS} steps are allowed")
+    for number, step in enumerate(steps, start=1):
+        if not isinstance(step, dict) or step.get("op") not in PIPELINE_OPERATIONS:
+            raise ValueError(f"Step {number}: op must be one of: {', '.join(PIPELINE_OPERATIONS)}")
+        op = step["op"]
+        if op == "organize":
+            if not step.get("page_order"):
+                raise ValueError(f"Step {number}: organize needs page_order")
+            _check_pages(number, "page_order", step["page_order"], _is_page_entry)
+            if step.get("deleted_pages"):
+                # Deleted pages may also be page ids from the organize preview
+                _check_pages(number, "deleted_pages", step["deleted_pages"], lambda d: _is_page_number(d) or isinstance(d, str))
+        if op == "split":
+            if not step.get("pages"):
+                raise ValueError(f"Step {number}: split needs pages")
+            _check_pages(number, "pages", step["pages"])
+        if op == "merge":
+            files = step.get("files", list(range(1, file_count)))
+            if not files or any(not isinstance(i, int) or not 1 <= i < file_count for i in files):
+                raise ValueError(f"Step {number}: merge files must be indexes of the extra uploads (1..{file_count - 1})")
+        if op == "compress" and step.get("level", "medium") not in ("light", "medium", "heavy"):
+            raise ValueError(f"Step {number}: compress level must be light, medium or heavy")
+
+
+def _apply_page_step(doc, step, organizer, splitter):
+    """Run an organize or split step on doc; returns the resulting document"""
+    if step["op"] == "organize":
+        return organizer.organize_document(doc, step["page_order"], step.get("deleted_pages"))
+    pages = step["pages"]
+    if isinstance(pages, str):
+        pages = parse_page_spec(pages, doc.page_count)
+    return splitter.split_document(doc, [p - 1 for p in pages])
+
+
+async def run_pdf_pipeline(uploaded_files, steps, inline=False):
+    """Run organize/split/merge/compress steps over one in-memory document.
+
+    The first upload is the working document; merge steps append other uploads
+    by index. Only the final result is written to artifact storage (or, with
+    inline=True, returned under "data"). Each step is timed.
+    """
+    storage = get_storage()
+    if not inline:
+        # Auto-cleanup old files
+        cleanup_all_temp_files()
+        storage.cleanup(PIPELINE_PDFS, max_age_minutes=5)
+
+    file_id = str(uuid.uuid4())
+    output_filename = f"pipeline_{file_id}.pdf"
+
+    validate_pipeline_steps(steps, len(uploaded_files))
+
+    timings = []
+    doc = None
+    try:
+        started = time.perf_counter()
+        with stage("upload_read"):
+            sources = [await f.read() for f in uploaded_files]
+        if not sources[0]:
+            raise Exception("Uploaded file is empty or unreadable")
+        with stage("fitz_open"):
+            doc = fitz.open(stream=sources[0], filetype="pdf")
+        timings.append({"step": 0, "op": "load", "ms": round((time.perf_counter() - started) * 1000, 2), "pages": doc.page_count})
+
+        organizer = PDFOrganizer()
+        splitter = PDFSplitter()
+        output_bytes = None  # set by a trailing compress step
+        used_original = False
+        dedup_saved = 0
+
+        for number, step in enumerate(steps, start=1):
+            op = step["op"]
+            step_started = time.perf_counter()
+            output_bytes = None
+
+            if op in ("organize", "split"):
+                try:
+                    result_doc = _apply_page_step(doc, step, organizer, splitter)
+                except ValueError as e:
+                    raise PipelineStepError(f"Step {number}: {e}")
+            elif op == "merge":
+                extra_docs = [fitz.open(stream=sources[i], filetype="pdf") for i in step.get("files", range(1, len(sources)))]
+                try:
+                    dedup_saved += merge_documents(doc, extra_docs)["bytesSaved"]
+                finally:
+                    for extra_doc in extra_docs:
+                        extra_doc.close()
+                result_doc = doc
+            else:  # compress
+                current_bytes = doc.tobytes(garbage=3, deflate=True)
+                output_bytes, used_original = compress_pdf_document(doc, current_bytes, step.get("level", "medium"))
+                # Later steps continue from the compressed result
+                result_doc = fitz.open(stream=output_bytes, filetype="pdf") if number < len(steps) else doc
+
+            if result_doc is not doc:
+                doc.close()
+                doc = result_doc
+            timings.append({"step": number, "op": op, "ms": round((time.perf_counter() - step_started) * 1000, 2), "pages": doc.page_count})
+
+        write_started = time.perf_counter()
+        if output_bytes is None:
+            output_bytes = doc.tobytes(garbage=3, deflate=True)
+        if not inline:
+            with stage("disk_write"):
+                storage.write_bytes(PIPELINE_PDFS, output_filename, output_bytes)
+        timings.append({"step": len(steps) + 1, "op": "write", "ms": round((time.perf_counter() - write_started) * 1000, 2), "pages": doc.page_count})
+
+        original_size = sum(len(b) for b in sources)
+        record_bytes("pipeline_pdf", original_size, len(output_bytes))
+        total_ms = round((time.perf_counter() - started) * 1000, 2)
+        print(f"PDF Pipeline: {' -> '.join(s['op'] for s in steps)}; {round(original_size/1024,2)}KB -> {round(len(output_bytes)/1024,2)}KB in {total_ms}ms")
+
+        if inline:
+            return {
+                "originalSize": original_size,
+                "outputSize": len(output_bytes),
+                "data": output_bytes,
+                "pageCount": doc.page_count,
+                "usedOriginal": used_original,
+                "dedupSavedBytes": dedup_saved,
+                "steps": timings,
+                "totalMs": total_ms
+            }
+
+        return {
+            "originalSize": original_size,
+            "outputSize": len(output_bytes),
+            "path": storage.location(PIPELINE_PDFS, output_filename),
+            "filename": output_filename,
+            "pageCount": doc.page_count,
+            "usedOriginal": used_original,
+            "dedupSavedBytes": dedup_saved,
+            "steps": timings,
+            "totalMs": total_ms,
+            "url": f"/download/pipeline/{output_filename}"
+        }
+
+    except PipelineStepError as e:
+        print(f"PDF Pipeline Error: {e}")
+        raise
+    except Exception as e:
+        print(f"PDF Pipeline Error: {e}")
+        raise Exception(f"PDF pipeline failed: {e}")
+    finally:
+        if doc is not None:
+            doc.close()
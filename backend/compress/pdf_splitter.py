@@ -1,10 +1,21 @@
 import fitz  # PyMuPDF
 import os
 import uuid
-import time
 import base64
+import json
+import re
+import zipfile
+import multiprocessing
+from contextlib import nullcontext
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from .pdf_compressor import cleanup_all_temp_files
+from .page_selection import count_pages, parse_page_spec, select_document_pages, select_pages
+from .text_index import document_id
+from .metrics import record_bytes, stage
+from .progress import report
+from .storage import SPLIT_PDFS, get_storage
 
 class PDFSplitter:
     def __init__(self):
@@ -13,7 +24,8 @@ class PDFSplitter:
     def get_pdf_pages_preview(self, pdf_bytes):
         """Extract page previews as base64 images"""
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            with stage("fitz_open"):
+                doc = fitz.open(stream=pdf_bytes, filetype="pdf")
             pages_data = []
             
             for page_num in range(len(doc)):
@@ -21,10 +33,12 @@ class PDFSplitter:
                 
                 # Create a matrix for scaling the page to thumbnail size
                 mat = fitz.Matrix(0.5, 0.5)  # Scale down to 50% for preview
-                pix = page.get_pixmap(matrix=mat)
+                with stage("preview_render"):
+                    pix = page.get_pixmap(matrix=mat)
                 
-                # Convert to PNG bytes
-                img_data = pix.tobytes("png")
+                    # Convert to PNG bytes
+                    img_data = pix.tobytes("png")
+                report("render", page_num + 1, len(doc))
                 
                 # Convert to base64 for frontend display
                 img_base64 = base64.b64encode(img_data).decode('utf-8')
@@ -49,36 +63,112 @@ class PDFSplitter:
     def split_pdf_by_pages(self, pdf_bytes, selected_pages):
         """Create a new PDF with only the selected pages"""
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            new_doc = fitz.open()  # Create new empty PDF
-            
-            # Sort selected pages to maintain order
+            # Sort selected pages to maintain order, then select them in one pass
             selected_pages_sorted = sorted(selected_pages)
-            
-            for page_index in selected_pages_sorted:
-                if 0 <= page_index < len(doc):
-                    # Insert the page into the new document
-                    new_doc.insert_pdf(doc, from_page=page_index, to_page=page_index)
-            
-            # Get the PDF bytes
-            output_bytes = new_doc.write()
-            
-            doc.close()
-            new_doc.close()
-            
-            return output_bytes
+            return select_pages(pdf_bytes, selected_pages_sorted)
             
         except Exception as e:
             raise Exception(f"Failed to split PDF: {str(e)}")
 
+    def split_document(self, doc, selected_pages):
+        """Keep only selected_pages (0-indexed) of an open document, in page order.
+
+        Returns the resulting document, which may be a new object.
+        """
+        return select_document_pages(doc, sorted(selected_pages))
+
+    def plan_split_parts(self, doc, mode, ranges=None, chunk_size=None, bookmark_level=1):
+        """Work out the page groups for a multi-output split.
+
+        Returns a list of (title, page_indices) tuples with 0-indexed pages:
+        - "ranges": one part per entry of ranges (page specs separated by ';' or newlines)
+        - "every": consecutive chunks of chunk_size pages
+        - "bookmarks": one part per outline entry at bookmark_level, plus parts for
+          the pages before them (front matter, or a shallower entry's own pages)
+        - "size": the whole document, to be cut down by the size limit only
+        """
+        page_count = doc.page_count
+        parts = []
+
+        if mode == "ranges":
+            specs = [r.strip() for r in re.split(r"[;\n]", ranges or "") if r.strip()]
+            if not specs:
+                raise Exception("At least one page range is required")
+            for spec in specs:
+                indices = [p - 1 for p in parse_page_spec(spec, page_count) if 1 <= p <= page_count]
+                if indices:
+                    parts.append((spec, indices))
+
+        elif mode == "every":
+            if not chunk_size or chunk_size < 1:
+                raise Exception("chunk_size must be a positive number of pages")
+            for start in range(0, page_count, chunk_size):
+                end = min(start + chunk_size, page_count)
+                parts.append((f"{start + 1}-{end}", list(range(start, end))))
+
+        elif mode == "bookmarks":
+            # Each outline entry at the requested level starts a part that runs until
+            # the next entry at the same or a shallower level. Pages a shallower entry
+            # owns before its first child at that level (a chapter's opening pages)
+            # become a part named after it, so the parts cover every page.
+            starts = []
+            for level, title, page in doc.get_toc(simple=True):
+                if level <= bookmark_level and 1 <= page <= page_count:
+                    starts.append((level, title, page - 1))
+            if not any(level == bookmark_level for level, _, _ in starts):
+                raise Exception(f"PDF has no bookmarks at level {bookmark_level}")
+            # In page order, so each part ends where the next one starts
+            starts.sort(key=lambda start: start[2])
+            if starts[0][2] > 0:
+                parts.append(("Front matter", list(range(0, starts[0][2]))))
+            for i, (level, title, first) in enumerate(starts):
+                last = starts[i + 1][2] if i + 1 < len(starts) else page_count
+                if level == bookmark_level:
+                    parts.append((title or f"Section {len(parts) + 1}", list(range(first, max(last, first + 1)))))
+                elif last > first:
+                    parts.append((title or f"Section {len(parts) + 1}", list(range(first, last))))
+
+        elif mode == "size":
+            parts.append(("document", list(range(page_count))))
+
+        else:
+            raise Exception(f"Unknown split mode: {mode}")
+
+        if not parts:
+            raise Exception("The split did not select any pages")
+        return parts
+
+# Source PDF bytes for split worker processes, sent once per worker instead of once per part
+_worker_pdf_bytes = None
+
+def _init_split_worker(pdf_bytes):
+    global _worker_pdf_bytes
+    _worker_pdf_bytes = pdf_bytes
+
+def _build_split_part(pdf_bytes, page_indices, max_bytes=None):
+    """Build one output of a multi-output split, halving it until it fits max_bytes.
+
+    pdf_bytes is None in split worker processes, which hold the source already.
+    Returns a list of (page_indices, pdf_bytes) pieces. A single page that is
+    still over the limit is returned as-is.
+    """
+    data = select_pages(pdf_bytes if pdf_bytes is not None else _worker_pdf_bytes, page_indices)
+    if not max_bytes or len(data) <= max_bytes or len(page_indices) == 1:
+        return [(page_indices, data)]
+    middle = len(page_indices) // 2
+    return (_build_split_part(pdf_bytes, page_indices[:middle], max_bytes)
+            + _build_split_part(pdf_bytes, page_indices[middle:], max_bytes))
+
 async def get_pdf_pages(uploaded_file):
     """Get PDF page previews for selection"""
     try:
-        pdf_bytes = await uploaded_file.read()
+        with stage("upload_read"):
+            pdf_bytes = await uploaded_file.read()
         splitter = PDFSplitter()
         pages_data = splitter.get_pdf_pages_preview(pdf_bytes)
         
         return {
+            'document_id': document_id(pdf_bytes),
             'total_pages': len(pages_data),
             'pages': pages_data,
             'file_size': round(len(pdf_bytes) / 1024, 2)
@@ -87,37 +177,60 @@ async def get_pdf_pages(uploaded_file):
     except Exception as e:
         raise Exception(f"Failed to process PDF: {str(e)}")
 
-async def split_pdf_pages(uploaded_file, selected_pages, output_folder="app/split_pdfs"):
-    """Split PDF and return new file with selected pages"""
+async def split_pdf_pages(uploaded_file, selected_pages, inline=False):
+    """Split PDF and return new file with selected pages.
 
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    # Auto-cleanup old files
-    cleanup_all_temp_files()
-    cleanup_old_files(output_folder, max_age_minutes=5)
+    selected_pages is a list of 1-indexed page numbers or a compact range spec like "1-50,70,90-".
+    The result is written to artifact storage; with inline=True nothing is
+    stored and the result carries the bytes under "data".
+    """
+    storage = get_storage()
+    if not inline:
+        # Auto-cleanup old files
+        cleanup_all_temp_files()
+        storage.cleanup(SPLIT_PDFS, max_age_minutes=5)
 
     file_id = str(uuid.uuid4())
     output_filename = f"split_{file_id}.pdf"
-    output_path = os.path.join(output_folder, output_filename)
 
     try:
-        pdf_bytes = await uploaded_file.read()
+        with stage("upload_read"):
+            pdf_bytes = await uploaded_file.read()
         original_size = len(pdf_bytes)  # bytes
 
         # Initialize PDF splitter
         splitter = PDFSplitter()
 
+        # Expand range syntax now that the page count is known, dropping pages the document lacks
+        total_pages = count_pages(pdf_bytes)
+        if isinstance(selected_pages, str):
+            selected_pages = parse_page_spec(selected_pages, total_pages)
+        else:
+            selected_pages = [page for page in selected_pages if 1 <= page <= total_pages]
+        if not selected_pages:
+            raise ValueError(f"None of the selected pages are in the document (it has {total_pages} pages)")
+
         # Convert selected pages from 1-indexed to 0-indexed
         selected_indices = [page - 1 for page in selected_pages]
 
         # Split PDF
         split_bytes = splitter.split_pdf_by_pages(pdf_bytes, selected_indices)
         split_size = len(split_bytes)  # bytes
+        record_bytes("split_pdf", original_size, split_size)
+
+        if inline:
+            return {
+                "originalSize": original_size,
+                "splitSize": split_size,
+                "data": split_bytes,
+                "selectedPages": len(selected_pages),
+                "totalPages": len(selected_pages),
+                "pageNumbers": selected_pages
+            }
 
-        # Write the split PDF to disk
-        with open(output_path, "wb") as f:
-            f.write(split_bytes)
+        # Write the split PDF to storage
+        with stage("disk_write"):
+            storage.write_bytes(SPLIT_PDFS, output_filename, split_bytes)
 
         print(
             f"PDF Split: {round(original_size/1024,2)}KB -> {round(split_size/1024,2)}KB, {len(selected_pages)} pages selected"
@@ -126,7 +239,7 @@ async def split_pdf_pages(uploaded_file, selected_pages, output_folder="app/spli
         return {
             "originalSize": original_size,
             "splitSize": split_size,
-            "path": output_path,
+            "path": storage.location(SPLIT_PDFS, output_filename),
             "filename": output_filename,
             "selectedPages": len(selected_pages),
             "totalPages": len(selected_pages),  # For consistency with other operations
@@ -134,29 +247,123 @@ async def split_pdf_pages(uploaded_file, selected_pages, output_folder="app/spli
             "url": f"/download/split/{output_filename}"
         }
 
+    except ValueError:
+        # A page selection that doesn't fit the document: the client's to fix
+        raise
     except Exception as e:
         error_msg = str(e)
         print(f"PDF Split Error: {error_msg}")
         raise Exception(f"PDF splitting failed: {error_msg}")
 
-def cleanup_old_files(folder_path, max_age_minutes=5):
-    """Remove files older than max_age_minutes from the specified folder"""
+async def split_pdf_multi(uploaded_file, mode, ranges=None, chunk_size=None, bookmark_level=1,
+                          max_size_kb=None, max_workers=1, inline=False):
+    """Split one PDF into many outputs and package them as a ZIP with a manifest.
+
+    The upload is read and planned once; parts are built in up to max_workers
+    processes (PyMuPDF is not thread-safe; callers pass the CPU slots
+    admission charged for the request) and streamed into the ZIP in storage
+    in plan order. With inline=True the ZIP is built in memory and returned
+    under "data".
+    """
+    storage = get_storage()
+    if not inline:
+        # Auto-cleanup old files
+        cleanup_all_temp_files()
+        storage.cleanup(SPLIT_PDFS, max_age_minutes=5)
+
+    file_id = str(uuid.uuid4())
+    output_filename = f"split_{file_id}.zip"
+
     try:
-        if not os.path.exists(folder_path):
-            return
-        
-        current_time = time.time()
-        max_age_seconds = max_age_minutes * 60
-        
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            if os.path.isfile(file_path):
-                file_age = current_time - os.path.getctime(file_path)
-                if file_age > max_age_seconds:
-                    try:
-                        os.remove(file_path)
-                        print(f"Deleted old split file: {filename}")
-                    except Exception as e:
-                        print(f"Could not delete {filename}: {e}")
+        with stage("upload_read"):
+            pdf_bytes = await uploaded_file.read()
+        original_size = len(pdf_bytes)  # bytes
+
+        with stage("fitz_open"):
+            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        try:
+            total_pages = doc.page_count
+            parts = PDFSplitter().plan_split_parts(doc, mode, ranges, chunk_size, bookmark_level)
+        finally:
+            doc.close()
+
+        max_bytes = int(max_size_kb * 1024) if max_size_kb else None
+        base_name = os.path.splitext(os.path.basename(uploaded_file.filename or "document"))[0].replace(" ", "_")
+
+        def built_parts():
+            done = 0
+            workers = min(max_workers, len(parts))
+            if workers > 1:
+                try:
+                    # spawn, not fork: the lane worker running this has threads of its own
+                    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_split_worker, initargs=(pdf_bytes,)) as pool:
+                        # map() yields in submission order, so the ZIP is deterministic
+                        for pieces in pool.map(_build_split_part, [None] * len(parts), [idx for _, idx in parts],
+                                               [max_bytes] * len(parts)):
+                            done += 1
+                            yield pieces
+                    return
+                except (OSError, NotImplementedError, BrokenProcessPool) as e:
+                    # Some sandboxes can't spawn processes; building in-process is slower but correct
+                    print(f"Split worker pool unavailable ({e}), building remaining parts in-process")
+            for _, idx in parts[done:]:
+                yield _build_split_part(pdf_bytes, idx, max_bytes)
+
+        manifest = []
+        writer = nullcontext(BytesIO()) if inline else storage.open_write(SPLIT_PDFS, output_filename)
+        with writer as zip_target:
+            with zipfile.ZipFile(zip_target, "w", compression=zipfile.ZIP_STORED) as zf:
+                for (title, _), pieces in zip(parts, built_parts()):
+                    for piece_indices, piece_bytes in pieces:
+                        safe_title = re.sub(r"[^A-Za-z0-9._-]+", "_", title).strip("_")[:60] or "part"
+                        name = f"{base_name}_{len(manifest) + 1:03d}_{safe_title}.pdf"
+                        zf.writestr(name, piece_bytes)
+                        manifest.append({
+                            "file": name,
+                            "title": title,
+                            "pages": [i + 1 for i in piece_indices],
+                            "pageCount": len(piece_indices),
+                            "size": len(piece_bytes),
+                            "overSizeLimit": bool(max_bytes and len(piece_bytes) > max_bytes),
+                        })
+                zf.writestr("manifest.json", json.dumps({
+                    "source": uploaded_file.filename,
+                    "mode": mode,
+                    "totalPages": total_pages,
+                    "files": manifest,
+                }, indent=2))
+            zip_size = zip_target.tell()
+
+        if inline:
+            zip_bytes = zip_target.getvalue()
+            record_bytes("split_pdf_multi", original_size, len(zip_bytes))
+            return {
+                "originalSize": original_size,
+                "zipSize": len(zip_bytes),
+                "data": zip_bytes,
+                "fileCount": len(manifest),
+                "totalPages": total_pages,
+                "mode": mode,
+                "files": manifest
+            }
+
+        record_bytes("split_pdf_multi", original_size, zip_size)
+        print(f"PDF Multi-Split: {round(original_size/1024,2)}KB -> {len(manifest)} files, {round(zip_size/1024,2)}KB ZIP ({mode})")
+
+        return {
+            "originalSize": original_size,
+            "zipSize": zip_size,
+            "path": storage.location(SPLIT_PDFS, output_filename),
+            "filename": output_filename,
+            "fileCount": len(manifest),
+            "totalPages": total_pages,
+            "mode": mode,
+            "files": manifest,
+            "url": f"/download/split/{output_filename}"
+        }
+
     except Exception as e:
-        print(f"Cleanup error: {e}")
+        error_msg = str(e)
+        print(f"PDF Multi-Split Error: {error_msg}")
+        raise Exception(f"PDF splitting failed: {error_msg}")
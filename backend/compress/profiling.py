@@ -0,0 +1,232 @@
+import cProfile
+import contextvars
+import hmac
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from .storage import DEFAULT_ROOT, cleanup_old_files
+
+# Operator-only switches. Nothing is profiled unless a secret is configured.
+PROFILE_SECRET = os.environ.get("CHHOTIPDF_PROFILE_SECRET", "")
+PROFILE_SAMPLE_PERCENT = float(os.environ.get("CHHOTIPDF_PROFILE_SAMPLE_PERCENT", "0"))
+PROFILE_SLOW_MS = float(os.environ.get("CHHOTIPDF_PROFILE_SLOW_MS", "0"))
+PROFILE_DIR = os.path.join(DEFAULT_ROOT, "profiles")
+PROFILE_HEADER = "X-Profile-Secret"
+
+# Profiler of the request being handled, for the lane its operation runs on
+_active = contextvars.ContextVar("active_profiler", default=None)
+
+
+def profiling_enabled():
+    return bool(PROFILE_SECRET)
+
+
+def secret_matches(value):
+    return bool(PROFILE_SECRET) and hmac.compare_digest((value or "").encode(), PROFILE_SECRET.encode())
+
+
+def profile_mode(headers):
+    """How to profile a request: "requested" (header), "sampled", "slow" (watch only) or None"""
+    if not profiling_enabled():
+        return None
+    if secret_matches(headers.get(PROFILE_HEADER)):
+        return "requested"
+    if PROFILE_SAMPLE_PERCENT > 0 and random.random() * 100 < PROFILE_SAMPLE_PERCENT:
+        return "sampled"
+    if PROFILE_SLOW_MS > 0:
+        return "slow"
+    return None
+
+
+class StackSampler:
+    """Low-overhead sampling profiler for one thread.
+
+    A background thread records the target thread's stack every interval and
+    keeps folded stacks ("outer;inner count"), the input format of flame graph tools.
+    """
+
+    def __init__(self, thread_id, interval=0.01):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+class _StatsDump:
+    """cProfile stats sent back from a lane worker, in the shape pstats.Stats loads"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class RequestProfiler:
+    """Profile one request; cProfile for requested/sampled runs, stack sampling for slow-watch.
+
+    Operations run on lane workers, which profile the run themselves and
+    send the result back (merge()), so the saved profile covers both the
+    event loop and the operation.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.profile = None
+        self.sampler = None
+        self.worker_stats = []
+        self._token = None
+
+    def _begin(self):
+        """Profile the current thread"""
+        if self.mode == "slow":
+            self.sampler = StackSampler(threading.get_ident()).start()
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            self.profile = profile
+        except ValueError:
+            # Python 3.12+ allows one cProfile per process, and the one already
+            # running sees every thread, this one included
+            pass
+
+    def _end(self):
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def start(self):
+        # Note: cProfile sees everything on the event loop thread while enabled,
+        # including other requests interleaved with this one
+        self._begin()
+        self._token = _active.set(self)
+        return self
+
+    def stop(self):
+        self._end()
+        if self._token is not None:
+            _active.reset(self._token)
+            self._token = None
+
+    def captured(self):
+        """This thread's profile in picklable form, to send back from a lane worker"""
+        if self.profile is not None:
+            self.profile.create_stats()
+            return {"stats": self.profile.stats}
+        if self.sampler is not None:
+            return {"samples": dict(self.sampler.samples)}
+        return {}
+
+    def merge(self, captured):
+        """Add a lane worker's profile of this request's operation"""
+        if "stats" in captured:
+            self.worker_stats.append(captured["stats"])
+        if "samples" in captured and self.sampler is not None:
+            self.sampler.samples.update(captured["samples"])
+
+    def save(self, metadata):
+        """Write the profile artifact plus a JSON sidecar with the request parameters; returns its id (None if nothing was profiled)"""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        cleanup_old_files(PROFILE_DIR, max_age_minutes=24 * 60)
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        profiles = ([self.profile] if self.profile is not None else []) + [_StatsDump(stats) for stats in self.worker_stats]
+        if profiles:
+            artifact = f"{profile_id}.prof"
+            pstats.Stats(*profiles).dump_stats(os.path.join(PROFILE_DIR, artifact))
+        elif self.sampler is not None:
+            artifact = f"{profile_id}.folded"
+            with open(os.path.join(PROFILE_DIR, artifact), "w") as f:
+                f.write(self.sampler.folded())
+        else:
+            return None
+        metadata = dict(metadata, id=profile_id, kind=self.mode, artifact=artifact, created=time.time())
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as f:
+            json.dump(metadata, f, indent=2)
+        print(f"Profile saved: {artifact} ({self.mode}, {metadata.get('duration_ms')}ms {metadata.get('path')})")
+        return profile_id
+
+
+def active_profiler():
+    """The RequestProfiler of the request being handled, or None"""
+    return _active.get()
+
+
+@contextmanager
+def profiling_operation(mode):
+    """Profile the operation run inside the block on this thread (a lane worker).
+
+    Yields a dict that holds the picklable profile once the block exits,
+    for RequestProfiler.merge(); it stays empty when mode is None.
+    """
+    captured = {}
+    if mode is None:
+        yield captured
+        return
+    profiler = RequestProfiler(mode)
+    profiler._begin()
+    try:
+        yield captured
+    finally:
+        profiler._end()
+        captured.update(profiler.captured())
+
+
+def should_keep(mode, duration_ms):
+    """Requested and sampled profiles are always kept; slow-watch ones only over the threshold"""
+    return mode != "slow" or duration_ms >= PROFILE_SLOW_MS
+
+
+def list_profiles():
+    """Metadata of stored profiles, newest first"""
+    if not os.path.exists(PROFILE_DIR):
+        return []
+    profiles = []
+    for filename in os.listdir(PROFILE_DIR):
+        if filename.endswith(".json"):
+            try:
+                with open(os.path.join(PROFILE_DIR, filename)) as f:
+                    profiles.append(json.load(f))
+            except Exception:
+                continue
+    return sorted(profiles, key=lambda p: p.get("created", 0), reverse=True)
+
+
+def profile_artifact_path(profile_id):
+    """Path of a stored profile artifact, or None. profile_id is matched against stored metadata only."""
+    for profile in list_profiles():
+        if profile.get("id") == profile_id:
+            path = os.path.join(PROFILE_DIR, profile["artifact"])
+            return path if os.path.exists(path) else None
+    return None
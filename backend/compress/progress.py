@@ -0,0 +1,243 @@
+"""Progress events for long-running operations.
+
+Operations call report() from their page and image loops. It does nothing
+unless the request carried a progress id; the client then follows the
+operation on GET /progress/{id} (Server-Sent Events). Events are throttled
+to one per PROGRESS_INTERVAL seconds per operation and reach the server
+process directly from lane threads, or through a multiprocessing queue from
+bulk-lane worker processes.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+PROGRESS_INTERVAL = float(os.environ.get("CHHOTIPDF_PROGRESS_INTERVAL", "0.25"))
+# Finished (or never started) operations are forgotten after this long
+PROGRESS_TTL_SECONDS = 300
+# Comment line sent on idle streams, so proxies don't close them
+KEEPALIVE_SECONDS = 15
+PROGRESS_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+class _Current(threading.local):
+    reporter = None
+
+
+# Reporter of the operation running on this thread (lane threads run several at once)
+_current = _Current()
+
+# Server side of the queue bulk-lane workers send events on, and its worker
+# side (set in worker processes by init_worker)
+_server_queue = None
+_worker_queue = None
+
+
+def valid_progress_id(progress_id):
+    return bool(progress_id) and PROGRESS_ID_PATTERN.match(progress_id) is not None
+
+
+class Reporter:
+    """Progress of one operation; report() forwards updates here while it is installed"""
+
+    def __init__(self, progress_id, operation):
+        self.progress_id = progress_id
+        self.operation = operation
+        self.started = time.monotonic()
+        self.phase = None
+        # Time and pages done at the phase's first report, for the rate
+        self.phase_started = self.started
+        self.phase_pages = 0
+        self.last_sent = 0.0
+        self.counters = {}
+
+    def update(self, phase, pages_done=None, pages_total=None, images_done=None, bytes_saved=None):
+        now = time.monotonic()
+        new_phase = phase != self.phase
+        if new_phase:
+            self.phase, self.phase_started, self.phase_pages = phase, now, pages_done or 0
+        if images_done is not None:
+            self.counters["imagesDone"] = images_done
+        if bytes_saved is not None:
+            self.counters["bytesSaved"] = bytes_saved
+        finished_phase = pages_total is not None and pages_done == pages_total
+        if not (new_phase or finished_phase or now - self.last_sent >= PROGRESS_INTERVAL):
+            return
+        self.last_sent = now
+        eta_ms = None
+        if pages_total is not None and pages_done == pages_total:
+            eta_ms = 0
+        elif pages_total and pages_done and pages_done > self.phase_pages:
+            # Rate so far in this phase, applied to the pages left in it
+            eta_ms = round((now - self.phase_started) / (pages_done - self.phase_pages) * (pages_total - pages_done) * 1000)
+        _deliver(self.progress_id, dict(
+            self.counters,
+            operation=self.operation,
+            status="running",
+            phase=phase,
+            pagesDone=pages_done,
+            pagesTotal=pages_total,
+            elapsedMs=round((now - self.started) * 1000),
+            etaMs=eta_ms,
+        ))
+
+
+def report(phase, pages_done=None, pages_total=None, images_done=None, bytes_saved=None):
+    """Report progress of the running operation (a no-op when nobody asked for progress)"""
+    reporter = _current.reporter
+    if reporter is not None:
+        reporter.update(phase, pages_done, pages_total, images_done, bytes_saved)
+
+
+@contextmanager
+def reporting(progress_id, operation):
+    """Install a Reporter for the operation running on this thread (none without a progress id).
+
+    On exit the run's final event (done, or failed with the error) is sent the
+    same way as its progress events, so it can't overtake them.
+    """
+    _current.reporter = Reporter(progress_id, operation) if progress_id else None
+    error = None
+    try:
+        yield _current.reporter
+    except BaseException as e:
+        error = str(e) or type(e).__name__
+        raise
+    finally:
+        _current.reporter = None
+        if progress_id:
+            _deliver(progress_id, {"operation": operation, "error": error}, final=True)
+
+
+def _deliver(progress_id, event, final=False):
+    if _worker_queue is not None:
+        _worker_queue.put((progress_id, event, final))
+    else:
+        _dispatch(progress_id, event, final)
+
+
+def _dispatch(progress_id, event, final):
+    if final:
+        hub.finish(progress_id, event["operation"], error=event["error"])
+    else:
+        hub.publish(progress_id, event)
+
+
+def worker_queue():
+    """Queue bulk-lane worker processes send events on; created (with its reader thread) on first use"""
+    global _server_queue
+    if _server_queue is None:
+        _server_queue = multiprocessing.get_context("spawn").Queue()
+        threading.Thread(target=_read_worker_events, args=(_server_queue,), name="progress-reader", daemon=True).start()
+    return _server_queue
+
+
+def _read_worker_events(queue):
+    while True:
+        try:
+            _dispatch(*queue.get())
+        except Exception as e:
+            print(f"Progress reader error: {e}")
+
+
+def init_worker(queue):
+    """ProcessPoolExecutor initializer for bulk-lane workers"""
+    global _worker_queue
+    _worker_queue = queue
+
+
+class ProgressHub:
+    """Latest event per progress id and the streams following it (server process only)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def _channel(self, progress_id):
+        channel = self._channels.get(progress_id)
+        if channel is None:
+            channel = self._channels[progress_id] = {
+                "event": None, "finished": False, "queued": time.monotonic(), "updated": time.monotonic(), "subscribers": [],
+            }
+        return channel
+
+    def _prune(self):
+        cutoff = time.monotonic() - PROGRESS_TTL_SECONDS
+        for progress_id in [key for key, channel in self._channels.items() if not channel["subscribers"] and channel["updated"] < cutoff]:
+            del self._channels[progress_id]
+
+    def publish(self, progress_id, event, final=False):
+        """Record and fan out an event; thread-safe. Events after the final one are dropped."""
+        with self._lock:
+            channel = self._channel(progress_id)
+            if channel["finished"]:
+                return
+            channel["event"] = event
+            channel["finished"] = final
+            channel["updated"] = time.monotonic()
+            subscribers = list(channel["subscribers"])
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                pass  # the stream's loop is closed
+
+    def queued(self, progress_id, operation):
+        """First event of a run; a progress id may be reused once its previous run finished"""
+        with self._lock:
+            channel = self._channel(progress_id)
+            channel["finished"] = False
+            channel["queued"] = time.monotonic()
+        self.publish(progress_id, {"operation": operation, "status": "queued", "phase": "queued"})
+
+    def finish(self, progress_id, operation, error=None):
+        with self._lock:
+            channel = self._channel(progress_id)
+            last = dict(channel["event"] or {})
+            # Including the time spent queued for admission and a lane worker
+            total_ms = round((time.monotonic() - channel["queued"]) * 1000)
+        last.update(operation=operation, status="failed" if error else "done", etaMs=0, totalMs=total_ms)
+        if error:
+            last["error"] = error
+        self.publish(progress_id, last, final=True)
+
+    async def follow(self, progress_id):
+        """Yield the latest event, then each new one, until the operation finishes"""
+        queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._prune()
+            channel = self._channel(progress_id)
+            channel["subscribers"].append(subscriber)
+            if channel["event"] is not None:
+                queue.put_nowait(channel["event"])
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+                if event.get("status") in ("done", "failed"):
+                    return
+        finally:
+            with self._lock:
+                channel["subscribers"].remove(subscriber)
+                channel["updated"] = time.monotonic()
+
+
+hub = ProgressHub()
+
+
+async def event_stream(progress_id):
+    """Server-Sent Events for one progress id"""
+    async for event in hub.follow(progress_id):
+        if event is None:
+            yield ": keepalive\n\n"
+        else:
+            yield f"event: {event['status']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,158 @@
+import hashlib
+import re
+
+# Indirect reference inside an object definition, e.g. "12 0 R"
+_REF = re.compile(r"(?<![\w./#])(\d+) (\d+) R\b")
+_LENGTH = re.compile(r"/Length\s+\d+(\s+0\s+R)?")
+# Literal strings are scanned by hand (they nest and escape parentheses);
+# hex strings are one token
+_HEX_STRING = re.compile(r"<[0-9A-Fa-f\s]*>")
+
+
+def _sub_refs(text, replace):
+    """Apply replace(match) to each indirect reference in PDF object syntax,
+    leaving the contents of literal and hex strings untouched"""
+    out = []
+    start = i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "(":
+            end, depth = i + 1, 1
+            while end < len(text) and depth:
+                if text[end] == "\\":
+                    end += 1
+                elif text[end] == "(":
+                    depth += 1
+                elif text[end] == ")":
+                    depth -= 1
+                end += 1
+        elif char == "<" and not text.startswith("<<", i) and (match := _HEX_STRING.match(text, i)):
+            end = match.end()
+        else:
+            i += 2 if text.startswith("<<", i) else 1
+            continue
+        out.append(_REF.sub(replace, text[start:i]))
+        out.append(text[i:end])
+        start = i = end
+    out.append(_REF.sub(replace, text[start:]))
+    return "".join(out)
+
+
+def _remap_refs(text, remap):
+    def replace(match):
+        target = remap.get(int(match.group(1)))
+        return match.group(0) if target is None else f"{target} 0 R"
+    return _sub_refs(text, replace)
+
+
+def _resource_stream_xrefs(doc):
+    """Xrefs of image XObjects and embedded font programs"""
+    image_xrefs = []
+    font_xrefs = set()
+    for xref in range(1, doc.xref_length()):
+        try:
+            if doc.xref_is_stream(xref):
+                if doc.xref_get_key(xref, "Subtype")[1] == "/Image":
+                    image_xrefs.append(xref)
+            elif doc.xref_get_key(xref, "Type")[1] == "/FontDescriptor":
+                for key in ("FontFile", "FontFile2", "FontFile3"):
+                    kind, value = doc.xref_get_key(xref, key)
+                    if kind == "xref":
+                        font_xrefs.add(int(value.split()[0]))
+        except Exception:
+            continue
+    return image_xrefs + sorted(font_xrefs)
+
+
+def _content_key(doc, xref, memo, depth=0):
+    """Hash of an object's definition and raw stream, with references replaced by
+    the hashes of what they point to, so copies of an image whose colour space or
+    soft mask live in different objects still compare equal."""
+    if xref in memo:
+        return memo[xref]
+    if depth > 4:
+        return f"xref{xref}"
+    memo[xref] = f"xref{xref}"  # guards against reference cycles
+    definition = _LENGTH.sub("", doc.xref_object(xref, compressed=True))
+    definition = _sub_refs(definition, lambda m: _content_key(doc, int(m.group(1)), memo, depth + 1))
+    digest = hashlib.sha256(definition.encode("utf-8", "replace"))
+    if doc.xref_is_stream(xref):
+        digest.update(doc.xref_stream_raw(xref) or b"")
+    memo[xref] = digest.hexdigest()
+    return memo[xref]
+
+
+def _remap_object(doc, xref, remap):
+    """Point every reference in one object at its canonical copy.
+
+    Dictionaries (streams included, so their data is left as it is) are
+    updated key by key through the xref key API; nested dictionaries and
+    arrays are rewritten whole with string contents preserved. Objects that
+    aren't dictionaries (e.g. a colour space array) are rewritten whole.
+    """
+    keys = doc.xref_get_keys(xref)
+    if not keys:
+        if not doc.xref_is_stream(xref):
+            definition = doc.xref_object(xref, compressed=True)
+            new_definition = _remap_refs(definition, remap)
+            if new_definition != definition:
+                doc.update_object(xref, new_definition)
+        return
+    for key in keys:
+        kind, value = doc.xref_get_key(xref, key)
+        if kind not in ("xref", "dict", "array"):
+            continue
+        new_value = _remap_refs(value, remap)
+        if new_value != value:
+            doc.xref_set_key(xref, key, new_value)
+
+
+def _duplicate_streams(doc):
+    """Map of duplicate image/font stream xref -> the first copy's xref"""
+    remap = {}
+    seen = {}
+    memo = {}
+    for xref in _resource_stream_xrefs(doc):
+        try:
+            key = _content_key(doc, xref, memo)
+        except Exception:
+            continue
+        canonical = seen.setdefault(key, xref)
+        if canonical != xref:
+            remap[xref] = canonical
+    return remap
+
+
+def _saved_size(doc):
+    # Serialized the way merge and pipeline outputs are saved
+    return len(doc.tobytes(garbage=3, deflate=True))
+
+
+def dedupe_resources(doc):
+    """Point duplicate image and font streams of a document at one shared object.
+
+    Meant for documents assembled from several inputs (merges), where each
+    copy of a shared letterhead image or font is stored again. References to
+    duplicates (including soft masks, masks and nested resource dictionaries)
+    are rewritten to the first copy; the orphaned copies are dropped when the
+    document is saved with garbage collection.
+
+    Returns {"duplicates": count, "bytesSaved": how much smaller the saved
+    document is}. When duplicates are found the document is serialized
+    before and after the rewrite to measure that.
+    """
+    if not _duplicate_streams(doc):
+        return {"duplicates": 0, "bytesSaved": 0}
+
+    size_before = _saved_size(doc)
+    # Saving with garbage collection renumbers the objects, so look again
+    remap = _duplicate_streams(doc)
+    for xref in range(1, doc.xref_length()):
+        if xref in remap:
+            continue
+        try:
+            _remap_object(doc, xref, remap)
+        except Exception:
+            continue
+
+    return {"duplicates": len(remap), "bytesSaved": max(0, size_before - _saved_size(doc))}
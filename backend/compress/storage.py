@@ -0,0 +1,378 @@
+import io
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+# Artifact kinds. Each is a folder under the storage root (or a key prefix in S3)
+# and maps to one /download/<...>/{filename} route.
+COMPRESSED_PDFS = "compressed_pdfs"
+COMPRESSED_IMAGES = "compressed_images"
+MERGED_PDFS = "merged_pdfs"
+SPLIT_PDFS = "split_pdfs"
+ORGANIZED_PDFS = "organized_pdfs"
+PIPELINE_PDFS = "pipeline_pdfs"
+ARTIFACT_KINDS = (COMPRESSED_PDFS, COMPRESSED_IMAGES, MERGED_PDFS, SPLIT_PDFS, ORGANIZED_PDFS, PIPELINE_PDFS)
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+def cleanup_old_files(folder_path, max_age_minutes=5):
+    """Remove files older than max_age_minutes from the specified folder"""
+    try:
+        if not os.path.exists(folder_path):
+            return
+
+        current_time = time.time()
+        max_age_seconds = max_age_minutes * 60  # Convert minutes to seconds
+
+        for filename in os.listdir(folder_path):
+            file_path = os.path.join(folder_path, filename)
+            if os.path.isfile(file_path):
+                file_age = current_time - os.path.getctime(file_path)
+                if file_age > max_age_seconds:
+                    try:
+                        os.remove(file_path)
+                        print(f"Deleted old file: {filename}")
+                    except Exception as e:
+                        print(f"Could not delete {filename}: {e}")
+    except Exception as e:
+        print(f"Cleanup error: {e}")
+
+
+def _check_name(kind, filename):
+    if kind not in ARTIFACT_KINDS:
+        raise ValueError(f"Unknown artifact kind: {kind}")
+    if not filename or filename != os.path.basename(filename) or filename.startswith("."):
+        raise ValueError(f"Invalid artifact name: {filename}")
+
+
+class ArtifactStorage:
+    """Where operation outputs are written and /download reads them from.
+
+    Backends implement open_write (a context manager yielding a writable
+    binary stream; the artifact becomes visible only when the block exits
+    without error), open_read (an iterator of chunks), size, delete and
+    _expired. Nothing in the interface needs the whole artifact in memory.
+    """
+
+    # Listing old artifacts is not free (a directory scan or an S3 list), so
+    # cleanup runs at most this often per kind and process
+    cleanup_interval_seconds = 30
+
+    def __init__(self):
+        self._last_cleanup = {}
+
+    @contextmanager
+    def open_write(self, kind, filename):
+        raise NotImplementedError
+
+    def write_bytes(self, kind, filename, data):
+        with self.open_write(kind, filename) as f:
+            f.write(data)
+
+    def open_read(self, kind, filename, chunk_size=READ_CHUNK_BYTES):
+        raise NotImplementedError
+
+    def size(self, kind, filename):
+        """Size in bytes, or None when the artifact doesn't exist"""
+        raise NotImplementedError
+
+    def exists(self, kind, filename):
+        return self.size(kind, filename) is not None
+
+    def delete(self, kind, filename):
+        raise NotImplementedError
+
+    def local_path(self, kind, filename):
+        """Filesystem path of an artifact when the backend has one (served with sendfile), else None"""
+        return None
+
+    def prepare(self):
+        """Create whatever the backend needs before the first write (called once at startup)"""
+
+    def location(self, kind, filename):
+        """Human-readable location, reported as "path" in operation results"""
+        raise NotImplementedError
+
+    def _expired(self, kind, max_age_seconds):
+        """Names of artifacts of kind older than max_age_seconds"""
+        raise NotImplementedError
+
+    def cleanup(self, kind, max_age_minutes=5):
+        """Remove artifacts of kind older than max_age_minutes"""
+        now = time.time()
+        if now - self._last_cleanup.get(kind, 0) < self.cleanup_interval_seconds:
+            return
+        self._last_cleanup[kind] = now
+        try:
+            for filename in self._expired(kind, max_age_minutes * 60):
+                try:
+                    self.delete(kind, filename)
+                    print(f"Deleted old file: {kind}/{filename}")
+                except Exception as e:
+                    print(f"Could not delete {filename}: {e}")
+        except Exception as e:
+            print(f"Cleanup error: {e}")
+
+
+class LocalStorage(ArtifactStorage):
+    """Artifacts in a directory on this machine (the default: backend/app/<kind>/)"""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        super().__init__()
+        self.root = root
+        self._created = set()
+
+    def prepare(self):
+        for kind in ARTIFACT_KINDS:
+            os.makedirs(os.path.join(self.root, kind), exist_ok=True)
+            self._created.add(kind)
+
+    def _path(self, kind, filename):
+        _check_name(kind, filename)
+        return os.path.join(self.root, kind, filename)
+
+    def _sync(self, f):
+        pass
+
+    @contextmanager
+    def open_write(self, kind, filename):
+        # Write to a temporary name and rename, so a concurrent download never sees a partial file
+        path = self._path(kind, filename)
+        if kind not in self._created:
+            # Normally done by prepare() at startup; worker processes create them on first use
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._created.add(kind)
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+        try:
+            with open(temp_path, "wb") as f:
+                yield f
+                f.flush()
+                self._sync(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def open_read(self, kind, filename, chunk_size=READ_CHUNK_BYTES):
+        with open(self._path(kind, filename), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def size(self, kind, filename):
+        try:
+            path = self._path(kind, filename)
+            return os.path.getsize(path) if os.path.isfile(path) else None
+        except (OSError, ValueError):
+            return None
+
+    def delete(self, kind, filename):
+        try:
+            os.remove(self._path(kind, filename))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, kind, filename):
+        try:
+            path = self._path(kind, filename)
+        except ValueError:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def location(self, kind, filename):
+        return self._path(kind, filename)
+
+    def _expired(self, kind, max_age_seconds):
+        folder = os.path.join(self.root, kind)
+        if not os.path.isdir(folder):
+            return []
+        now = time.time()
+        expired = []
+        for entry in os.scandir(folder):
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime > max_age_seconds:
+                    expired.append(entry.name)
+            except FileNotFoundError:
+                continue  # removed by another worker meanwhile
+        return expired
+
+
+class SharedDirStorage(LocalStorage):
+    """Artifacts in a directory every worker and node mounts (NFS, Filestore, a shared volume).
+
+    Writes are fsynced before the rename that publishes them, so a download
+    routed to another node never sees a partial file.
+    """
+
+    def _sync(self, f):
+        os.fsync(f.fileno())
+
+
+class _S3UploadStream(io.BufferedIOBase):
+    """Write-only stream that uploads in multipart chunks as data arrives.
+
+    At most one part is buffered. Small artifacts (under one part) are sent
+    with a single PUT on commit. Not seekable; zipfile and PyMuPDF's save()
+    both handle that.
+    """
+
+    def __init__(self, client, bucket, key, part_size):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self._buffer = bytearray()
+        self._parts = []
+        self._upload_id = None
+        self._written = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._written
+
+    def write(self, data):
+        self._buffer += data
+        size = len(data) if isinstance(data, (bytes, bytearray)) else memoryview(data).nbytes
+        self._written += size
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return size
+
+    def _upload_part(self, chunk):
+        if self._upload_id is None:
+            self._upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)["UploadId"]
+        number = len(self._parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                           PartNumber=number, Body=chunk)
+        self._parts.append({"ETag": response["ETag"], "PartNumber": number})
+
+    def commit(self):
+        if self._upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                                  MultipartUpload={"Parts": self._parts})
+        self._buffer = bytearray()
+
+    def abort(self):
+        if self._upload_id is not None:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            except Exception as e:
+                print(f"Could not abort upload of {self.key}: {e}")
+        self._buffer = bytearray()
+
+
+class S3Storage(ArtifactStorage):
+    """Artifacts in an S3-compatible bucket (AWS S3, GCS interoperability, MinIO, moto).
+
+    Credentials and region come from the standard AWS environment/config.
+    endpoint_url points at a non-AWS service or a local stand-in.
+    """
+
+    # S3 requires parts of at least 5 MiB, except the last
+    part_size = 8 * 1024 * 1024
+
+    def __init__(self, bucket, prefix="", endpoint_url=None):
+        super().__init__()
+        try:
+            import boto3
+        except ImportError:
+            raise Exception("S3 storage needs boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+
+    def _key(self, kind, filename):
+        _check_name(kind, filename)
+        return "/".join(part for part in (self.prefix, kind, filename) if part)
+
+    @contextmanager
+    def open_write(self, kind, filename):
+        stream = _S3UploadStream(self.client, self.bucket, self._key(kind, filename), self.part_size)
+        try:
+            yield stream
+            stream.commit()
+        except BaseException:
+            stream.abort()
+            raise
+
+    def open_read(self, kind, filename, chunk_size=READ_CHUNK_BYTES):
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(kind, filename))["Body"]
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def size(self, kind, filename):
+        try:
+            key = self._key(kind, filename)
+        except ValueError:
+            return None
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except self.client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def delete(self, kind, filename):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(kind, filename))
+
+    def location(self, kind, filename):
+        return f"s3://{self.bucket}/{self._key(kind, filename)}"
+
+    def _expired(self, kind, max_age_seconds):
+        # A bucket lifecycle rule is cheaper for production; this keeps parity with the local backends
+        prefix = "/".join(part for part in (self.prefix, kind) if part) + "/"
+        now = time.time()
+        expired = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                if now - item["LastModified"].timestamp() > max_age_seconds:
+                    expired.append(item["Key"][len(prefix):])
+        return expired
+
+
+def storage_from_env():
+    """Backend selected by CHHOTIPDF_STORAGE: local (default), shared or s3"""
+    backend = os.environ.get("CHHOTIPDF_STORAGE", "local").lower()
+    if backend == "local":
+        return LocalStorage(os.environ.get("CHHOTIPDF_STORAGE_DIR") or DEFAULT_ROOT)
+    if backend == "shared":
+        root = os.environ.get("CHHOTIPDF_STORAGE_DIR")
+        if not root:
+            raise Exception("CHHOTIPDF_STORAGE=shared needs CHHOTIPDF_STORAGE_DIR (the shared mount)")
+        return SharedDirStorage(root)
+    if backend == "s3":
+        bucket = os.environ.get("CHHOTIPDF_S3_BUCKET")
+        if not bucket:
+            raise Exception("CHHOTIPDF_STORAGE=s3 needs CHHOTIPDF_S3_BUCKET")
+        return S3Storage(bucket, os.environ.get("CHHOTIPDF_S3_PREFIX", ""), os.environ.get("CHHOTIPDF_S3_ENDPOINT_URL"))
+    raise Exception(f"Unknown CHHOTIPDF_STORAGE backend: {backend}")
+
+
+_storage = None
+
+
+def get_storage():
+    """The process-wide storage backend, created on first use (also in bulk-lane worker processes)"""
+    global _storage
+    if _storage is None:
+        _storage = storage_from_env()
+    return _storage
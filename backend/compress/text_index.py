@@ -0,0 +1,145 @@
+import fitz  # PyMuPDF
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from .metrics import record_cache, stage
+
+
+def document_id(pdf_bytes):
+    """Stable id for a document: SHA-256 of its bytes"""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class DocumentTextIndex:
+    """Page text for one document, extracted lazily and at most once per page"""
+
+    def __init__(self, page_count):
+        self.page_count = page_count
+        self.pages = {}  # 0-indexed page -> text
+        self.lock = threading.Lock()
+
+    def page_text(self, doc, page_index):
+        """Return the text of one page, extracting it on first use"""
+        with self.lock:
+            text = self.pages.get(page_index)
+            record_cache("page_text", text is not None)
+            if text is None:
+                with stage("text_extract"):
+                    text = doc[page_index].get_text()
+                self.pages[page_index] = text
+            return text
+
+    def is_complete(self):
+        return len(self.pages) == self.page_count
+
+    def fill(self, doc):
+        """Extract every page not yet in the index"""
+        for page_index in range(self.page_count):
+            if page_index not in self.pages:
+                self.page_text(doc, page_index)
+
+    def search(self, query, max_results=200, snippet_chars=40):
+        """Case-insensitive substring search over indexed pages"""
+        needle = query.lower()
+        matches = []
+        for page_index in sorted(self.pages):
+            text = self.pages[page_index]
+            haystack = text.lower()
+            pos = haystack.find(needle)
+            if pos < 0:
+                continue
+            start = max(0, pos - snippet_chars)
+            end = min(len(text), pos + len(needle) + snippet_chars)
+            matches.append({
+                'page_number': page_index + 1,
+                'page_index': page_index,
+                'count': haystack.count(needle),
+                'snippet': " ".join(text[start:end].split()),
+            })
+            if len(matches) >= max_results:
+                break
+        return matches
+
+
+class TextIndexCache:
+    """Bounded LRU of DocumentTextIndex entries keyed by content hash, with TTL eviction"""
+
+    def __init__(self, max_documents=32, ttl_seconds=1800):
+        self.max_documents = max_documents
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # document id -> (last_used, DocumentTextIndex)
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        expired = [k for k, (used, _) in self._entries.items() if now - used > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        while len(self._entries) > self.max_documents:
+            self._entries.popitem(last=False)
+
+    def get(self, doc_id):
+        with self._lock:
+            now = time.time()
+            self._evict(now)
+            entry = self._entries.get(doc_id)
+            if entry is None:
+                return None
+            self._entries[doc_id] = (now, entry[1])
+            self._entries.move_to_end(doc_id)
+            return entry[1]
+
+    def get_or_create(self, doc_id, page_count):
+        with self._lock:
+            now = time.time()
+            entry = self._entries.get(doc_id)
+            index = entry[1] if entry else DocumentTextIndex(page_count)
+            self._entries[doc_id] = (now, index)
+            self._entries.move_to_end(doc_id)
+            self._evict(now)
+            return index
+
+
+# Shared by the organize preview (which can fill it) and the search endpoint
+text_index_cache = TextIndexCache()
+
+
+def text_preview(text, max_chars=100):
+    """Short single-page preview in the format the organize preview has always used"""
+    preview = text[:max_chars] + "..." if len(text) > max_chars else text
+    return preview.strip()
+
+
+async def search_pdf_text(query, uploaded_file=None, doc_id=None, max_results=200):
+    """Find the pages of a PDF containing query.
+
+    A document already indexed under doc_id is searched without an upload;
+    otherwise the uploaded file is indexed (once) and searched.
+    """
+    query = (query or "").strip()
+    if not query:
+        raise ValueError("Search query is empty")
+
+    index = text_index_cache.get(doc_id) if doc_id else None
+    record_cache("text_index", index is not None and index.is_complete())
+    if index is None or not index.is_complete():
+        if uploaded_file is None:
+            raise LookupError("Document is not indexed; upload the file to search it")
+        pdf_bytes = await uploaded_file.read()
+        doc_id = document_id(pdf_bytes)
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        try:
+            index = text_index_cache.get_or_create(doc_id, doc.page_count)
+            index.fill(doc)
+        finally:
+            doc.close()
+
+    matches = index.search(query, max_results=max_results)
+    return {
+        'document_id': doc_id,
+        'query': query,
+        'total_pages': index.page_count,
+        'match_count': len(matches),
+        'page_numbers': [m['page_number'] for m in matches],
+        'matches': matches,
+    }
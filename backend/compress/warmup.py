@@ -0,0 +1,101 @@
+"""Background warm-up after startup.
+
+The first request on a fresh instance would otherwise pay for importing
+PyMuPDF, Pillow and numpy, for MuPDF's first-use setup (fonts, colour
+spaces) and for Pillow's codec plugins, and on the bulk lane for spawning a
+worker process that repeats all of that. The warm-up does this once in the
+background, in the server process and in every bulk worker, while the
+server already accepts requests. GET /ready reports its status and timings;
+its duration and failures are also in the metrics.
+"""
+import asyncio
+import importlib
+import os
+import time
+from io import BytesIO
+from .lanes import LANES, run_in_lane
+from .metrics import record_fallback, stage
+
+WARMUP_ENABLED = os.environ.get("CHHOTIPDF_WARMUP", "1").lower() not in ("0", "false", "no")
+
+# Modules the endpoints import on first use
+OPERATION_MODULES = (
+    "pdf_compressor",
+    "image_compressor",
+    "pdf_merger",
+    "pdf_splitter",
+    "pdf_organizer",
+    "text_index",
+    "pdf_pipeline",
+)
+
+_state = {"status": "off", "enabled": WARMUP_ENABLED, "totalMs": None, "steps": {}, "workerMs": [], "error": None}
+_task = None
+
+
+def exercise_libraries():
+    """Import the operation modules and run PyMuPDF and Pillow once; returns ms per step"""
+    steps = {}
+
+    def timed(name, fn):
+        started = time.perf_counter()
+        fn()
+        steps[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    for module in OPERATION_MODULES:
+        timed(f"import_{module}", lambda: importlib.import_module(f".{module}", __package__))
+
+    def exercise_pymupdf():
+        import fitz
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((72, 72), "warm-up")
+        page.get_pixmap(matrix=fitz.Matrix(0.5, 0.5)).tobytes("png")
+        page.get_text()
+        fitz.open(stream=doc.tobytes(garbage=3, deflate=True), filetype="pdf").close()
+        doc.close()
+
+    def exercise_pillow():
+        from PIL import Image
+        image = Image.new("RGB", (64, 64), (200, 120, 40))
+        for image_format in ("JPEG", "PNG", "WEBP"):
+            buffer = BytesIO()
+            image.save(buffer, format=image_format)
+            Image.open(BytesIO(buffer.getvalue())).load()
+
+    timed("pymupdf", exercise_pymupdf)
+    timed("pillow", exercise_pillow)
+    return steps
+
+
+async def _warm():
+    started = time.perf_counter()
+    try:
+        with stage("warmup"):
+            # One run in the server process (the interactive lane's thread)
+            # and one per bulk worker, submitted together so each starts its own process
+            runs = [run_in_lane("interactive", exercise_libraries)]
+            runs += [run_in_lane("bulk", exercise_libraries) for _ in range(LANES["bulk"].workers)]
+            results = await asyncio.gather(*runs)
+        _state["steps"] = results[0]
+        _state["workerMs"] = [round(sum(steps.values()), 2) for steps in results[1:]]
+        _state["status"] = "ready"
+    except Exception as e:
+        # Not fatal: the endpoints still load what they need on first use
+        record_fallback("warmup", "failed")
+        _state["status"] = "failed"
+        _state["error"] = str(e)
+    _state["totalMs"] = round((time.perf_counter() - started) * 1000, 2)
+
+
+def start_warmup():
+    """Start the warm-up in the background (no-op when CHHOTIPDF_WARMUP=0 or already started)"""
+    global _task
+    if not WARMUP_ENABLED or _task is not None:
+        return
+    _state["status"] = "warming"
+    _task = asyncio.get_running_loop().create_task(_warm())
+
+
+def warmup_state():
+    return dict(_state)
@@ -0,0 +1,114 @@
+"""Preview latency with the bulk lane saturated.
+
+Starts against a running server (e.g. `uvicorn main:app --port 8000`):
+
+    python -m loadtest.lane_latency --url http://localhost:8000 --duration 30
+
+Measures /split/pdf/preview latency on its own, then again while
+--bulk-clients clients keep heavy /compress/pdf requests running, and
+prints p50/p95/p99 for both phases.
+"""
+import argparse
+import asyncio
+import io
+import random
+import statistics
+import time
+
+import fitz  # PyMuPDF
+import httpx
+from PIL import Image
+
+
+def make_preview_pdf(pages=5):
+    doc = fitz.open()
+    for number in range(pages):
+        doc.new_page().insert_text((72, 72), f"Preview page {number + 1}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def make_heavy_pdf(pages=8, seed=7):
+    """Pages with a large noisy photo each, so heavy compression has real work to do"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        image = Image.frombytes("RGB", (1600, 1200), rng.randbytes(1600 * 1200 * 3))
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", quality=95)
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=buf.getvalue())
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(name, latencies):
+    if not latencies:
+        print(f"{name}: no requests completed")
+        return
+    ms = [v * 1000 for v in latencies]
+    print(f"{name}: n={len(ms)} p50={percentile(ms, 50):.1f}ms p95={percentile(ms, 95):.1f}ms "
+          f"p99={percentile(ms, 99):.1f}ms max={max(ms):.1f}ms mean={statistics.mean(ms):.1f}ms")
+
+
+async def preview_loop(client, pdf, stop_at, interval):
+    latencies = []
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        response = await client.post("/split/pdf/preview", files={"file": ("preview.pdf", pdf, "application/pdf")})
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def bulk_loop(client, pdf, stop, counts):
+    while not stop.is_set():
+        response = await client.post(
+            "/compress/pdf",
+            files={"file": ("heavy.pdf", pdf, "application/pdf")},
+            data={"compression_level": "heavy", "inline": "true"},
+        )
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+
+async def main(args):
+    preview_pdf = make_preview_pdf()
+    heavy_pdf = make_heavy_pdf(args.heavy_pages)
+    print(f"Preview PDF {len(preview_pdf) // 1024}KB, heavy PDF {len(heavy_pdf) // 1024}KB")
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=600) as client:
+        baseline = await preview_loop(client, preview_pdf, time.monotonic() + args.duration / 2, args.interval)
+
+        stop = asyncio.Event()
+        counts = {}
+        bulk = [asyncio.create_task(bulk_loop(client, heavy_pdf, stop, counts)) for _ in range(args.bulk_clients)]
+        await asyncio.sleep(args.warmup)
+        loaded = await preview_loop(client, preview_pdf, time.monotonic() + args.duration, args.interval)
+        stop.set()
+        await asyncio.gather(*bulk)
+
+        lanes = (await client.get("/admission")).json().get("lanes")
+
+    summarize("preview, idle", baseline)
+    summarize(f"preview, {args.bulk_clients} bulk clients", loaded)
+    print(f"bulk responses by status: {counts}")
+    print(f"lanes: {lanes}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of previews under load")
+    parser.add_argument("--bulk-clients", type=int, default=4)
+    parser.add_argument("--heavy-pages", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=0.05, help="pause between previews")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds for the bulk lane to fill up")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,277 @@
+"""Replay a scenario's request mix against the app and report per-request latency.
+
+Run from backend/. By default the app is started locally with uvicorn using
+the scenario's server settings, and stopped afterwards:
+
+    python -m loadtest.run loadtest/scenarios/mixed.json --out mixed.json
+    python -m loadtest.run loadtest/scenarios/mixed.json --workers 2 --env CHHOTIPDF_BULK_WORKERS=3
+
+or against a server that is already running (RSS is sampled only when its
+PID is given):
+
+    python -m loadtest.run loadtest/scenarios/previews.json --url http://localhost:8000 --server-pid 1234
+
+Scenario files (loadtest/scenarios/*.json) describe the server settings,
+the number of concurrent clients, the duration and a weighted mix of
+requests. Uploads come from the benchmark corpus (benchmarks.corpus).
+Prints throughput, p50/p95/p99 latency and error rate per request type,
+and the server's RSS (all its processes, sampled from /proc) over time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.corpus import ensure_corpus, read
+from .lane_latency import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTENT_TYPES = {".pdf": "application/pdf", ".jpg": "image/jpeg", ".png": "image/png"}
+SCENARIO_DEFAULTS = {
+    "description": "",
+    "server": {"workers": 1, "env": {}},
+    "clients": 4,
+    "duration": 60,
+    "warmup": 5,
+    "think_time": 0,
+    "seed": 1,
+    "sample_interval": 1,
+}
+
+
+def load_scenario(path):
+    with open(path) as f:
+        scenario = dict(SCENARIO_DEFAULTS, **json.load(f))
+    scenario["server"] = dict(SCENARIO_DEFAULTS["server"], **scenario["server"])
+    scenario.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    if not scenario.get("requests"):
+        raise SystemExit(f"{path}: scenario needs a non-empty requests list")
+    for request in scenario["requests"]:
+        if not request.get("name") or not request.get("path"):
+            raise SystemExit(f"{path}: every request needs a name and a path")
+        request.setdefault("method", "POST")
+        request.setdefault("weight", 1)
+    return scenario
+
+
+def process_tree_rss_mb(pid):
+    """Resident memory of pid and all its descendants (uvicorn workers, bulk-lane processes)"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return round(total_kb / 1024, 1)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, env, port):
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=dict(os.environ, **env), stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with code {process.returncode} during startup")
+        try:
+            if httpx.get(url + "/", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    raise SystemExit("Server did not become ready within 60s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def upload_fields(request, corpus_dir, cache):
+    """httpx files list for a request's "files" mapping (a value may list several corpus files)"""
+    files = []
+    for field, names in request.get("files", {}).items():
+        for name in [names] if isinstance(names, str) else names:
+            if name not in cache:
+                cache[name] = read(corpus_dir, name)
+            content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+            files.append((field, (name, cache[name], content_type)))
+    return files
+
+
+async def client_loop(client, scenario, uploads, rng, stop_at, samples):
+    requests = scenario["requests"]
+    weights = [request["weight"] for request in requests]
+    while time.monotonic() < stop_at:
+        request = rng.choices(requests, weights)[0]
+        body = await timed(client, request["name"], request["method"], request["path"], samples,
+                           files=uploads[request["name"]] or None, data=request.get("data"), headers=request.get("headers"))
+        if request.get("download") and isinstance(body, dict) and body.get("url"):
+            await timed(client, request["name"] + ":download", "GET", body["url"], samples)
+        if scenario["think_time"]:
+            await asyncio.sleep(scenario["think_time"])
+
+
+async def timed(client, name, method, path, samples, **kwargs):
+    started = time.perf_counter()
+    status, body = "error", None
+    try:
+        response = await client.request(method, path, **kwargs)
+        status = response.status_code
+        if response.headers.get("content-type", "").startswith("application/json"):
+            body = response.json()
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    samples.append((name, time.monotonic(), time.perf_counter() - started, status))
+    return body
+
+
+async def sample_rss(pid, interval, stop, timeline, started):
+    while not stop.is_set():
+        timeline.append((round(time.monotonic() - started, 1), process_tree_rss_mb(pid)))
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_scenario(scenario, url, server_pid, corpus_dir):
+    cache = {}
+    uploads = {request["name"]: upload_fields(request, corpus_dir, cache) for request in scenario["requests"]}
+    samples, timeline = [], []
+    started = time.monotonic()
+    measure_from = started + scenario["warmup"]
+    stop_at = measure_from + scenario["duration"]
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(server_pid, scenario["sample_interval"], stop, timeline, started)) if server_pid else None
+
+    limits = httpx.Limits(max_connections=scenario["clients"], max_keepalive_connections=scenario["clients"])
+    async with httpx.AsyncClient(base_url=url, timeout=600, limits=limits) as client:
+        await asyncio.gather(*(
+            client_loop(client, scenario, uploads, random.Random(scenario["seed"] + number), stop_at, samples)
+            for number in range(scenario["clients"])
+        ))
+    stop.set()
+    if sampler:
+        await sampler
+    # Only requests completed inside the measured window count
+    measured = [sample for sample in samples if measure_from <= sample[1] <= stop_at]
+    return summarize(measured, scenario["duration"]), timeline
+
+
+def summarize(samples, seconds):
+    report = {}
+    for name in sorted({sample[0] for sample in samples}):
+        rows = [sample for sample in samples if sample[0] == name]
+        latencies = [sample[2] * 1000 for sample in rows]
+        statuses = {}
+        for row in rows:
+            statuses[str(row[3])] = statuses.get(str(row[3]), 0) + 1
+        errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+        report[name] = {
+            "count": len(rows),
+            "throughput_rps": round(len(rows) / seconds, 2),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": round(max(latencies), 1),
+            "error_rate": round(errors / len(rows), 4),
+            "statuses": statuses,
+        }
+    return report
+
+
+def print_report(scenario, report, timeline):
+    print(f"\nScenario {scenario['name']}: {scenario['clients']} clients, {scenario['duration']}s measured "
+          f"(after {scenario['warmup']}s warm-up), workers {scenario['server']['workers']}, env {scenario['server']['env']}")
+    print(f"{'request':32} {'count':>6} {'req/s':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'errors':>7}  statuses")
+    for name, row in report.items():
+        print(f"{name:32} {row['count']:6d} {row['throughput_rps']:7.2f} {row['p50_ms']:8.1f}ms {row['p95_ms']:8.1f}ms "
+              f"{row['p99_ms']:8.1f}ms {row['max_ms']:8.1f}ms {row['error_rate']:7.1%}  {row['statuses']}")
+    total = sum(row["count"] for row in report.values())
+    print(f"total: {total} requests, {sum(row['throughput_rps'] for row in report.values()):.2f} req/s")
+    if timeline:
+        values = [mb for _, mb in timeline]
+        print(f"server RSS: start {values[0]}MB, peak {max(values)}MB, end {values[-1]}MB")
+        step = max(1, len(timeline) // 12)
+        print("  " + "  ".join(f"{t:.0f}s:{mb:.0f}MB" for t, mb in timeline[::step]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenario", help="scenario JSON file")
+    parser.add_argument("--url", help="target an already running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="PID of the running server (with --url), for RSS sampling")
+    parser.add_argument("--workers", type=int, help="override the scenario's uvicorn worker count")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra server environment; repeatable")
+    parser.add_argument("--clients", type=int, help="override the scenario's concurrent clients")
+    parser.add_argument("--duration", type=float, help="override the scenario's measured seconds")
+    parser.add_argument("--out", help="write the report (and RSS timeline) as JSON")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    if args.workers:
+        scenario["server"]["workers"] = args.workers
+    if args.env:
+        scenario["server"]["env"] = dict(scenario["server"]["env"], **dict(item.split("=", 1) for item in args.env))
+    if args.clients:
+        scenario["clients"] = args.clients
+    if args.duration:
+        scenario["duration"] = args.duration
+
+    corpus_dir = ensure_corpus()
+    server = None
+    if args.url:
+        url, server_pid = args.url, args.server_pid
+    else:
+        server, url = start_server(scenario["server"]["workers"], scenario["server"]["env"], free_port())
+        server_pid = server.pid
+    try:
+        report, timeline = asyncio.run(run_scenario(scenario, url, server_pid, corpus_dir))
+    finally:
+        if server:
+            stop_server(server)
+
+    print_report(scenario, report, timeline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"scenario": scenario, "requests": report, "rss_mb": timeline}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
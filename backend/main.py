@@ -1,59 +1,306 @@
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, Depends, Request, UploadFile, File, Form
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from compress.pdf_compressor import compress_pdf
-from compress.image_compressor import compress_image
-from compress.pdf_merger import merge_pdfs
-from compress.pdf_splitter import get_pdf_pages, split_pdf_pages
-from compress.pdf_organizer import get_pdf_organization_preview, organize_pdf_pages
-from typing import List
+# Operation modules (PyMuPDF, Pillow, numpy) are imported inside the endpoints
+# that use them, so the server starts without paying for them; compress.warmup
+# preloads them in the background after startup
+from compress.metrics import IN_FLIGHT, REQUEST_SECONDS, render_metrics
+from compress.profiling import (
+    PROFILE_HEADER, RequestProfiler, list_profiles, profile_artifact_path, profile_mode, secret_matches, should_keep
+)
+from compress.admission import AdmissionRejected, admission_controller, admit, parallel_workers
+from compress.blob_store import (
+    MAX_CHECK_BLOBS, BlobNotFound, InvalidBlobReference, blob_store, new_blob_session, referenced_bytes, resolve_upload,
+    resolve_uploads, valid_blob_id, valid_blob_session
+)
+from compress.lanes import lane_state, run_in_lane, shutdown_lanes
+from compress.progress import event_stream, valid_progress_id
+from compress.storage import (
+    COMPRESSED_IMAGES, COMPRESSED_PDFS, MERGED_PDFS, ORGANIZED_PDFS, PIPELINE_PDFS, SPLIT_PDFS, get_storage
+)
+from compress.warmup import start_warmup, warmup_state
+from starlette.routing import Match
+from typing import List, Optional
 import os
+import json
+import time
 
 app = FastAPI()
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Metadata headers sent with inline (inline=true) responses, readable by the browser through CORS
+INLINE_HEADERS = [
+    "X-Original-Size",
+    "X-Output-Size",
+    "X-Used-Original",
+    "X-Compression-Level",
+    "X-Page-Count",
+    "X-File-Count",
+    "X-Output-Format",
+    "X-Bytes-Saved",
+    "X-Peak-Memory-Mb",
+]
+
+def inline_response(data, filename, media_type, original_size, **metadata):
+    """Send an operation's output in the response body instead of writing it for /download.
+
+    Sizes are in bytes. Extra keyword metadata becomes X-... headers
+    (e.g. compression_level -> X-Compression-Level).
+    """
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Original-Size": str(original_size),
+        "X-Output-Size": str(len(data)),
+    }
+    for key, value in metadata.items():
+        if value is not None:
+            headers["X-" + "-".join(part.capitalize() for part in key.split("_"))] = str(value).lower() if isinstance(value, bool) else str(value)
+    return Response(content=data, media_type=media_type, headers=headers)
+
+def download_response(kind, filename, media_type, download_name=None):
+    """Serve a stored artifact: sendfile for path-backed storage, streamed in chunks otherwise"""
+    storage = get_storage()
+    download_name = download_name or filename
+    path = storage.local_path(kind, filename)
+    if path is not None:
+        return FileResponse(path=path, filename=download_name, media_type=media_type)
+    size = storage.size(kind, filename)
+    if size is None:
+        return JSONResponse(status_code=404, content={"error": "File not found"})
+    return StreamingResponse(
+        storage.open_read(kind, filename),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{download_name}"', "Content-Length": str(size)},
+    )
+
+def route_template(scope):
+    """Path template of the route a request will hit (e.g. /download/pdf/{filename}), to keep metric labels bounded"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+async def input_bytes(request):
+    """Bytes an operation will process: the request body plus any held uploads it refers to by blob_id"""
+    form = await request.form()  # already parsed for the endpoint; cached on the request
+    return int(request.headers.get("content-length") or 0) + referenced_bytes(form.get("blob_session"), form.get("blob_id"), form.get("blob_ids"))
+
+def admission(operation):
+    """Dependency that holds an admission slot, sized from the request's input bytes, for the whole request"""
+    async def dependency(request: Request):
+        async with admit(operation, await input_bytes(request)):
+            yield
+    return dependency
+
+def compression_admission(operation):
+    """Like admission(), with the cost also depending on the requested compression level"""
+    async def dependency(request: Request, compression_level: str = Form("medium")):
+        async with admit(operation, await input_bytes(request), compression_level):
+            yield
+    return dependency
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(status_code=503, content={"error": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+# Operations sent by blob_id when the server no longer holds that upload: the client re-sends the file
+@app.exception_handler(BlobNotFound)
+async def blob_not_found_handler(request: Request, exc: BlobNotFound):
+    return JSONResponse(status_code=404, content={"error": str(exc), "blobMissing": True})
+
+@app.exception_handler(InvalidBlobReference)
+async def invalid_blob_reference_handler(request: Request, exc: InvalidBlobReference):
+    return JSONResponse(status_code=400, content={"error": str(exc)})
+
+# Hash-first uploads: which files (by SHA-256 and size) the client's blob session still holds
+@app.post("/blobs/check")
+async def check_blobs(blobs: str = Form(..., description='JSON list, e.g. [{"sha256": "<64 hex>", "size": 123456}]'),
+                      blob_session: str = Form("", description="Session from an earlier check; a new one is issued when empty")):
+    if blob_session and not valid_blob_session(blob_session):
+        return JSONResponse(status_code=400, content={"error": "Invalid blob_session. Send the one an earlier check returned, or none"})
+    blob_session = blob_session or new_blob_session()
+    try:
+        requested = json.loads(blobs)
+        if not isinstance(requested, list) or not 1 <= len(requested) <= MAX_CHECK_BLOBS:
+            raise ValueError(f"expected a list of 1 to {MAX_CHECK_BLOBS} entries")
+        checked = []
+        for entry in requested:
+            sha256 = str(entry.get("sha256", "")).lower() if isinstance(entry, dict) else ""
+            if not valid_blob_id(sha256) or not isinstance(entry.get("size"), int):
+                raise ValueError("each entry needs a sha256 (64 hex characters) and an integer size")
+            checked.append({"sha256": sha256, "size": entry["size"], "exists": blob_store.contains(blob_session, sha256, entry["size"])})
+    except (json.JSONDecodeError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"error": f"Invalid blobs: {str(e)}"})
+    return {"blobs": checked, "blobSession": blob_session, "ttlSeconds": blob_store.ttl_seconds}
+
+# Admission budget and execution lane state, for autoscaling decisions
+@app.get("/admission")
+async def admission_state():
+    return dict(admission_controller.state(), lanes=lane_state(), blobStore=blob_store.state())
+
+@app.on_event("startup")
+async def prepare_instance():
+    # Output folders once per process, not on every write
+    get_storage().prepare()
+    start_warmup()
+
+@app.on_event("shutdown")
+async def stop_lane_workers():
+    shutdown_lanes()
+
+# Readiness probe: 503 until the warm-up has loaded and exercised the operation modules
+@app.get("/ready")
+async def ready():
+    state = warmup_state()
+    return JSONResponse(status_code=503 if state["status"] == "warming" else 200, content=state)
+
+# Progress of a long-running operation started with the same progress_id (Server-Sent Events)
+@app.get("/progress/{progress_id}")
+async def progress_stream(progress_id: str):
+    if not valid_progress_id(progress_id):
+        return JSONResponse(status_code=400, content={"error": "Invalid progress_id. Use 8-64 letters, digits, '-' or '_'"})
+    return StreamingResponse(
+        event_stream(progress_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Per-endpoint latency and in-flight metrics
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    endpoint = route_template(request.scope)
+    if endpoint == "/metrics":
+        return await call_next(request)
+    in_flight = IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        in_flight.dec()
+        REQUEST_SECONDS.labels(endpoint, request.method, str(status)).observe(time.perf_counter() - start)
+
+# Opt-in profiling (operator secret, sampling, or slow-request capture)
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    mode = profile_mode(request.headers)
+    if mode is None or request.url.path.startswith(("/admin/", "/api/admin/", "/metrics")):
+        return await call_next(request)
+    profiler = RequestProfiler(mode).start()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        profiler.stop()
+        duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        if should_keep(mode, duration_ms):
+            try:
+                profile_id = profiler.save({
+                    "method": request.method,
+                    "path": request.url.path,
+                    "query": dict(request.query_params),
+                    "content_type": request.headers.get("content-type"),
+                    "content_length": request.headers.get("content-length"),
+                    "status": status,
+                    "duration_ms": duration_ms,
+                })
+                if profile_id and mode == "requested" and status < 500:
+                    response.headers["X-Profile-Id"] = profile_id
+            except Exception as e:
+                print(f"Profile save failed: {e}")
+
+# Admin: stored profiles (requires the profiling secret)
+@app.get("/admin/profiles")
+async def admin_list_profiles(request: Request):
+    if not secret_matches(request.headers.get(PROFILE_HEADER)):
+        return JSONResponse(status_code=403, content={"error": "Forbidden"})
+    return {"profiles": list_profiles()}
+
+@app.get("/admin/profiles/{profile_id}")
+async def admin_download_profile(profile_id: str, request: Request):
+    if not secret_matches(request.headers.get(PROFILE_HEADER)):
+        return JSONResponse(status_code=403, content={"error": "Forbidden"})
+    path = profile_artifact_path(profile_id)
+    if path is None:
+        return JSONResponse(status_code=404, content={"error": "Profile not found"})
+    return FileResponse(path=path, filename=os.path.basename(path), media_type="application/octet-stream")
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics():
+    data, content_type = render_metrics()
+    return Response(content=data, media_type=content_type)
 
 # Root endpoint
 @app.get("/")
 async def root():
+    from compress.image_compressor import OUTPUT_FORMATS
     return {
         "message": "File Compressor API",
         "available_endpoints": {
             "compress_pdf": "/compress/pdf",
             "compress_image": "/compress/image",
+            "compress_image_variants": "/compress/image/variants",
             "merge_pdfs": "/merge/pdf",
             "split_pdf_preview": "/split/pdf/preview",
             "split_pdf_pages": "/split/pdf/pages",
+            "split_pdf_multi": "/split/pdf/multi",
             "organize_pdf_preview": "/organize/pdf/preview",
             "organize_pdf_pages": "/organize/pdf/pages",
+            "admission_state": "/admission",
+            "check_blobs": "/blobs/check",
+            "ready": "/ready",
+            "progress": "/progress/{progress_id}",
+            "search_pdf": "/search/pdf",
+            "pipeline_pdf": "/pipeline/pdf",
             "download_pdf": "/download/pdf/{filename}",
             "download_image": "/download/image/{filename}",
             "download_merged": "/download/merged/{filename}",
             "download_split": "/download/split/{filename}",
-            "download_organized": "/download/organized/{filename}"
+            "download_organized": "/download/organized/{filename}",
+            "download_pipeline": "/download/pipeline/{filename}"
         },
-        "compression_levels": ["light", "medium", "heavy"]
+        "compression_levels": ["light", "medium", "heavy"],
+        "image_output_formats": list(OUTPUT_FORMATS) + ["auto"]
     }
 
 # PDF Compression Endpoint
 @app.post("/compress/pdf")
-async def compress_pdf_endpoint(file: UploadFile = File(...), compression_level: str = Form("medium")):
+async def compress_pdf_endpoint(file: Optional[UploadFile] = File(default=None), blob_id: str = Form(""), blob_session: str = Form(""),
+                                compression_level: str = Form("medium"), inline: bool = Form(False),
+                                progress_id: str = Form(""), _admission=Depends(compression_admission("compress_pdf"))):
+    from compress.pdf_compressor import compress_pdf
     valid_levels = ["light", "medium", "heavy"]
     if compression_level not in valid_levels:
         return JSONResponse(status_code=400, content={"error": f"Invalid compression level. Must be one of: {', '.join(valid_levels)}"})
+    if progress_id and not valid_progress_id(progress_id):
+        return JSONResponse(status_code=400, content={"error": "Invalid progress_id. Use 8-64 letters, digits, '-' or '_'"})
+    upload = await resolve_upload(file, blob_id, blob_session)
     try:
-        result = await compress_pdf(file, compression_level=compression_level)
+        result = await run_in_lane("bulk", compress_pdf, upload, compression_level=compression_level, inline=inline,
+                                   progress_id=progress_id or None)
         try:
-            original_base = os.path.splitext(file.filename or "file")[0]
+            original_base = os.path.splitext(upload.filename or "file")[0]
             display_name = f"chhotipdf-{os.path.basename(original_base).replace(' ', '_')}.pdf"
         except Exception:
-            display_name = result["filename"]
+            display_name = result.get("filename") or "chhotipdf.pdf"
+
+        if inline:
+            return inline_response(
+                result["data"], display_name, "application/pdf", result["originalSize"],
+                used_original=result["usedOriginal"], compression_level=result["compressionLevel"]
+            )
 
-        # Defensive clamp: if the written file on disk is larger than original, report original size and mark usedOriginal
+        # Defensive clamp: if the stored file is larger than original, report original size and mark usedOriginal
         try:
-            file_path = os.path.join(BASE_DIR, "app", "compressed_pdfs", result["filename"])
-            if os.path.exists(file_path):
-                on_disk = os.path.getsize(file_path)
+            on_disk = get_storage().size(COMPRESSED_PDFS, result["filename"])
+            if on_disk is not None:
                 if on_disk > result["originalSize"]:
                     # Don't mutate stored file here (compressor may be updated later) but ensure API reports no negative reduction
                     result["compressedSize"] = result["originalSize"]
@@ -75,40 +322,76 @@ async def compress_pdf_endpoint(file: UploadFile = File(...), compression_level:
 
 # PDF Merge Endpoint
 @app.post("/merge/pdf")
-async def merge_pdf_endpoint(files: List[UploadFile] = File(...)):
+async def merge_pdf_endpoint(files: List[UploadFile] = File(default=[]),
+                             blob_ids: str = Form("", description="Inputs in order: SHA-256s of held uploads, 'file' for the next uploaded file"),
+                             blob_session: str = Form("", description="Blob session from /blobs/check; uploads sent with it are kept"),
+                             inline: bool = Form(False), progress_id: str = Form(""), _admission=Depends(admission("merge_pdf"))):
+    from compress.pdf_merger import merge_pdfs
+    files = await resolve_uploads(files, blob_ids, blob_session)
     if len(files) < 2:
         return JSONResponse(status_code=400, content={"error": "At least 2 PDF files are required for merging"})
+    if progress_id and not valid_progress_id(progress_id):
+        return JSONResponse(status_code=400, content={"error": "Invalid progress_id. Use 8-64 letters, digits, '-' or '_'"})
     for file in files:
         if not file.filename.lower().endswith('.pdf'):
             return JSONResponse(status_code=400, content={"error": f"File '{file.filename}' is not a PDF. Only PDF files can be merged."})
     try:
-        result = await merge_pdfs(files)
+        result = await run_in_lane("bulk", merge_pdfs, files, inline=inline,
+                                   progress_id=progress_id or None)
+        if inline:
+            return inline_response(
+                result["data"], "chhotipdf-merged.pdf", "application/pdf", result["originalBytes"],
+                file_count=result["fileCount"], dedup_saved_bytes=result["dedupSavedBytes"]
+            )
         return {
             "originalSize": result["originalSize"],
             "mergedSize": result["mergedSize"],
             "url": f"/download/merged/{result['filename']}",
-            "fileCount": result["fileCount"]
+            "fileCount": result["fileCount"],
+            "duplicateResources": result["duplicateResources"],
+            "dedupSavedBytes": result["dedupSavedBytes"]
         }
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 # Image Compression Endpoint
 @app.post("/compress/image")
-async def compress_image_endpoint(file: UploadFile = File(...), compression_level: str = Form("medium")):
+async def compress_image_endpoint(request: Request, file: Optional[UploadFile] = File(default=None), blob_id: str = Form(""),
+                                  blob_session: str = Form(""), compression_level: str = Form("medium"), inline: bool = Form(False),
+                                  output_format: str = Form("jpeg"),
+                                  _admission=Depends(compression_admission("compress_image"))):
+    from compress.image_budget import ImageTooLarge, check_image_upload
+    from compress.image_compressor import OUTPUT_FORMATS, compress_image, negotiate_output_format
     valid_levels = ["light", "medium", "heavy"]
     if compression_level not in valid_levels:
         return JSONResponse(status_code=400, content={"error": f"Invalid compression level. Must be one of: {', '.join(valid_levels)}"})
+    valid_formats = list(OUTPUT_FORMATS) + ["auto"]
+    if output_format not in valid_formats:
+        return JSONResponse(status_code=400, content={"error": f"Invalid output format. Must be one of: {', '.join(valid_formats)}"})
+    if output_format == "auto":
+        output_format = negotiate_output_format(request.headers.get("accept"))
+    upload = await resolve_upload(file, blob_id, blob_session)
     try:
-        result = compress_image(file, compression_level=compression_level)
+        # Rejected from the header before the upload takes a bulk worker
+        check_image_upload(upload.data)
+        result = await run_in_lane("bulk", compress_image, upload, compression_level=compression_level, inline=inline,
+                                   output_format=output_format)
+        if inline:
+            return inline_response(
+                result["data"], result["display_filename"], f"image/{result['format']}", result["originalSize"],
+                used_original=result["usedOriginal"], compression_level=result["compressionLevel"],
+                output_format=result["outputFormat"], bytes_saved=result["bytesSaved"],
+                peak_memory_mb=result["peakMemoryMb"]
+            )
 
         # Defensive clamp for images as well
         try:
-            file_path = os.path.join(BASE_DIR, "app", "compressed_images", result["filename"])
-            if os.path.exists(file_path):
-                on_disk = os.path.getsize(file_path)
+            on_disk = get_storage().size(COMPRESSED_IMAGES, result["filename"])
+            if on_disk is not None:
                 if on_disk > result["originalSize"]:
                     result["compressedSize"] = result["originalSize"]
                     result["usedOriginal"] = True
+                    result["bytesSaved"] = 0
         except Exception:
             pass
 
@@ -116,105 +399,303 @@ async def compress_image_endpoint(file: UploadFile = File(...), compression_leve
             "originalSize": result["originalSize"],
             "compressedSize": result["compressedSize"],
             "usedOriginal": result.get("usedOriginal", False),
+            "outputFormat": result["outputFormat"],
+            "bytesSaved": result["bytesSaved"],
+            "contentKind": result["contentKind"],
+            "decodePath": result["decodePath"],
+            "peakMemoryMb": result["peakMemoryMb"],
             "url": f"/download/image/{result['filename']}",
             "fileName": result.get("display_filename", result["filename"]),
             "compressionLevel": result["compressionLevel"],
             "compressionDescription": result["compressionDescription"]
         }
+    except ImageTooLarge as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+# Responsive size ladder: several sizes/formats from one upload and one decode
+@app.post("/compress/image/variants")
+async def compress_image_variants_endpoint(
+    request: Request,
+    file: Optional[UploadFile] = File(default=None),
+    blob_id: str = Form(""),
+    blob_session: str = Form(""),
+    variants: str = Form(..., description='JSON list, e.g. [{"max_side": 2048, "format": "webp", "quality": 80}, {"max_side": 640}], or sides like "2048,1600,1200,640"'),
+    compression_level: str = Form("medium"),
+    output_format: str = Form("jpeg", description="Default format for variants that don't set one"),
+    package: str = Form("urls", description="urls | zip"),
+    inline: bool = Form(False),
+    _admission=Depends(compression_admission("compress_image_variants"))
+):
+    from compress.image_budget import ImageTooLarge, check_image_upload
+    from compress.image_compressor import (
+        OUTPUT_FORMATS, VARIANT_PACKAGES, compress_image_variants, negotiate_output_format, parse_variants
+    )
+    valid_levels = ["light", "medium", "heavy"]
+    if compression_level not in valid_levels:
+        return JSONResponse(status_code=400, content={"error": f"Invalid compression level. Must be one of: {', '.join(valid_levels)}"})
+    valid_formats = list(OUTPUT_FORMATS) + ["auto"]
+    if output_format not in valid_formats:
+        return JSONResponse(status_code=400, content={"error": f"Invalid output format. Must be one of: {', '.join(valid_formats)}"})
+    if package not in VARIANT_PACKAGES:
+        return JSONResponse(status_code=400, content={"error": f"Invalid package. Must be one of: {', '.join(VARIANT_PACKAGES)}"})
+    auto_format = negotiate_output_format(request.headers.get("accept"))
+    try:
+        parsed_variants = parse_variants(variants, auto_format if output_format == "auto" else output_format, compression_level, auto_format)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": f"Invalid variants: {str(e)}"})
+    upload = await resolve_upload(file, blob_id, blob_session)
+    try:
+        check_image_upload(upload.data)
+        # Rungs are encoded on as many threads as admission charged CPU slots for
+        result = await run_in_lane("bulk", compress_image_variants, upload, parsed_variants, package=package, inline=inline,
+                                   max_workers=parallel_workers("compress_image_variants"))
+        if inline:
+            return inline_response(
+                result["data"], result["displayFilename"], "application/zip", result["originalSize"],
+                file_count=result["variantCount"], compression_level=compression_level,
+                peak_memory_mb=result["peakMemoryMb"]
+            )
+        return result
+    except ImageTooLarge as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.get("/download/pdf/{filename}")
-async def download_pdf(filename: str):
-    path = os.path.join(BASE_DIR, "app", "compressed_pdfs", filename)
-    if os.path.exists(path):
-        return FileResponse(path=path, filename=filename, media_type="application/pdf")
-    return JSONResponse(status_code=404, content={"error": "File not found"})
+def download_pdf(filename: str):
+    return download_response(COMPRESSED_PDFS, filename, "application/pdf")
 
 @app.get("/download/image/{filename}")
-async def download_image(filename: str):
-    path = os.path.join(BASE_DIR, "app", "compressed_images", filename)
-    if os.path.exists(path):
-        return FileResponse(path=path, filename=filename, media_type="image/jpeg")
-    return JSONResponse(status_code=404, content={"error": "File not found"})
+def download_image(filename: str):
+    from compress.image_compressor import media_type_for
+    return download_response(COMPRESSED_IMAGES, filename, media_type_for(filename))
 
 @app.get("/download/merged/{filename}")
-async def download_merged_pdf(filename: str):
-    path = os.path.join(BASE_DIR, "app", "merged_pdfs", filename)
-    if os.path.exists(path):
-        return FileResponse(path=path, filename=filename, media_type="application/pdf")
-    return JSONResponse(status_code=404, content={"error": "File not found"})
+def download_merged_pdf(filename: str):
+    return download_response(MERGED_PDFS, filename, "application/pdf")
 
 # PDF Splitting endpoints
 @app.post("/split/pdf/preview")
-async def preview_pdf_pages(file: UploadFile = File(...)):
+async def preview_pdf_pages(file: Optional[UploadFile] = File(default=None), blob_id: str = Form(""), blob_session: str = Form(""),
+                            progress_id: str = Form(""), _admission=Depends(admission("split_preview"))):
+    from compress.pdf_splitter import get_pdf_pages
+    if progress_id and not valid_progress_id(progress_id):
+        return JSONResponse(status_code=400, content={"error": "Invalid progress_id. Use 8-64 letters, digits, '-' or '_'"})
+    upload = await resolve_upload(file, blob_id, blob_session)
     try:
-        if not file.filename.lower().endswith('.pdf'):
+        if not upload.filename.lower().endswith('.pdf'):
             return JSONResponse(status_code=400, content={"error": "Please upload a PDF file"})
-        result = await get_pdf_pages(file)
+        result = await run_in_lane("interactive", get_pdf_pages, upload, progress_id=progress_id or None)
         return JSONResponse(content=result)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/split/pdf/pages")
-async def split_pdf_by_pages(file: UploadFile = File(...), selected_pages: str = Form(...)):
+async def split_pdf_by_pages(file: Optional[UploadFile] = File(default=None), blob_id: str = Form(""), blob_session: str = Form(""),
+                             selected_pages: str = Form(...), inline: bool = Form(False), _admission=Depends(admission("split_pdf"))):
+    from compress.page_selection import validate_page_spec
+    from compress.pdf_splitter import split_pdf_pages
+    upload = await resolve_upload(file, blob_id, blob_session)
     try:
-        if not file.filename.lower().endswith('.pdf'):
+        if not upload.filename.lower().endswith('.pdf'):
             return JSONResponse(status_code=400, content={"error": "Please upload a PDF file"})
+        if not selected_pages.strip(" ,"):
+            return JSONResponse(status_code=400, content={"error": "Please select at least one page"})
         try:
-            page_numbers = [int(page.strip()) for page in selected_pages.split(',') if page.strip()]
+            # Plain numbers and ranges ("1-50,70,90-", "-3") alike are expanded once the page count is known
+            validate_page_spec(selected_pages)
         except ValueError:
             return JSONResponse(status_code=400, content={"error": "Invalid page numbers format"})
-        if not page_numbers:
-            return JSONResponse(status_code=400, content={"error": "Please select at least one page"})
-        result = await split_pdf_pages(file, page_numbers)
+        try:
+            result = await run_in_lane("interactive", split_pdf_pages, upload, selected_pages, inline=inline)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        if inline:
+            return inline_response(
+                result["data"], "chhotipdf-split.pdf", "application/pdf", result["originalSize"],
+                page_count=result["selectedPages"]
+            )
+        return result
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.post("/split/pdf/multi")
+async def split_pdf_multi_endpoint(
+    file: Optional[UploadFile] = File(default=None),
+    blob_id: str = Form(""),
+    blob_session: str = Form(""),
+    mode: str = Form("ranges", description="ranges | every | bookmarks | size"),
+    ranges: str = Form(default="", description="Page ranges per output, separated by ';' (e.g. '1-10;11-20,25')"),
+    chunk_size: int = Form(default=0, description="Pages per output for mode=every"),
+    bookmark_level: int = Form(default=1, description="Outline level for mode=bookmarks"),
+    max_size_kb: float = Form(default=0, description="Optional maximum size per output file"),
+    inline: bool = Form(False),
+    _admission=Depends(admission("split_pdf_multi"))
+):
+    from compress.page_selection import validate_page_spec
+    from compress.pdf_splitter import split_pdf_multi
+    valid_modes = ["ranges", "every", "bookmarks", "size"]
+    if mode not in valid_modes:
+        return JSONResponse(status_code=400, content={"error": f"Invalid split mode. Must be one of: {', '.join(valid_modes)}"})
+    upload = await resolve_upload(file, blob_id, blob_session)
+    if not upload.filename.lower().endswith('.pdf'):
+        return JSONResponse(status_code=400, content={"error": "Please upload a PDF file"})
+    if mode == "ranges":
+        try:
+            for spec in ranges.replace("\n", ";").split(";"):
+                if spec.strip():
+                    validate_page_spec(spec)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+    if mode == "every" and chunk_size < 1:
+        return JSONResponse(status_code=400, content={"error": "chunk_size must be at least 1"})
+    if mode == "size" and max_size_kb <= 0:
+        return JSONResponse(status_code=400, content={"error": "max_size_kb is required for mode=size"})
+    try:
+        result = await run_in_lane(
+            "bulk",
+            split_pdf_multi,
+            upload,
+            mode,
+            ranges=ranges,
+            chunk_size=chunk_size,
+            bookmark_level=bookmark_level,
+            max_size_kb=max_size_kb or None,
+            # The CPU slots admission charged for the request
+            max_workers=parallel_workers("split_pdf_multi"),
+            inline=inline,
+        )
+        if inline:
+            return inline_response(
+                result["data"], "chhotipdf-split.zip", "application/zip", result["originalSize"],
+                file_count=result["fileCount"], page_count=result["totalPages"]
+            )
         return result
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.get("/download/split/{filename}")
-async def download_split_pdf(filename: str):
-    file_path = os.path.join(BASE_DIR, "app", "split_pdfs", filename)
-    if os.path.exists(file_path):
-        return FileResponse(path=file_path, filename=filename, media_type='application/pdf')
-    return JSONResponse(status_code=404, content={"error": "File not found"})
+def download_split_pdf(filename: str):
+    media_type = 'application/zip' if filename.lower().endswith('.zip') else 'application/pdf'
+    return download_response(SPLIT_PDFS, filename, media_type)
 
 # PDF Organization endpoints
 @app.post("/organize/pdf/preview")
-async def preview_pdf_for_organization(file: UploadFile = File(...)):
+async def preview_pdf_for_organization(file: Optional[UploadFile] = File(default=None), blob_id: str = Form(""), blob_session: str = Form(""),
+                                       include_text: bool = Form(False), progress_id: str = Form(""),
+                                       _admission=Depends(admission("organize_preview"))):
+    from compress.pdf_organizer import get_pdf_organization_preview
+    if progress_id and not valid_progress_id(progress_id):
+        return JSONResponse(status_code=400, content={"error": "Invalid progress_id. Use 8-64 letters, digits, '-' or '_'"})
+    upload = await resolve_upload(file, blob_id, blob_session)
     try:
-        if not file.filename.lower().endswith('.pdf'):
+        if not upload.filename.lower().endswith('.pdf'):
             return JSONResponse(status_code=400, content={"error": "Please upload a PDF file"})
-        result = await get_pdf_organization_preview(file)
+        result = await run_in_lane("interactive", get_pdf_organization_preview, upload, include_text=include_text,
+                                   progress_id=progress_id or None)
         return JSONResponse(content=result)
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/organize/pdf/pages")
 async def organize_pdf_by_pages(
-    file: UploadFile = File(..., description="PDF file to organize"),
+    file: Optional[UploadFile] = File(default=None, description="PDF file to organize"),
+    blob_id: str = Form(default="", description="SHA-256 of a held upload, instead of the file"),
+    blob_session: str = Form(default="", description="Blob session from /blobs/check; uploads sent with it are kept"),
     page_order: str = Form(..., description="JSON string of page order"),
-    deleted_pages: str = Form(default="[]", description="JSON string of deleted pages")
+    deleted_pages: str = Form(default="[]", description="JSON string of deleted pages"),
+    inline: bool = Form(False),
+    _admission=Depends(admission("organize_pdf"))
 ):
+    from compress.pdf_organizer import organize_pdf_pages
+    upload = await resolve_upload(file, blob_id, blob_session)
     try:
-        if not file.filename.lower().endswith('.pdf'):
+        if not upload.filename.lower().endswith('.pdf'):
             return JSONResponse(status_code=400, content={"error": "Please upload a PDF file"})
-        result = await organize_pdf_pages(file, page_order, deleted_pages)
+        result = await run_in_lane("interactive", organize_pdf_pages, upload, page_order, deleted_pages, inline=inline)
+        if inline:
+            return inline_response(
+                result["data"], "chhotipdf-organized.pdf", "application/pdf", result["originalSize"],
+                page_count=result["remainingPages"]
+            )
         return result
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": f"Organization failed: {str(e)}"})
 
+# PDF text search (pages to split or organize)
+@app.post("/search/pdf")
+async def search_pdf_endpoint(
+    query: str = Form(...),
+    document_id: str = Form(default="", description="document_id returned by a preview"),
+    file: Optional[UploadFile] = File(default=None),
+    blob_id: str = Form(default="", description="SHA-256 of a held upload, instead of the file"),
+    blob_session: str = Form(default="", description="Blob session from /blobs/check; uploads sent with it are kept"),
+    _admission=Depends(admission("search_pdf"))
+):
+    from compress.text_index import search_pdf_text
+    upload = await resolve_upload(file, blob_id, blob_session, required=False)
+    if upload is not None and not upload.filename.lower().endswith('.pdf'):
+        return JSONResponse(status_code=400, content={"error": "Please upload a PDF file"})
+    try:
+        # A blob's id is also its text-index document id (both are the SHA-256 of the bytes)
+        return await run_in_lane("interactive", search_pdf_text, query, uploaded_file=upload,
+                                 doc_id=document_id or blob_id.strip().lower() or None)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except LookupError as e:
+        return JSONResponse(status_code=404, content={"error": str(e)})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": f"Search failed: {str(e)}"})
+
 @app.get("/download/organized/{filename}")
-async def download_organized_pdf(filename: str):
-    file_path = os.path.join(BASE_DIR, "app", "organized_pdfs", filename)
-    if os.path.exists(file_path):
-        return FileResponse(
-            path=file_path,
-            filename=f"organized_{filename}",
-            media_type='application/pdf',
-            headers={"Content-Disposition": f"attachment; filename=organized_{filename}"}
-        )
-    return JSONResponse(status_code=404, content={"error": "File not found"})
+def download_organized_pdf(filename: str):
+    return download_response(ORGANIZED_PDFS, filename, 'application/pdf', download_name=f"organized_{filename}")
+
+# Chained operations over one in-memory document
+@app.post("/pipeline/pdf")
+async def pipeline_pdf_endpoint(
+    files: List[UploadFile] = File(default=[], description="First file is the working document; merge steps refer to the others by index"),
+    blob_ids: str = Form("", description="Inputs in order: SHA-256s of held uploads, 'file' for the next uploaded file"),
+    blob_session: str = Form("", description="Blob session from /blobs/check; uploads sent with it are kept"),
+    steps: str = Form(..., description='JSON list, e.g. [{"op": "organize", "page_order": "3,1-2"}, {"op": "merge"}, {"op": "compress", "level": "medium"}]'),
+    inline: bool = Form(False),
+    progress_id: str = Form(""),
+    _admission=Depends(admission("pipeline_pdf"))
+):
+    from compress.pdf_pipeline import run_pdf_pipeline, validate_pipeline_steps
+    files = await resolve_uploads(files, blob_ids, blob_session)
+    if not files:
+        return JSONResponse(status_code=400, content={"error": "Send at least one PDF file (or blob_ids)"})
+    if progress_id and not valid_progress_id(progress_id):
+        return JSONResponse(status_code=400, content={"error": "Invalid progress_id. Use 8-64 letters, digits, '-' or '_'"})
+    for file in files:
+        if not file.filename.lower().endswith('.pdf'):
+            return JSONResponse(status_code=400, content={"error": f"File '{file.filename}' is not a PDF"})
+    try:
+        parsed_steps = json.loads(steps)
+        validate_pipeline_steps(parsed_steps, len(files))
+    except (json.JSONDecodeError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"error": f"Invalid pipeline steps: {str(e)}"})
+    try:
+        result = await run_in_lane("bulk", run_pdf_pipeline, files, parsed_steps, inline=inline,
+                                   progress_id=progress_id or None)
+        if inline:
+            return inline_response(
+                result["data"], "chhotipdf-pipeline.pdf", "application/pdf", result["originalSize"],
+                used_original=result["usedOriginal"], page_count=result["pageCount"],
+                total_ms=result["totalMs"]
+            )
+        return result
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": f"Invalid pipeline steps: {str(e)}"})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.get("/download/pipeline/{filename}")
+def download_pipeline_pdf(filename: str):
+    return download_response(PIPELINE_PDFS, filename, 'application/pdf')
 
 # CORS Middleware
 # Restrict CORS to known frontend origins (Vercel deployment and localhost for development)
@@ -224,19 +705,29 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=INLINE_HEADERS + ["X-Dedup-Saved-Bytes", "X-Total-Ms", "X-Profile-Id", "Content-Disposition"],
 )
 
 # Also expose the same endpoints under /api/* for reverse proxies
 app.add_api_route("/api/", root, methods=["GET"])
 app.add_api_route("/api/compress/pdf", compress_pdf_endpoint, methods=["POST"])
 app.add_api_route("/api/compress/image", compress_image_endpoint, methods=["POST"])
+app.add_api_route("/api/compress/image/variants", compress_image_variants_endpoint, methods=["POST"])
 app.add_api_route("/api/merge/pdf", merge_pdf_endpoint, methods=["POST"])
 app.add_api_route("/api/split/pdf/preview", preview_pdf_pages, methods=["POST"])
 app.add_api_route("/api/split/pdf/pages", split_pdf_by_pages, methods=["POST"])
+app.add_api_route("/api/split/pdf/multi", split_pdf_multi_endpoint, methods=["POST"])
 app.add_api_route("/api/organize/pdf/preview", preview_pdf_for_organization, methods=["POST"])
 app.add_api_route("/api/organize/pdf/pages", organize_pdf_by_pages, methods=["POST"])
+app.add_api_route("/api/search/pdf", search_pdf_endpoint, methods=["POST"])
+app.add_api_route("/api/pipeline/pdf", pipeline_pdf_endpoint, methods=["POST"])
 app.add_api_route("/api/download/pdf/{filename}", download_pdf, methods=["GET"])
+app.add_api_route("/api/admission", admission_state, methods=["GET"])
+app.add_api_route("/api/blobs/check", check_blobs, methods=["POST"])
+app.add_api_route("/api/ready", ready, methods=["GET"])
+app.add_api_route("/api/progress/{progress_id}", progress_stream, methods=["GET"])
 app.add_api_route("/api/download/image/{filename}", download_image, methods=["GET"])
 app.add_api_route("/api/download/merged/{filename}", download_merged_pdf, methods=["GET"])
 app.add_api_route("/api/download/split/{filename}", download_split_pdf, methods=["GET"])
-app.add_api_route("/api/download/organized/{filename}", download_organized_pdf, methods=["GET"])
\ No newline at end of file
+app.add_api_route("/api/download/organized/{filename}", download_organized_pdf, methods=["GET"])
+app.add_api_route("/api/download/pipeline/{filename}", download_pipeline_pdf, methods=["GET"])
\ No newline at end of file
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import fitz
+import pytest
+
+# Tests import the backend modules the way main.py does (run from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compress import storage  # noqa: E402
+
+
+def make_pdf(pages, toc=None):
+    """Bytes of a PDF with one line of text per page, and an optional outline ([level, title, page])"""
+    doc = fitz.open()
+    for index in range(pages):
+        doc.new_page().insert_text((72, 72), f"Page {index + 1}")
+    if toc:
+        doc.set_toc(toc)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    """A LocalStorage under tmp_path, installed as the process-wide backend"""
+    backend = storage.LocalStorage(str(tmp_path))
+    monkeypatch.setattr(storage, "_storage", backend)
+    return backend
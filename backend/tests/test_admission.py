@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from compress import admission
+from compress.admission import AdmissionController, AdmissionRejected, admit, estimate_cost
+
+MB = 1024 * 1024
+
+
+def test_cost_grows_with_upload_and_level():
+    light, cpu = estimate_cost("compress_pdf", 10 * MB, "light")
+    heavy, _ = estimate_cost("compress_pdf", 10 * MB, "heavy")
+    assert cpu == 1 and light < heavy
+    assert estimate_cost("split_preview", 10 * MB)[1] == 0
+
+
+def test_image_cost_is_capped():
+    memory, _ = estimate_cost("compress_image", 500 * MB)
+    assert memory < 500 * MB * 20
+
+
+@pytest.mark.parametrize("operation", ["split_pdf_multi", "compress_image_variants"])
+def test_parallel_operations_hold_a_slot_per_worker(operation, monkeypatch):
+    monkeypatch.setattr(admission, "CPU_SLOTS", 8)
+    monkeypatch.setitem(admission.PARALLEL_WORKERS, operation, 3)
+    assert admission.parallel_workers(operation) == 3
+    assert estimate_cost(operation, 10 * MB)[1] == 3
+    monkeypatch.setattr(admission, "CPU_SLOTS", 2)
+    assert estimate_cost(operation, 10 * MB)[1] == 2
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    async def scenario():
+        controller = AdmissionController(memory_budget_bytes=100, cpu_slots=8, queue_timeout=5)
+        await controller.acquire("compress_pdf", 100, 1)
+        admitted = []
+
+        async def wait(name, memory):
+            await controller.acquire("compress_pdf", memory, 1)
+            admitted.append(name)
+
+        # The large request arrived first; the small one mustn't overtake it
+        large = asyncio.create_task(wait("large", 80))
+        await asyncio.sleep(0)
+        small = asyncio.create_task(wait("small", 10))
+        await asyncio.sleep(0)
+        assert controller.state()["queued"] == 2
+        controller.release(100, 1, 0.1)
+        await asyncio.gather(large, small)
+        assert admitted == ["large", "small"]
+
+    asyncio.run(scenario())
+
+
+def test_interactive_work_is_not_queued_behind_bulk():
+    async def scenario():
+        controller = AdmissionController(memory_budget_bytes=100, cpu_slots=1, queue_timeout=5)
+        await controller.acquire("compress_pdf", 50, 1)
+        bulk = asyncio.create_task(controller.acquire("merge_pdf", 10, 1))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(controller.acquire("split_preview", 10, 0), 1)
+        assert not bulk.done()
+        controller.release(50, 1, 0.1)
+        await bulk
+
+    asyncio.run(scenario())
+
+
+def test_rejects_after_the_queue_timeout():
+    async def scenario():
+        controller = AdmissionController(memory_budget_bytes=100, cpu_slots=1, queue_timeout=0.05)
+        await controller.acquire("compress_pdf", 10, 1)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("compress_pdf", 10, 1)
+        assert rejected.value.retry_after >= 1
+        assert controller.state()["queued"] == 0 and controller.rejected == 1
+
+    asyncio.run(scenario())
+
+
+def test_oversized_request_runs_alone():
+    async def scenario():
+        controller = AdmissionController(memory_budget_bytes=100, cpu_slots=4, queue_timeout=1)
+        async with admit("merge_pdf", 10 * MB, controller=controller):
+            assert controller.active == 1
+        assert controller.state()["memoryInUseBytes"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_busy_server_answers_503_with_retry_after(monkeypatch):
+    import main
+
+    controller = AdmissionController(memory_budget_bytes=1, cpu_slots=1, queue_timeout=0.05)
+    controller.active, controller.cpu_in_use = 1, 1  # something else holds the only slot
+    monkeypatch.setattr(admission, "admission_controller", controller)
+    response = TestClient(main.app).post("/compress/pdf", files={"file": ("a.pdf", b"%PDF-1.4", "application/pdf")})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
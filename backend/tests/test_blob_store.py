@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import json
+
+import pytest
+
+from compress import blob_store as blobs
+from compress.admission import AdmissionController
+from compress.blob_store import BlobNotFound, BlobStore, InvalidBlobReference
+from compress.lanes import BufferedUpload
+
+SESSION = "session-aaaaaaaaaaaaaaaaaaaaaa"
+OTHER_SESSION = "session-bbbbbbbbbbbbbbbbbbbbbb"
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = BlobStore(max_bytes=1000, ttl_seconds=60)
+    monkeypatch.setattr(blobs, "blob_store", store)
+    return store
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def resolve(upload=None, blob_id=None, session=None, **options):
+    return asyncio.run(blobs.resolve_upload(upload, blob_id, session, **options))
+
+
+def test_uploads_are_kept_only_with_a_session(store):
+    resolve(BufferedUpload("a.pdf", b"first"))
+    assert store.state()["blobs"] == 0
+    resolve(BufferedUpload("a.pdf", b"first"), session=SESSION)
+    assert store.contains(SESSION, sha256(b"first"), 5)
+
+
+def test_sessions_only_see_their_own_uploads(store):
+    resolve(BufferedUpload("a.pdf", b"private"), session=SESSION)
+    blob_id = sha256(b"private")
+    assert not store.contains(OTHER_SESSION, blob_id, 7)
+    with pytest.raises(BlobNotFound):
+        resolve(blob_id=blob_id, session=OTHER_SESSION)
+    held = resolve(blob_id=blob_id.upper(), session=SESSION)
+    assert (held.filename, held.data) == ("a.pdf", b"private")
+
+
+def test_blob_references_need_a_valid_session_and_id(store):
+    with pytest.raises(InvalidBlobReference):
+        resolve(blob_id=sha256(b"x"))
+    with pytest.raises(InvalidBlobReference):
+        resolve(blob_id=sha256(b"x"), session="short")
+    with pytest.raises(InvalidBlobReference):
+        resolve(blob_id="not-a-hash", session=SESSION)
+    with pytest.raises(InvalidBlobReference):
+        resolve(session=SESSION)
+    assert resolve(session=SESSION, required=False) is None
+
+
+def test_check_requires_the_exact_size(store):
+    store.put(SESSION, sha256(b"abc"), "a.pdf", b"abc")
+    assert store.contains(SESSION, sha256(b"abc"), 3)
+    assert not store.contains(SESSION, sha256(b"abc"), 4)
+
+
+def test_multi_file_inputs_keep_their_order(store):
+    store.put(SESSION, sha256(b"held"), "held.pdf", b"held")
+    blob_ids = f"file,{sha256(b'held')},file"
+    inputs = asyncio.run(blobs.resolve_uploads(
+        [BufferedUpload("one.pdf", b"one"), BufferedUpload("two.pdf", b"two")], blob_ids, SESSION))
+    assert [upload.filename for upload in inputs] == ["one.pdf", "held.pdf", "two.pdf"]
+    # Files sent in the hash-first flow are kept for next time
+    assert store.contains(SESSION, sha256(b"two"), 3)
+    with pytest.raises(InvalidBlobReference):
+        asyncio.run(blobs.resolve_uploads([BufferedUpload("one.pdf", b"one")], blob_ids, SESSION))
+
+
+def test_referenced_bytes_count_only_the_sessions_blobs(store):
+    store.put(SESSION, sha256(b"held"), "held.pdf", b"held")
+    assert blobs.referenced_bytes(SESSION, sha256(b"held")) == 4
+    assert blobs.referenced_bytes(SESSION, None, f"file,{sha256(b'held')}") == 4
+    assert blobs.referenced_bytes(OTHER_SESSION, sha256(b"held")) == 0
+    assert blobs.referenced_bytes(None, sha256(b"held")) == 0
+
+
+def test_store_evicts_least_recently_used_and_expired(store, monkeypatch):
+    store.put(SESSION, "a" * 64, "a", b"x" * 400)
+    store.put(SESSION, "b" * 64, "b", b"x" * 400)
+    store.get(SESSION, "a" * 64)
+    store.put(SESSION, "c" * 64, "c", b"x" * 400)
+    assert store.size(SESSION, "b" * 64) is None
+    assert store.total_bytes == 800
+    now = blobs.time.time()
+    monkeypatch.setattr(blobs.time, "time", lambda: now + 61)
+    assert store.get(SESSION, "a" * 64) is None
+    assert store.total_bytes == 0
+
+
+def test_held_bytes_count_against_admission_and_give_way():
+    async def scenario():
+        controller = AdmissionController(memory_budget_bytes=1000, cpu_slots=4, queue_timeout=0.1)
+        store = BlobStore(max_bytes=1000, ttl_seconds=60)
+        controller.hold_for(store)
+        store.put(SESSION, "a" * 64, "a", b"x" * 300)
+        store.put(SESSION, "b" * 64, "b", b"x" * 300)
+        await controller.acquire("compress_pdf", 300, 1)
+        assert controller.state()["memoryHeldBytes"] == 600
+        # Fits only once the oldest kept upload is evicted
+        await controller.acquire("compress_pdf", 300, 1)
+        assert store.size(SESSION, "a" * 64) is None
+        assert store.size(SESSION, "b" * 64) == 300
+        # Doesn't fit even without kept uploads: they stay, the request is rejected
+        with pytest.raises(Exception):
+            await controller.acquire("compress_pdf", 500, 1)
+        assert store.size(SESSION, "b" * 64) == 300
+
+    asyncio.run(scenario())
+
+
+def test_check_endpoint_issues_a_session(store, monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    monkeypatch.setattr(main, "blob_store", store)
+    client = TestClient(main.app)
+    entry = [{"sha256": sha256(b"doc"), "size": 3}]
+    first = client.post("/blobs/check", data={"blobs": json.dumps(entry)}).json()
+    session = first["blobSession"]
+    assert blobs.valid_blob_session(session)
+    assert first["blobs"][0]["exists"] is False
+    store.put(session, sha256(b"doc"), "doc.pdf", b"doc")
+    again = client.post("/api/blobs/check", data={"blobs": json.dumps(entry), "blob_session": session}).json()
+    assert (again["blobSession"], again["blobs"][0]["exists"]) == (session, True)
+    # A fresh session doesn't learn that the file was uploaded
+    other = client.post("/blobs/check", data={"blobs": json.dumps(entry)}).json()
+    assert other["blobs"][0]["exists"] is False
+    assert client.post("/blobs/check", data={"blobs": json.dumps(entry), "blob_session": "bad"}).status_code == 400
@@ -0,0 +1,37 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from compress import image_budget
+from compress.image_budget import ImageTooLarge, open_image
+
+PILLOW_DEFAULT_MAX_PIXELS = Image.MAX_IMAGE_PIXELS
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 120, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_pillow_limit_is_left_alone():
+    assert Image.MAX_IMAGE_PIXELS == PILLOW_DEFAULT_MAX_PIXELS
+    assert image_budget.MAX_IMAGE_PIXELS <= 2 * Image.MAX_IMAGE_PIXELS
+
+
+def test_size_checked_before_decoding(monkeypatch):
+    monkeypatch.setattr(image_budget, "MAX_IMAGE_PIXELS", 100 * 100)
+    assert open_image(png(100, 100)).size == (100, 100)
+    with pytest.raises(ImageTooLarge):
+        open_image(png(101, 100))
+
+
+def test_oversized_image_is_rejected_with_400(local_storage, monkeypatch):
+    import main
+
+    monkeypatch.setattr(image_budget, "MAX_IMAGE_PIXELS", 1000)
+    response = TestClient(main.app).post("/compress/image", files={"file": ("big.png", png(100, 100), "image/png")})
+    assert response.status_code == 400
+    assert "limit" in response.json()["error"]
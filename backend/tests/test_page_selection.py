@@ -0,0 +1,69 @@
+import fitz
+import pytest
+
+from compress.page_selection import page_runs, parse_page_spec, select_pages, validate_page_spec
+from fastapi.testclient import TestClient
+
+from tests.conftest import make_pdf
+
+
+@pytest.mark.parametrize("spec, page_count, expected", [
+    ("3", None, [3]),
+    ("1-3,7", None, [1, 2, 3, 7]),
+    (" 2 - 4 , 6 ", None, [2, 3, 4, 6]),
+    ("8-", 10, [8, 9, 10]),
+    ("-3", 10, [1, 2, 3]),
+    ("5-3", 10, [5, 4, 3]),
+    ("2,1,2", 10, [2, 1, 2]),
+    ("5-999", 10, [5, 6, 7, 8, 9, 10]),
+    ("15-8", 10, [10, 9, 8]),
+    ("0,3,11,20-30", 10, [3]),
+])
+def test_parse_page_spec(spec, page_count, expected):
+    assert parse_page_spec(spec, page_count) == expected
+
+
+@pytest.mark.parametrize("spec", ["", " , ", "a", "1-2-3", "-", "3 4", "1;2"])
+def test_invalid_specs_are_rejected(spec):
+    with pytest.raises(ValueError):
+        validate_page_spec(spec)
+
+
+def test_huge_ranges_are_clamped_to_the_document():
+    assert parse_page_spec("1-999999999", 3) == [1, 2, 3]
+
+
+def test_open_ended_range_needs_the_page_count():
+    with pytest.raises(ValueError):
+        parse_page_spec("5-")
+
+
+def test_page_runs_group_consecutive_pages():
+    assert page_runs([0, 1, 2, 5, 4, 6]) == [(0, 2), (5, 5), (4, 4), (6, 6)]
+
+
+def test_select_pages_keeps_the_requested_order():
+    with fitz.open(stream=select_pages(make_pdf(5), [4, 0, 2, 99]), filetype="pdf") as doc:
+        assert [page.get_text().strip() for page in doc] == ["Page 5", "Page 1", "Page 3"]
+
+
+@pytest.mark.parametrize("selected, pages", [("-3", [1, 2, 3]), ("5-999", [5, 6, 7, 8, 9, 10]), ("2, 4", [2, 4])])
+def test_split_endpoint_reports_the_pages_it_kept(local_storage, selected, pages):
+    import main
+
+    response = TestClient(main.app).post("/split/pdf/pages", files={"file": ("a.pdf", make_pdf(10), "application/pdf")},
+                                         data={"selected_pages": selected, "inline": "true"})
+    assert response.status_code == 200
+    assert int(response.headers["X-Page-Count"]) == len(pages)
+    with fitz.open(stream=response.content, filetype="pdf") as doc:
+        assert [page.get_text().strip() for page in doc] == [f"Page {page}" for page in pages]
+
+
+@pytest.mark.parametrize("selected", [" , ", "20-30", "0", "a-b"])
+def test_split_endpoint_rejects_selections_outside_the_document(local_storage, selected):
+    import main
+
+    response = TestClient(main.app).post("/split/pdf/pages", files={"file": ("a.pdf", make_pdf(10), "application/pdf")},
+                                         data={"selected_pages": selected})
+    assert response.status_code == 400
+    assert response.json()["error"]
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from compress.pdf_pipeline import validate_pipeline_steps
+from tests.conftest import make_pdf
+
+
+@pytest.mark.parametrize("step", [
+    {"op": "split", "pages": "1-3,5"},
+    {"op": "split", "pages": [3, 1]},
+    {"op": "organize", "page_order": "3,1-2", "deleted_pages": "2"},
+    {"op": "organize", "page_order": [{"original_index": 2, "id": "page_3"}, 1], "deleted_pages": ["page_3", 4]},
+])
+def test_valid_page_steps(step):
+    validate_pipeline_steps([step], 1)
+
+
+@pytest.mark.parametrize("step", [
+    {"op": "split", "pages": ["a"]},
+    {"op": "split", "pages": 5},
+    {"op": "split", "pages": [1.5]},
+    {"op": "split", "pages": [True]},
+    {"op": "split", "pages": "a-b"},
+    {"op": "organize", "page_order": {"1": 2}},
+    {"op": "organize", "page_order": [{"id": "page_1"}]},
+    {"op": "organize", "page_order": [{"original_index": "0"}]},
+    {"op": "organize", "page_order": [1], "deleted_pages": 5},
+    {"op": "organize", "page_order": [1], "deleted_pages": [None]},
+])
+def test_invalid_page_steps(step):
+    with pytest.raises(ValueError, match="Step 1"):
+        validate_pipeline_steps([step], 1)
+
+
+def post_pipeline(steps, pages=3):
+    import main
+
+    return TestClient(main.app).post("/pipeline/pdf", files=[("files", ("a.pdf", make_pdf(pages), "application/pdf"))],
+                                     data={"steps": json.dumps(steps)})
+
+
+@pytest.mark.parametrize("pages", [["a"], 5, "20-30", [20]])
+def test_pipeline_endpoint_rejects_bad_pages(local_storage, pages):
+    response = post_pipeline([{"op": "split", "pages": pages}])
+    assert response.status_code == 400
+    assert response.json()["error"].startswith("Invalid pipeline steps: Step 1")
+
+
+def test_pipeline_endpoint_runs_page_steps(local_storage):
+    response = post_pipeline([{"op": "organize", "page_order": "3,1-2"}, {"op": "split", "pages": [1, 3]}])
+    assert response.status_code == 200
+    assert response.json()["pageCount"] == 2
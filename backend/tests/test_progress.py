@@ -0,0 +1,36 @@
+import pytest
+
+from compress import progress
+
+
+def test_done_event_carries_the_last_progress(monkeypatch):
+    monkeypatch.setattr(progress, "PROGRESS_INTERVAL", 0)
+    with progress.reporting("test-progress-1", "compress_pdf"):
+        for page in range(1, 6):
+            progress.report("images", page, 5, images_done=page)
+    event = progress.hub._channels["test-progress-1"]["event"]
+    assert event["status"] == "done"
+    assert (event["pagesDone"], event["pagesTotal"], event["imagesDone"]) == (5, 5, 5)
+
+
+def test_failed_run_reports_the_error():
+    with pytest.raises(ValueError):
+        with progress.reporting("test-progress-2", "merge_pdfs"):
+            raise ValueError("bad input")
+    event = progress.hub._channels["test-progress-2"]["event"]
+    assert (event["status"], event["error"]) == ("failed", "bad input")
+
+
+def test_worker_events_queue_the_final_event_after_progress(monkeypatch):
+    sent = []
+
+    class Queue:
+        def put(self, item):
+            sent.append(item)
+
+    monkeypatch.setattr(progress, "_worker_queue", Queue())
+    with progress.reporting("test-progress-3", "compress_pdf"):
+        progress.report("images", 1, 2)
+        progress.report("images", 2, 2)
+    assert [final for _, _, final in sent] == [False, False, True]
+    assert sent[-1][1] == {"operation": "compress_pdf", "error": None}
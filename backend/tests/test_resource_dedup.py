@@ -0,0 +1,87 @@
+import io
+
+import fitz
+from PIL import Image
+
+from compress.pdf_merger import merge_documents
+from compress.resource_dedup import _remap_refs, dedupe_resources
+
+
+def logo_png():
+    """An RGBA image, which PyMuPDF stores as an image plus an SMask"""
+    image = Image.new("RGBA", (64, 64), (200, 30, 30, 128))
+    for x in range(64):
+        image.putpixel((x, x), (0, 0, 255, 255))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def letterhead_pdf(text):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(fitz.Rect(50, 50, 250, 250), stream=logo_png())
+    page.insert_text((72, 300), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def merged(count):
+    doc = fitz.open()
+    sources = [fitz.open(stream=letterhead_pdf(f"Letter {n}"), filetype="pdf") for n in range(count)]
+    return doc, sources
+
+
+def render(doc):
+    return [page.get_pixmap(matrix=fitz.Matrix(0.5, 0.5)).samples for page in doc]
+
+
+def image_xrefs(doc):
+    return {image[0] for page in doc for image in page.get_images(full=True)}
+
+
+def test_shared_image_with_smask_is_stored_once():
+    plain, plain_sources = merged(3)
+    for source in plain_sources:
+        plain.insert_pdf(source)
+    expected = render(fitz.open(stream=plain.tobytes(garbage=3, deflate=True), filetype="pdf"))
+
+    doc, sources = merged(3)
+    stats = merge_documents(doc, sources)
+    before = len(plain.tobytes(garbage=3, deflate=True))
+    output = doc.tobytes(garbage=3, deflate=True)
+
+    # The image and its soft mask are each duplicated twice
+    assert stats["duplicates"] == 4
+    assert stats["bytesSaved"] == before - len(output)
+    assert stats["bytesSaved"] > 0
+
+    result = fitz.open(stream=output, filetype="pdf")
+    assert len(image_xrefs(result)) == 1
+    smasks = {image[1] for page in result for image in page.get_images(full=True)}
+    assert len(smasks) == 1 and 0 not in smasks
+    assert render(result) == expected
+
+
+def test_no_duplicates_leaves_the_document_alone():
+    doc = fitz.open(stream=letterhead_pdf("Only"), filetype="pdf")
+    assert dedupe_resources(doc) == {"duplicates": 0, "bytesSaved": 0}
+
+
+def test_references_inside_strings_are_kept():
+    text = '<</A 5 0 R/T(see 5 0 R \\) and (5 0 R))/H<3520302052>/K[5 0 R 6 0 R]>>'
+    assert _remap_refs(text, {5: 2}) == '<</A 2 0 R/T(see 5 0 R \\) and (5 0 R))/H<3520302052>/K[2 0 R 6 0 R]>>'
+
+
+def test_string_values_in_the_document_are_kept():
+    doc, sources = merged(2)
+    for source in sources:
+        doc.insert_pdf(source)
+    duplicate = max(image_xrefs(doc))
+    catalog = doc.pdf_catalog()
+    doc.xref_set_key(catalog, "Note", f"(copy of {duplicate} 0 R)")
+
+    assert dedupe_resources(doc)["duplicates"] == 2
+    assert doc.xref_get_key(catalog, "Note") == ("string", f"copy of {duplicate} 0 R")
+    assert duplicate not in image_xrefs(doc)
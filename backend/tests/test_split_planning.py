@@ -0,0 +1,107 @@
+import asyncio
+import io
+import json
+import zipfile
+
+import fitz
+import pytest
+
+from compress import pdf_splitter
+from compress.lanes import BufferedUpload
+from compress.pdf_splitter import PDFSplitter, split_pdf_multi
+from tests.conftest import make_pdf
+
+
+def plan(pages, mode, toc=None, **options):
+    doc = fitz.open(stream=make_pdf(pages, toc), filetype="pdf")
+    try:
+        return PDFSplitter().plan_split_parts(doc, mode, **options)
+    finally:
+        doc.close()
+
+
+def covered(parts):
+    return sorted(page for _, pages in parts for page in pages)
+
+
+def test_ranges_one_part_per_spec():
+    parts = plan(10, "ranges", ranges="1-3; 5,7\n9-")
+    assert parts == [("1-3", [0, 1, 2]), ("5,7", [4, 6]), ("9-", [8, 9])]
+
+
+def test_ranges_require_a_spec():
+    with pytest.raises(Exception):
+        plan(3, "ranges", ranges=" ; ")
+
+
+def test_every_chunks_the_document():
+    assert plan(7, "every", chunk_size=3) == [("1-3", [0, 1, 2]), ("4-6", [3, 4, 5]), ("7-7", [6])]
+
+
+def test_bookmarks_with_front_matter():
+    parts = plan(6, "bookmarks", toc=[[1, "One", 3], [1, "Two", 5]])
+    assert parts == [("Front matter", [0, 1]), ("One", [2, 3]), ("Two", [4, 5])]
+
+
+def test_bookmarks_cover_pages_of_shallower_entries():
+    toc = [[1, "Ch1", 1], [2, "S1.1", 2], [2, "S1.2", 3], [1, "Ch2", 4], [2, "S2.1", 5]]
+    parts = plan(6, "bookmarks", toc=toc, bookmark_level=2)
+    assert parts == [("Ch1", [0]), ("S1.1", [1]), ("S1.2", [2]), ("Ch2", [3]), ("S2.1", [4, 5])]
+    assert covered(parts) == list(range(6))
+
+
+def test_bookmarks_skip_chapters_that_start_on_their_first_section():
+    toc = [[1, "Ch1", 1], [2, "S1.1", 1], [2, "S1.2", 3], [1, "Ch2", 4], [2, "S2.1", 4]]
+    parts = plan(5, "bookmarks", toc=toc, bookmark_level=2)
+    assert [title for title, _ in parts] == ["S1.1", "S1.2", "S2.1"]
+    assert covered(parts) == list(range(5))
+
+
+def test_bookmarks_need_the_requested_level():
+    with pytest.raises(Exception):
+        plan(3, "bookmarks", toc=[[1, "Only", 1]], bookmark_level=2)
+
+
+def test_multi_split_zip_covers_every_page(local_storage):
+    toc = [[1, "Ch1", 1], [2, "S1.1", 2], [1, "Ch2", 3], [2, "S2.1", 4]]
+    upload = BufferedUpload("book.pdf", make_pdf(5, toc))
+    result = asyncio.run(split_pdf_multi(upload, "bookmarks", bookmark_level=2, inline=True))
+    with zipfile.ZipFile(io.BytesIO(result["data"])) as zf:
+        manifest = json.loads(zf.read("manifest.json"))
+        assert sorted(page for entry in manifest["files"] for page in entry["pages"]) == [1, 2, 3, 4, 5]
+        for entry in manifest["files"]:
+            with fitz.open(stream=zf.read(entry["file"]), filetype="pdf") as part:
+                assert part.page_count == entry["pageCount"]
+
+
+def test_size_mode_halves_parts_over_the_limit(local_storage):
+    result = asyncio.run(split_pdf_multi(BufferedUpload("a.pdf", make_pdf(8)), "size", max_size_kb=1.5, inline=True))
+    assert result["fileCount"] > 1
+    assert sorted(page for entry in result["files"] for page in entry["pages"]) == list(range(1, 9))
+
+
+def test_parallel_multi_split_keeps_plan_order(local_storage, monkeypatch):
+    pools = []
+
+    class RecordingPool(pdf_splitter.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(kwargs["max_workers"])
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(pdf_splitter, "ProcessPoolExecutor", RecordingPool)
+    upload = BufferedUpload("long report.pdf", make_pdf(9))
+    result = asyncio.run(split_pdf_multi(upload, "every", chunk_size=2, max_workers=3, inline=True))
+    assert pools == [3]
+
+    expected = [("1-2", [1, 2]), ("3-4", [3, 4]), ("5-6", [5, 6]), ("7-8", [7, 8]), ("9-9", [9])]
+    with zipfile.ZipFile(io.BytesIO(result["data"])) as zf:
+        manifest = json.loads(zf.read("manifest.json"))
+        assert manifest["totalPages"] == 9
+        assert [(entry["title"], entry["pages"]) for entry in manifest["files"]] == expected
+        assert [entry["file"] for entry in manifest["files"]] == [
+            f"long_report_{n:03d}_{title}.pdf" for n, (title, _) in enumerate(expected, start=1)
+        ]
+        assert zf.namelist() == [entry["file"] for entry in manifest["files"]] + ["manifest.json"]
+        for entry in manifest["files"]:
+            with fitz.open(stream=zf.read(entry["file"]), filetype="pdf") as part:
+                assert [page.get_text().strip() for page in part] == [f"Page {n}" for n in entry["pages"]]
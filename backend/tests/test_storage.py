@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from compress import storage
+from compress.lanes import BufferedUpload
+from compress.storage import MERGED_PDFS, SPLIT_PDFS
+from tests.conftest import make_pdf
+
+
+def _roundtrip(backend):
+    with backend.open_write(SPLIT_PDFS, "out.pdf") as f:
+        f.write(b"%PDF-" + b"x" * 100)
+    assert backend.size(SPLIT_PDFS, "out.pdf") == 105
+    assert backend.exists(SPLIT_PDFS, "out.pdf")
+    assert b"".join(backend.open_read(SPLIT_PDFS, "out.pdf", chunk_size=16)) == b"%PDF-" + b"x" * 100
+    backend.delete(SPLIT_PDFS, "out.pdf")
+    assert backend.size(SPLIT_PDFS, "out.pdf") is None
+
+
+def test_local_storage_roundtrip(tmp_path):
+    _roundtrip(storage.LocalStorage(str(tmp_path)))
+
+
+def test_shared_storage_roundtrip(tmp_path):
+    _roundtrip(storage.SharedDirStorage(str(tmp_path)))
+
+
+def test_failed_write_is_not_published(tmp_path):
+    backend = storage.LocalStorage(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with backend.open_write(SPLIT_PDFS, "out.pdf") as f:
+            f.write(b"partial")
+            raise RuntimeError("operation failed")
+    assert backend.size(SPLIT_PDFS, "out.pdf") is None
+    assert list((tmp_path / SPLIT_PDFS).iterdir()) == []
+
+
+def test_rejects_unsafe_names(tmp_path):
+    backend = storage.LocalStorage(str(tmp_path))
+    for name in ("../escape.pdf", ".hidden", ""):
+        with pytest.raises(ValueError):
+            backend.write_bytes(SPLIT_PDFS, name, b"x")
+    with pytest.raises(ValueError):
+        backend.write_bytes("elsewhere", "out.pdf", b"x")
+
+
+def test_s3_storage_roundtrip_and_multipart(monkeypatch):
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        boto3.client("s3").create_bucket(Bucket="artifacts")
+        backend = storage.S3Storage("artifacts", prefix="chhotipdf")
+        _roundtrip(backend)
+        assert backend.location(SPLIT_PDFS, "a.pdf") == "s3://artifacts/chhotipdf/split_pdfs/a.pdf"
+
+        # Larger than one part: uploaded as a multipart upload
+        data = bytes(range(256)) * (backend.part_size // 256 + 1000)
+        backend.write_bytes(SPLIT_PDFS, "big.pdf", data)
+        assert backend.size(SPLIT_PDFS, "big.pdf") == len(data)
+        assert b"".join(backend.open_read(SPLIT_PDFS, "big.pdf")) == data
+        assert backend._expired(SPLIT_PDFS, 3600) == []
+
+
+def test_merge_reports_the_stored_size(local_storage):
+    from compress.pdf_merger import merge_pdfs
+
+    result = asyncio.run(merge_pdfs([BufferedUpload("a.pdf", make_pdf(2)), BufferedUpload("b.pdf", make_pdf(3))]))
+    stored = local_storage.size(MERGED_PDFS, result["filename"])
+    assert stored > 0
+    assert result["mergedSize"] == round(stored / 1024, 2)
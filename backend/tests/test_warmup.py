@@ -0,0 +1,33 @@
+import asyncio
+
+from compress import warmup
+from compress.metrics import FALLBACKS
+
+
+def run_warmup(monkeypatch, run_in_lane):
+    monkeypatch.setattr(warmup, "_state", dict(warmup._state, status="warming"))
+    monkeypatch.setattr(warmup, "run_in_lane", run_in_lane)
+    asyncio.run(warmup._warm())
+    return warmup.warmup_state()
+
+
+def test_ready_reports_steps_without_printing(monkeypatch, capsys):
+    async def run_in_lane(lane, fn):
+        return {"pymupdf": 1.0, "pillow": 2.0}
+
+    state = run_warmup(monkeypatch, run_in_lane)
+    assert state["status"] == "ready"
+    assert state["steps"] == {"pymupdf": 1.0, "pillow": 2.0}
+    assert capsys.readouterr().out == ""
+
+
+def test_failure_is_reported_and_counted(monkeypatch, capsys):
+    async def run_in_lane(lane, fn):
+        raise RuntimeError("no workers")
+
+    failures = FALLBACKS.labels("warmup", "failed")
+    before = failures._value.get()
+    state = run_warmup(monkeypatch, run_in_lane)
+    assert state["status"] == "failed" and state["error"] == "no workers"
+    assert failures._value.get() == before + 1
+    assert capsys.readouterr().out == ""